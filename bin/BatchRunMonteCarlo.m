@@ -1,4 +1,13 @@
-function [] = BatchRunMonteCarlo(SaveDir, SimNumber)
+%*******************************************************************************
+% BatchRunMonteCarlo
+%
+% Runs the sample size multipliers in separate processes. If NumShards is
+% passed, each one is also split into NumShards shards of replications (see
+% RunMonteCarlo), for NumShards times as many processes. Shards of
+% SimNumber = 2 can be run this way too. After every process has finished,
+% merge the shards with ./post/MergeMCShards.py <SaveDir>/results.
+%*******************************************************************************
+function [] = BatchRunMonteCarlo(SaveDir, SimNumber, NumShards)
 
     errstr = 'Need to pass nonempty SaveDir for this routine.';
     if ~exist('SaveDir', 'var')
@@ -8,30 +17,47 @@ function [] = BatchRunMonteCarlo(SaveDir, SimNumber)
             error(errstr);
         end
     end
-    errstr = 'Need to pass nonempty SimNumber (!= 2) for this routine.';
+    if ~exist('NumShards', 'var')
+        NumShards = 1;
+    end
+    errstr = ['Need to pass nonempty SimNumber (!= 2 unless NumShards > 1)'...
+              ' for this routine.'];
     if ~exist('SimNumber', 'var')
         error(errstr);
     else
         if isempty(SimNumber)
             error(errstr);
         end
-        if SimNumber == 2
+        if (SimNumber == 2) & (NumShards == 1)
             error(errstr);
         end
     end
 
 
     sbase = ['!matlab -nodesktop -nosplash -singleCompThread'...
-         ' -r "RunMonteCarlo(''%s'', %d, %d)" &'];
+         ' -r "RunMonteCarlo(''%s'', %d, %s%s)" &'];
 
     %###########################################################################
     % HARDCODING
     %###########################################################################
     NMULTIPLIERLIST = [.5 1 2];
+    if (SimNumber == 2)
+        NMULTIPLIERLIST = {[]}; % Only the default sample size
+    else
+        NMULTIPLIERLIST = num2cell(NMULTIPLIERLIST);
+    end
     for n = 1:1:length(NMULTIPLIERLIST)
-        s = sprintf(sbase, SaveDir, SimNumber, NMULTIPLIERLIST(n));
-        disp(s);
-        eval(s);
-        pause(10);
+        for k = 1:1:NumShards
+            if (NumShards > 1)
+                ShardArgs = sprintf(', %d, %d', k, NumShards);
+            else
+                ShardArgs = '';
+            end
+            s = sprintf(sbase, SaveDir, SimNumber,...
+                        mat2str(NMULTIPLIERLIST{n}), ShardArgs);
+            disp(s);
+            eval(s);
+            pause(10);
+        end
     end
 end
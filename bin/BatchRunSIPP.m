@@ -1,4 +1,12 @@
-function [] = BatchRunSIPP(SaveDir, SimSet)
+%*******************************************************************************
+% BatchRunSIPP
+%
+% Run every SimNum in SimSet, split between NumProcesses MATLAB processes
+% (default is one process per SimNum).
+% Each process runs a consecutive group of SimNums through one AMPL instance,
+% so fewer processes means fewer times the set definitions are created.
+%*******************************************************************************
+function [] = BatchRunSIPP(SaveDir, SimSet, NumProcesses)
 
     errstr = 'Need to pass nonempty SaveDir for this routine.';
     if ~exist('SaveDir', 'var')
@@ -10,7 +18,7 @@ function [] = BatchRunSIPP(SaveDir, SimSet)
     end
 
     sbase = ['!matlab -nodesktop -nosplash -singleCompThread'...
-         ' -r "RunSIPP(''%s'', ''%s'', %d, 1)" &'];
+         ' -r "RunSIPP(''%s'', ''%s'', %s, 1)" &'];
 
     if ~exist('SimSet')
         error('Must pass SimSet')
@@ -33,8 +41,15 @@ function [] = BatchRunSIPP(SaveDir, SimSet)
             error('Case not recognized.')
     end
 
-    for i = 1:1:NSIMS
-        s = sprintf(sbase, SaveDir, SimSet, i);
+    if ~exist('NumProcesses', 'var')
+        NumProcesses = NSIMS;
+    end
+    NumProcesses = min(NumProcesses, NSIMS);
+    GroupEnds = round(linspace(0, NSIMS, NumProcesses + 1));
+
+    for i = 1:1:NumProcesses
+        SimNums = (GroupEnds(i) + 1):1:GroupEnds(i + 1);
+        s = sprintf(sbase, SaveDir, SimSet, mat2str(SimNums));
         disp(s);
         eval(s);
         pause(10);
@@ -1,7 +1,13 @@
 %*******************************************************************************
 % RunMonteCarlo
+%
+% Pass Shard and NumShards to run only the Shard'th of NumShards roughly equal
+% ranges of replications. Its results are saved in a subdirectory shard<Shard>
+% of the usual results directory. Once every shard has finished,
+% ./post/MergeMCShards.py merges them into that directory.
+% NMultiplier can be empty to use the default when passing Shard.
 %*******************************************************************************
-function RunMonteCarlo(SaveDir, SimNumber, NMultiplier)
+function RunMonteCarlo(SaveDir, SimNumber, NMultiplier, Shard, NumShards)
 if ~exist('SaveDir', 'var')
     SaveDir = '';
 end
@@ -17,6 +23,8 @@ SCRIPTTAG = 'mc';
 %*******************************************************************************
 %*******************************************************************************
 Settings.DataPath = fullfile(pwd, '../data/sipp08.tsv');
+% Settings.CacheDir is left empty: every replication has new data, so the
+% results that would be cached on disk can never be reused.
 
 MCSettings.M = 500;
 
@@ -60,7 +68,7 @@ switch SimNumber
         error('SimNumber not recognized.');
 end
 
-if ~exist('NMultiplier')
+if ~exist('NMultiplier') | isempty(NMultiplier)
     MCSettings.NMultiplier = 1;
     DirName = fullfile(SaveDir, 'results');
 else
@@ -70,5 +78,16 @@ else
     mkdir(DirName);
 end
 
+if exist('Shard', 'var')
+    if ~exist('NumShards', 'var') | (Shard < 1) | (Shard > NumShards)
+        error('Shard must be between 1 and NumShards.')
+    end
+    Edges = round(linspace(0, MCSettings.M, NumShards + 1));
+    MCSettings.FirstM = Edges(Shard) + 1;
+    MCSettings.LastM = Edges(Shard + 1);
+    DirName = fullfile(DirName, sprintf('shard%03d', Shard));
+    mkdir(DirName);
+end
+
 cd(DirName);
 MonteCarlo(Settings, MCSettings);
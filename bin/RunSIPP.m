@@ -1,7 +1,28 @@
 %*******************************************************************************
 % RunSIPP
+%
+% SigmaST is optional and only used with the sigma and sigma-young sets.
+% If passed, it replaces the SigmaST grid value for SimNum, which is then only
+% used to name the results directory. This is how points proposed by
+% ./post/PlanSigmaGrid.py are run.
+%
+% SimNum can also be a vector, in which case each SimNum in SimSet is run in
+% turn (SigmaST cannot be passed then).
+% All of the DPO specifications that are run by one call (a vector of SimNum
+% or the whole cycle) share one AMPL instance, so that the set definitions are
+% only created once for each dataset.
+%
+% The results of every run are kept in cache/runs/<hash> in SaveDir, where the
+% hash is of the settings, data and code (see ComputeRunHash). A run that is
+% identical to one that has already finished (e.g. a specification that is in
+% both main and extra) is not recomputed; its results directory is filled with
+% a copy of the cached results instead. The hash includes this file.
+%
+% For the sigma and sigma-young sets, the confidence regions from the finished
+% run with the nearest SigmaST are used to predict the new ones, so that their
+% brackets start narrow (see LoadPriorCR).
 %*******************************************************************************
-function [] = RunSIPP(SaveDir, SimSet, SimNum, ExitOnEnd)
+function [] = RunSIPP(SaveDir, SimSet, SimNum, ExitOnEnd, SigmaST)
 
 if ~exist('SaveDir', 'var')
     SaveDir = '';
@@ -16,21 +37,35 @@ else
     FlagRunWholeCycle = 0;
 end
 
+if ~exist('SigmaST', 'var')
+    SigmaST = [];
+end
+
+Session = [];
 if ~FlagRunWholeCycle
-    [Settings] = LoadSpec(SimSet, SimNum);
-    ResultsSubdir = ...
-        fullfile(SimSet, sprintf('%03d', SimNum));
-    ExecuteThenRecord(Settings, SaveDir, ResultsSubdir);
+    if ~isempty(SigmaST) & (length(SimNum) > 1)
+        error('SigmaST can only be passed with a single SimNum.')
+    end
+    for s = 1:1:length(SimNum)
+        [Settings] = LoadSpec(SimSet, SimNum(s), SigmaST);
+        Settings.CacheDir = fullfile(SaveDir, 'cache');
+        Settings = LoadPriorCR(Settings, SaveDir, SimSet);
+        ResultsSubdir = ...
+            fullfile(SimSet, sprintf('%03d', SimNum(s)));
+        Session = ExecuteThenRecord(Settings, SaveDir, ResultsSubdir, Session);
+    end
 else
     ThisSimSet = 'main';
     ThisSimNum = 1;
 
     while ~isempty(ThisSimSet)
         [Settings NextSimSet NextSimNum] = LoadSpec(ThisSimSet, ThisSimNum);
+        Settings.CacheDir = fullfile(SaveDir, 'cache');
+        Settings = LoadPriorCR(Settings, SaveDir, ThisSimSet);
         ResultsSubdir = ...
             fullfile(ThisSimSet, sprintf('%03d', ThisSimNum));
 
-        ExecuteThenRecord(Settings, SaveDir, ResultsSubdir);
+        Session = ExecuteThenRecord(Settings, SaveDir, ResultsSubdir, Session);
 
         FlagBuildTable = isempty(NextSimSet);
         if FlagBuildTable
@@ -40,6 +75,9 @@ else
         ThisSimNum = NextSimNum;
     end
 end
+if ~isempty(Session)
+    Session.ampl.close();
+end
 
 if ~exist('ExitOnEnd', 'var')
     ExitOnEnd = 0;
@@ -59,7 +97,7 @@ end
 %*******************************************************************************
 %*******************************************************************************
 %*******************************************************************************
-function [Settings NextSimSet NextSimNum] = LoadSpec(SimSet, SimNum)
+function [Settings NextSimSet NextSimNum] = LoadSpec(SimSet, SimNum, SigmaST)
 
 %*******************************************************************************
 % General settings
@@ -79,6 +117,9 @@ Settings.ParametersToTest = Settings.Parameters;
 
 MaxDimST = Settings.T - 2;
 SIGMALIST = 0:.05:.4;
+if ~exist('SigmaST', 'var')
+    SigmaST = [];
+end
 
 FlagEnd = 0;
 switch SimSet
@@ -153,7 +194,9 @@ case 'sigma'
 
     Settings.Assumption_ST = 1;
     Settings.Assumption_DimST = MaxDimST;
-    if SimNum <= length(SIGMALIST)
+    if ~isempty(SigmaST)
+        Settings.Assumption_SigmaST = SigmaST;
+    elseif SimNum <= length(SIGMALIST)
         Settings.Assumption_SigmaST = SIGMALIST(SimNum);
     else
         error('SimNum not recognized.')
@@ -170,7 +213,9 @@ case 'sigma-young'
 
     Settings.Assumption_ST = 1;
     Settings.Assumption_DimST = MaxDimST;
-    if SimNum <= length(SIGMALIST)
+    if ~isempty(SigmaST)
+        Settings.Assumption_SigmaST = SigmaST;
+    elseif SimNum <= length(SIGMALIST)
         Settings.Assumption_SigmaST = SIGMALIST(SimNum);
     else
         error('SimNum not recognized.')
@@ -246,17 +291,40 @@ end
 %*******************************************************************************
 %*******************************************************************************
 %*******************************************************************************
-function ExecuteThenRecord( Settings,...
-                            SaveDir,...
-                            ResultsSubdir)
+function Session = ExecuteThenRecord(  Settings,...
+                                        SaveDir,...
+                                        ResultsSubdir,...
+                                        Session)
 %*******************************************************************************
 %*******************************************************************************
+    if Settings.PDBR
+        Program = 'PDBR';
+    else
+        Program = 'DPO';
+    end
+    % This file builds the settings and records the results, so it is part of
+    % the code that the results depend on
+    RunHash = ComputeRunHash(Program, rmfield(Settings, 'PDBR'),...
+        {[mfilename('fullpath') '.m']});
+    RunCacheDir = fullfile(Settings.CacheDir, 'runs', RunHash);
+
     OriginalPath = CreateResultsDir(SaveDir, ResultsSubdir);
+    if exist(RunCacheDir, 'dir')
+        disp(sprintf('Identical run found; copying results from %s.',...
+            RunCacheDir));
+        CopyCachedRun(RunCacheDir);
+        cd(OriginalPath);
+        return;
+    end
 
+    if ~Settings.PDBR
+        % Keep the bootstrap statistics so that the inference can be redone
+        Settings.SaveBootstrapDir = fullfile(pwd, 'Bootstrap');
+    end
     RecordStructure(Settings, 'SettingsBefore.out');
     if ~Settings.PDBR
         Settings = rmfield(Settings, 'PDBR');
-        [Results Settings] = DPO(Settings);
+        [Results Settings ~ Session] = DPO(Settings, [], Session);
     else
         Settings = rmfield(Settings, 'PDBR');
         fid = fopen('PDBR.out', 'w'); % helps w/ table script
@@ -291,9 +359,109 @@ function ExecuteThenRecord( Settings,...
         RecordStructure(Results.CFHN, 'CFHN.out');
     end
 
+    fid = fopen('RunHash.out', 'w');
+    fprintf(fid, '%s\n', RunHash);
+    fclose(fid);
+    StoreRun(RunCacheDir);
+
     cd(OriginalPath);
 end
 
+%*******************************************************************************
+% StoreRun
+%
+% Copy the results in the current directory to RunCacheDir.
+% They are copied to a temporary directory first and then renamed, so that
+% RunCacheDir only exists once it is complete.
+%*******************************************************************************
+function StoreRun(RunCacheDir)
+    if exist(RunCacheDir, 'dir')
+        return;
+    end
+    RunsDir = fileparts(RunCacheDir);
+    if ~exist(RunsDir, 'dir')
+        mkdir(RunsDir);
+    end
+    TempDir = tempname(RunsDir);
+    mkdir(TempDir);
+    copyfile('*', TempDir);
+    movefile(TempDir, RunCacheDir);
+end
+
+%*******************************************************************************
+% CopyCachedRun
+%
+% Copy the results in RunCacheDir to the current directory.
+%*******************************************************************************
+function CopyCachedRun(RunCacheDir)
+    [Status Message] = copyfile(fullfile(RunCacheDir, '*'), pwd);
+    if ~Status
+        error('Could not copy the cached run from %s:\n%s',...
+            RunCacheDir, Message);
+    end
+end
+
+%*******************************************************************************
+% LoadPriorCR
+%
+% For the sigma and sigma-young sets, set Settings.PriorCR to the confidence
+% regions (for the first test and level) from the finished run in SimSet that
+% has the nearest SigmaST.
+% Settings is unchanged if there is no such run yet, e.g. for the first
+% gridpoint or when all of the gridpoints are run at once by BatchRunSIPP.
+%*******************************************************************************
+function Settings = LoadPriorCR(Settings, SaveDir, SimSet)
+    if ~ismember(SimSet, {'sigma', 'sigma-young'}) ...
+        | ~Settings.BuildConfidenceRegions
+        return;
+    end
+
+    DefaultSettings = rmfield(Settings, 'PDBR');
+    DefaultSettings.GetDefaultSettings = 1;
+    [~, DefaultSettings] = DPO(DefaultSettings);
+    FNCR = ['ConfidenceRegions_'...
+            'A' int2str(DefaultSettings.LevelsCR(1)*100)...
+            '_' DefaultSettings.Tests{1} '.out'];
+
+    SetDir = fullfile(SaveDir, 'results', SimSet);
+    Runs = dir(SetDir);
+    Runs = Runs([Runs.isdir] & ~ismember({Runs.name}, {'.', '..'}));
+    NearestDir = '';
+    NearestDistance = Inf;
+    for i = 1:1:length(Runs)
+        RunDir = fullfile(SetDir, Runs(i).name);
+        if ~exist(fullfile(RunDir, FNCR), 'file') ...
+            | ~exist(fullfile(RunDir, 'SettingsBefore.out'), 'file')
+            continue;
+        end
+        Text = fileread(fullfile(RunDir, 'SettingsBefore.out'));
+        Value = regexp(Text, 'Assumption_SigmaST: ([^\n]*)', 'tokens', 'once');
+        if isempty(Value)
+            continue;
+        end
+        Distance = abs(str2double(Value{1}) - Settings.Assumption_SigmaST);
+        if (Distance < NearestDistance)
+            NearestDir = RunDir;
+            NearestDistance = Distance;
+        end
+    end
+    if isempty(NearestDir)
+        return;
+    end
+
+    fid = fopen(fullfile(NearestDir, FNCR), 'r');
+    CR = textscan(fid, '%s %f %f');
+    fclose(fid);
+    Settings.PriorCR = NaN(length(Settings.ParametersToTest), 2);
+    for p = 1:1:length(Settings.ParametersToTest)
+        i = find(strcmp(CR{1}, Settings.ParametersToTest{p}), 1);
+        if ~isempty(i)
+            Settings.PriorCR(p,:) = [CR{2}(i) CR{3}(i)];
+        end
+    end
+    disp(sprintf('Predicting confidence regions from %s.', NearestDir));
+end
+
 function RecordCR(Settings, Results, OutfilenameStub)
     for j = 1:1:length(Settings.Tests)
         for a = 1:1:length(Settings.LevelsCR)
@@ -0,0 +1,288 @@
+#!/usr/bin/env python
+#coding=utf-8
+
+import sys
+import os
+import argparse
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+################################################################################
+# HARD-CODING
+################################################################################
+INITIALWAVE = 8
+FINALWAVE = 14
+MINAGE = 18
+MAXAGE = 55
+MAXAGEYOUNG = 40
+EDUCATEMIN = 39 # High School Graduate
+EDUCATEMAX = 43 # Associate degree and above are dropped
+FNINMASK = 'sipp08_w%d.tsv'
+FNLONG = 'sipp08.tsv'
+FNYOUNG = 'sipp08-young.tsv'
+FNWIDE = 'sipp08-wide.tsv'
+FNHISTORIES = 'sipp08-histories.tsv'
+FNLOG = 'CleanSIPP-py.log'
+USECOLS = ['sippid', 'swave', 'tage', 'esex', 'edisprev', 'eeducate',
+           'renroll', 'eafnow', 'rmesr']
+CHUNKROWS = 100000
+
+################################################################################
+# The same sample selection as CleanSIPP.do, without Stata
+#
+# Reads the per-wave extracts written by ReadSIPP.py (or by the first loop of
+# CleanSIPP.do) CHUNKROWS rows at a time, and adds each row to a record for
+# its person (sippid). Only the person-level quantities that the selection
+# rules use are kept, along with emp and tage for each wave, so memory does
+# not grow with the number of rows:
+#
+#   initage         min(tage)
+#   nwaves          number of waves observed
+#   sexchg          esex not the same in every wave
+#   periodsnotpartic, ndisabled, nschool, naf
+#                   number of waves with emp == 2, edisprev == 1,
+#                   renroll < 3 and eafnow == 1
+#   mineducate, maxeducate
+#
+# where emp = 1*(rmesr <= 2) + 2*(rmesr == 4 | rmesr == 8) as in
+# CleanSIPP.do. The rules are then applied to these in the same order as in
+# CleanSIPP.do, and the log has the same counts and tabulations (by person,
+# in the initial wave) that it displays. As in Stata, missing values are
+# larger than any number, and are ignored by min and max.
+#
+# id numbers people in the order of sippid among everyone in any of the
+# waves, like egen group(sippid), so the outputs are the same as the ones
+# written by CleanSIPP.do. Also written is a count of each employment history
+# (emp in each wave) in the full and young samples.
+################################################################################
+class PersonRecords(object):
+    def __init__(self, numwaves):
+        self.numwaves = numwaves
+        self.index = {}
+        self.size = 0
+        self.capacity = 0
+        self.fields = {}
+        self.grow(1024)
+
+    def grow(self, capacity):
+        init = {'nwaves': (0, np.int16, ()),
+                'tage': (np.nan, float, (self.numwaves,)),
+                'emp': (-1, np.int8, (self.numwaves,)),
+                'esexmin': (np.nan, float, ()),
+                'esexmax': (np.nan, float, ()),
+                'esexmissing': (0, np.int16, ()),
+                'periodsnotpartic': (0, np.int16, ()),
+                'ndisabled': (0, np.int16, ()),
+                'nschool': (0, np.int16, ()),
+                'naf': (0, np.int16, ()),
+                'mineducate': (np.nan, float, ()),
+                'maxeducate': (np.nan, float, ())}
+        for (name, (value, dtype, shape)) in init.items():
+            new = np.full((capacity,) + shape, value, dtype=dtype)
+            if name in self.fields:
+                new[:self.capacity] = self.fields[name]
+            self.fields[name] = new
+        self.capacity = capacity
+
+    def lookup(self, sippids):
+        idx = np.empty(len(sippids), dtype=np.int64)
+        for (i, s) in enumerate(sippids):
+            j = self.index.get(s)
+            if j is None:
+                j = self.index[s] = len(self.index)
+            idx[i] = j
+        self.size = len(self.index)
+        if self.size > self.capacity:
+            self.grow(max(2*self.capacity, self.size))
+        return idx
+
+    def add(self, chunk, firstwave):
+        keep = (chunk['swave'] >= firstwave) \
+               & (chunk['swave'] < firstwave + self.numwaves)
+        chunk = chunk[keep.values]
+        p = self.lookup(chunk['sippid'].values)
+        w = chunk['swave'].values.astype(int) - firstwave
+        f = self.fields
+
+        rmesr = chunk['rmesr'].values
+        emp = 1*(rmesr <= 2) + 2*((rmesr == 4) | (rmesr == 8))
+        esex = chunk['esex'].values
+        eeducate = chunk['eeducate'].values
+
+        np.add.at(f['nwaves'], p, 1)
+        f['tage'][p, w] = chunk['tage'].values
+        f['emp'][p, w] = emp
+        np.fmin.at(f['esexmin'], p, esex)
+        np.fmax.at(f['esexmax'], p, esex)
+        np.add.at(f['esexmissing'], p, np.isnan(esex))
+        np.add.at(f['periodsnotpartic'], p, emp == 2)
+        np.add.at(f['ndisabled'], p, chunk['edisprev'].values == 1)
+        np.add.at(f['nschool'], p, chunk['renroll'].values < 3)
+        np.add.at(f['naf'], p, chunk['eafnow'].values == 1)
+        np.fmin.at(f['mineducate'], p, eeducate)
+        np.fmax.at(f['maxeducate'], p, eeducate)
+
+    def finish(self):
+        f = dict((k, v[:self.size]) for (k, v) in self.fields.items())
+        # id as in egen group(sippid)
+        sippids = np.empty(self.size, dtype=object)
+        for (s, j) in self.index.items():
+            sippids[j] = s
+        f['id'] = np.empty(self.size, dtype=np.int64)
+        f['id'][np.argsort(sippids, kind='stable')] = \
+            np.arange(1, self.size + 1)
+        f['initage'] = np.fmin.reduce(f['tage'], axis=1)
+        return pd.DataFrame(dict((k, list(v) if v.ndim > 1 else v) \
+                                 for (k, v) in f.items()))
+
+################################################################################
+# Log that looks like the Stata one
+################################################################################
+class SelectionLog(object):
+    def __init__(self, fn):
+        self.f = open(fn, 'w')
+
+    def display(self, s):
+        print (s)
+        self.f.write(s + '\n')
+
+    def tab(self, name, values, weights=None):
+        if weights is None:
+            weights = np.ones(len(values), dtype=int)
+        values = np.asarray(values, dtype=float)
+        ok = ~np.isnan(values) # tab leaves out missing values
+        counts = Counter()
+        for (v, n) in zip(values[ok], np.asarray(weights)[ok]):
+            counts[v] += int(n)
+        total = sum(counts.values())
+        lines = ['', '%11s |      Freq.     Percent        Cum.' % name[:11],
+                 '-'*12 + '+' + '-'*35]
+        cum = 0
+        for v in sorted(counts):
+            cum += counts[v]
+            lines.append('%11s | %10s %11.2f %11.2f' \
+                         % ('%g' % v, '{:,}'.format(counts[v]),
+                            100.0*counts[v]/total, 100.0*cum/total))
+        lines.extend(['-'*12 + '+' + '-'*35,
+                      '%11s | %10s %11.2f' % ('Total', '{:,}'.format(total),
+                                              100.0), ''])
+        for l in lines:
+            self.display(l)
+
+    def count(self, text, n):
+        self.display(text)
+        self.display('  %s' % '{:,}'.format(n))
+
+    def close(self):
+        self.f.close()
+
+################################################################################
+# Selection rules, in the order of CleanSIPP.do
+################################################################################
+def selectSample(people, numwaves, minage, maxage, log):
+    log.tab('initage', people['initage'], people['nwaves'])
+    people = people[(people['initage'] >= minage) \
+                    & (people['initage'] <= maxage)]
+
+    log.count('Cross-sectional observations before balancing:', len(people))
+    people = people[people['nwaves'] == numwaves]
+    log.count('Cross-sectional observations after balancing:', len(people))
+
+    # esex[1] != esex[_N] after sorting, where missing sorts last
+    missing = people['esexmissing']
+    sexchg = (people['esexmin'] != people['esexmax']) \
+             & people['esexmin'].notna()
+    sexchg |= (missing > 0) & (missing < people['nwaves'])
+    log.tab('sexchg', sexchg.astype(int))
+    people = people[~sexchg.values]
+
+    log.tab('esex', people['esexmin'])
+    people = people[people['esexmin'] == 1]
+
+    for name in ['periodsnotpartic', 'ndisabled', 'nschool', 'naf']:
+        log.tab(name, people[name])
+        people = people[people[name] == 0]
+
+    # egen max/min ignore missing, and are missing if all are
+    maxeducate = people['maxeducate'].fillna(np.inf)
+    mineducate = people['mineducate'].fillna(np.inf)
+    people = people[(maxeducate == mineducate).values]
+    maxeducate = maxeducate[(maxeducate == mineducate).values]
+    log.tab('maxeducate', maxeducate.replace(np.inf, np.nan))
+    people = people[((maxeducate >= EDUCATEMIN) \
+                     & (maxeducate < EDUCATEMAX)).values]
+
+    log.count('Cross-sectional observations remaining:', len(people))
+    return people.sort_values('id')
+
+def stackWaves(values, numwaves):
+    # One row per person, and no rows (rather than an error) if no one is left
+    if len(values) == 0:
+        return np.empty((0, numwaves), dtype=int)
+    return np.vstack(values)
+
+def writeLong(people, numwaves, fn):
+    n = len(people)
+    long = pd.DataFrame({
+        'id': np.repeat(people['id'].values, numwaves),
+        'swave': np.tile(np.arange(numwaves), n),
+        'emp': stackWaves(people['emp'].values, numwaves).ravel(),
+        'tage': stackWaves(people['tage'].values, numwaves).ravel(),
+        'initage': np.repeat(people['initage'].values, numwaves),
+        'nvals': np.tile((np.arange(numwaves) == 0).astype(int), n)})
+    for c in ['tage', 'initage']:
+        long[c] = long[c].astype('Int64')
+    long.to_csv(fn, sep='\t', index=False)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Sample selection for the 2008 SIPP extract.')
+    parser.add_argument('--waves', type=int, nargs=2,
+                        default=[INITIALWAVE, FINALWAVE],
+                        metavar=('FIRST', 'LAST'))
+    parser.add_argument('--ages', type=int, nargs=2,
+                        default=[MINAGE, MAXAGE], metavar=('MIN', 'MAX'),
+                        help='range of age in the initial wave')
+    parser.add_argument('--young', type=int, default=MAXAGEYOUNG,
+                        help='largest age in the initial wave for the young '
+                             'sample')
+    parser.add_argument('--indir', default='.')
+    parser.add_argument('--outdir', default='.')
+    args = parser.parse_args()
+
+    (first, last) = args.waves
+    numwaves = last - first + 1
+    log = SelectionLog(os.path.join(args.outdir, FNLOG))
+
+    records = PersonRecords(numwaves)
+    for wave in range(first, last + 1):
+        log.display('Loading in wave %d' % wave)
+        fn = os.path.join(args.indir, FNINMASK % wave)
+        for chunk in pd.read_csv(fn, sep='\t', usecols=USECOLS,
+                                 dtype={'sippid': str}, chunksize=CHUNKROWS):
+            records.add(chunk, first)
+    people = records.finish()
+    people = selectSample(people, numwaves, args.ages[0], args.ages[1], log)
+
+    young = people[people['initage'] <= args.young]
+    log.count('Cross-sectional observations in full sample:', len(people))
+    log.count('Cross-sectional observations in young sample:', len(young))
+
+    writeLong(people, numwaves, os.path.join(args.outdir, FNLONG))
+    writeLong(young, numwaves, os.path.join(args.outdir, FNYOUNG))
+    pd.DataFrame(stackWaves(people['emp'].values, numwaves)).to_csv(
+        os.path.join(args.outdir, FNWIDE), sep='\t', index=False,
+        header=False)
+
+    histories = Counter(''.join(map(str, e)) for e in people['emp'])
+    historiesyoung = Counter(''.join(map(str, e)) for e in young['emp'])
+    with open(os.path.join(args.outdir, FNHISTORIES), 'w') as f:
+        f.write('history\tcount\tcountyoung\n')
+        for (h, n) in sorted(histories.items(), key=lambda i: (-i[1], i[0])):
+            f.write('%s\t%d\t%d\n' % (h, n, historiesyoung[h]))
+    log.close()
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,41 @@
 #!/bin/bash
+# Usage: ./DownloadAndCleanSIPP.sh [python] [nocleanup]
+# With python, the raw data is read by ReadSIPP.py and cleaned by CleanSIPP.py
+# instead of by Stata, and only the waves that are used are downloaded.
+if [ "$1" == "python" ]; then
+    mode="python"
+    shift
+else
+    mode="stata"
+fi
+
+if [ "$mode" == "python" ]; then
+    echo "Downloading and extracting raw data from NBER..."
+    for (( wave = 8; wave <= 14; wave ++ ))
+    do
+        if test -f "l08puw${wave}.dat"; then
+            echo "Wave ${wave} .dat already exists; skipping."
+        else
+            wget -nc "http://www.nber.org/sipp/2008/l08puw${wave}.zip"
+            unzip -o l08puw${wave}.zip
+            rm l08puw${wave}.zip
+        fi
+    done
+
+    echo "Reading"
+    python ReadSIPP.py --waves 8 14
+    echo "Cleaning"
+    python CleanSIPP.py --waves 8 14
+
+    if [ "$1" != "nocleanup" ]; then
+        echo "Removing SIPP data"
+        rm l08puw*.dat sipp08_w*.tsv
+    fi
+
+    echo "Done"
+    exit
+fi
+
 echo "Downloading, extracting and converting raw data from NBER..."
 for (( wave = 1; wave <= 16; wave ++ ))
 do
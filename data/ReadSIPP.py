@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+#coding=utf-8
+
+import sys
+import os
+import re
+import time
+import fnmatch
+import argparse
+import multiprocessing
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+################################################################################
+# HARD-CODING
+################################################################################
+INITIALWAVE = 8
+FINALWAVE = 14
+FNDICTMASK = 'sippl08puw%d.dct'
+FNRAWMASK = 'l08puw%d.dat'
+FNOUTMASK = 'sipp08_w%d.tsv'
+
+# Same as the first loop of CleanSIPP.do
+KEEP = ['ssuid', 'epppnum', 'swave', 'srefmon', 'rhcalmn', 'eppintvw',
+        'tage', 'esex', 'erace', 'eorigin', 'edisprev', 'eeducate',
+        'renroll', 'eafnow', 'eptwrk', 'rmesr', 'tfipsst', 'tpearn',
+        'tpyrate*', 'apyrate*', 'ejobcntr',
+        'epayhr1', 'apayhr1',
+        'eptwrk', 'aptwrk',
+        'ehrsall', 'ahrsall']
+FILTERS = [('srefmon', '==', 4),  # final reference month (seam bias)
+           ('eppintvw', '<=', 2)] # no type z observations
+DROPAFTER = ['srefmon', 'eppintvw']
+CHUNKRECORDS = 50000 # Records decoded at once, about 50MB of raw data
+
+################################################################################
+# Read the raw 2008 SIPP core wave files without Stata
+#
+# Each line of the NBER dictionaries (sippl08puw<j>.dct) looks like
+#
+#   _column(503 )   str4 epppnum     %4s "PE: Person number"
+#   _column(943 ) double tpyrate1  %4.2f "JB: Regular hourly pay rate"
+#
+# which gives the 1-based byte where the variable starts, its width, and
+# whether it is a string or a number (with some implied decimal places).
+# Only the variables in KEEP are decoded.
+#
+# The raw files are fixed width with one record per line, so they are
+# memory-mapped and read CHUNKRECORDS lines at a time as a 2-d array of bytes.
+# The variables in FILTERS are decoded first, and the rest only for the lines
+# that pass. Numbers are decoded directly from the digits, which is much
+# faster than parsing them as text.
+#
+# For each wave this writes the same extract as the first loop of
+# CleanSIPP.do (sipp08_w<j>.tsv, with sippid = ssuid followed by epppnum),
+# with missing numbers left empty. Waves are read in parallel.
+################################################################################
+Column = namedtuple('Column', ['name', 'start', 'width', 'isstring',
+                               'decimals'])
+COLUMNPATTERN = re.compile(
+    r'^\s*_column\(\s*(\d+)\s*\)\s+(\w+)\s+(\w+)\s+%(\d+)(?:\.(\d+))?([fgs])')
+
+def readDictionary(fn):
+    columns = []
+    with open(fn, 'r') as f:
+        for line in f:
+            m = COLUMNPATTERN.match(line)
+            if not m:
+                continue
+            (start, vtype, name, width, decimals, fmt) = m.groups()
+            columns.append(Column(name=name,
+                                  start=int(start) - 1,
+                                  width=int(width),
+                                  isstring=(fmt == 's'),
+                                  decimals=int(decimals or 0)))
+    if not columns:
+        raise ValueError('No _column entries found in ' + fn)
+    return columns
+
+def selectColumns(columns, patterns):
+    # Variables matching any of patterns, in dictionary order (like keep)
+    selected = [c for c in columns \
+                if any(fnmatch.fnmatchcase(c.name, p) for p in patterns)]
+    for p in patterns:
+        if not any(fnmatch.fnmatchcase(c.name, p) for c in columns):
+            raise ValueError('No variable matches ' + p)
+    return selected
+
+def decodeNumbers(field, decimals):
+    # field is an (n x width) array of bytes holding right-justified numbers
+    isdigit = (field >= ord('0')) & (field <= ord('9'))
+    isdot = (field == ord('.'))
+    value = np.zeros(field.shape[0])
+    for k in range(field.shape[1]):
+        value = np.where(isdigit[:, k],
+                         10*value + (field[:, k] - ord('0')), value)
+    # Stata's %w.df reads d implied decimal places unless there is a point
+    afterdot = np.cumsum(isdot, axis=1) > 0
+    places = np.where(isdot.any(axis=1),
+                      (isdigit & afterdot).sum(axis=1), decimals)
+    value = value/10.0**places
+    value[(field == ord('-')).any(axis=1)] *= -1
+    valid = isdigit | isdot | (field == ord(' ')) | (field == ord('-'))
+    value[~isdigit.any(axis=1) | ~valid.all(axis=1)] = np.nan # Stata missing
+    return value
+
+def decodeColumn(records, column):
+    field = records[:, column.start:column.start + column.width]
+    if column.isstring:
+        field = np.ascontiguousarray(field).view('S%d' % column.width)[:, 0]
+        return np.char.strip(np.char.decode(field, 'latin-1'))
+    return decodeNumbers(field, column.decimals)
+
+def applyFilter(value, op, threshold):
+    return {'==': value == threshold,
+            '<=': value <= threshold,
+            '>=': value >= threshold,
+            '<': value < threshold,
+            '>': value > threshold}[op]
+
+def mapRecords(fn):
+    raw = np.memmap(fn, dtype=np.uint8, mode='r')
+    eol = np.flatnonzero(raw[:min(len(raw), 1 << 16)] == ord('\n'))
+    if len(eol) == 0:
+        raise ValueError('Could not find the end of the first line of ' + fn)
+    reclen = int(eol[0]) + 1
+    if len(raw) % reclen != 0:
+        raise ValueError('%s is not made of lines of %d bytes.' \
+                         % (fn, reclen))
+    return raw.reshape(-1, reclen)
+
+def readWave(job):
+    (wave, rawdir, outdir) = job
+    tic = time.time()
+    columns = readDictionary(os.path.join(rawdir, FNDICTMASK % wave))
+    keep = selectColumns(columns, KEEP)
+    byname = dict((c.name, c) for c in keep)
+    records = mapRecords(os.path.join(rawdir, FNRAWMASK % wave))
+    reclen = records.shape[1]
+    if max(c.start + c.width for c in keep) >= reclen:
+        raise ValueError('Wave %d records are shorter than the dictionary.' \
+                         % wave)
+
+    chunks = []
+    for first in range(0, records.shape[0], CHUNKRECORDS):
+        block = records[first:first + CHUNKRECORDS]
+        if np.any(block[:, -1] != ord('\n')):
+            raise ValueError('Wave %d has a line that is not %d bytes.' \
+                             % (wave, reclen))
+        passed = np.ones(block.shape[0], dtype=bool)
+        for (name, op, threshold) in FILTERS:
+            passed &= applyFilter(decodeColumn(block, byname[name]), op,
+                                  threshold)
+        block = np.asarray(block[passed]) # Copies only the lines that pass
+        chunks.append(pd.DataFrame(dict((c.name, decodeColumn(block, c)) \
+                                        for c in keep)))
+
+    df = pd.concat(chunks, ignore_index=True)
+    df = df.drop(columns=DROPAFTER)
+    df.insert(0, 'sippid', df['ssuid'] + df['epppnum'])
+    df = df.drop(columns=['ssuid', 'epppnum'])
+    df.insert(1, 'swave', df.pop('swave'))
+    for c in df.columns:
+        # Whole numbers are written as integers
+        if (df[c].dtype == float) \
+                and (df[c].dropna() == np.round(df[c].dropna())).all():
+            df[c] = df[c].astype('Int64')
+
+    fnout = os.path.join(outdir, FNOUTMASK % wave)
+    df.to_csv(fnout, sep='\t', index=False)
+    return (wave, records.shape[0], len(df), time.time() - tic)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Extract the waves used in CleanSIPP.do from the raw '
+                    '2008 SIPP files.')
+    parser.add_argument('--waves', type=int, nargs=2,
+                        default=[INITIALWAVE, FINALWAVE],
+                        metavar=('FIRST', 'LAST'))
+    parser.add_argument('--rawdir', default='.',
+                        help='location of the .dat and .dct files')
+    parser.add_argument('--outdir', default='.')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of processes; default is one per wave '
+                             'up to the number of cores')
+    args = parser.parse_args()
+
+    waves = range(args.waves[0], args.waves[1] + 1)
+    jobs = [(w, args.rawdir, args.outdir) for w in waves]
+    workers = args.workers or min(len(jobs), multiprocessing.cpu_count())
+    pool = multiprocessing.Pool(workers)
+    try:
+        for (wave, n, kept, seconds) in pool.imap_unordered(readWave, jobs):
+            print ('Wave %d: kept %d of %d records (%.1f seconds)' \
+                   % (wave, kept, n, seconds))
+    finally:
+        pool.close()
+        pool.join()
+
+if __name__ == '__main__':
+    main()
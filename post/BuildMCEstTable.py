@@ -3,13 +3,19 @@
 
 import sys
 import os
+import multiprocessing
 import numpy as np
-import matplotlib.pylab as plt
+import matplotlib
+matplotlib.use('Agg') # Never need a display, and safe to use in workers
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.backends.backend_pdf import PdfPages
 import statsmodels.api as sm
 from matplotlib.ticker import FuncFormatter
 
 from TableTools import *
 from StatedepTools import *
+from BuildTools import *
 
 ################################################################################
 # HARD-CODING
@@ -24,15 +30,128 @@ ARROWSIZE = 8
 PERCENTBUFFERY = .05
 PLOTGRIDDIM = 1000
 PLOTLINEWIDTH = 2.0
+PLOTFORMAT = 'png' # 'png' for one file per parameter, 'pdf' for one file
+FNPLOTPDF = 'MCDensityPlots.pdf'
+PLOTWORKERS = None # Number of processes for plotting; None uses every core
+
+################################################################################
+# Density plots of the estimated lower and upper bounds for one parameter
+#
+# Each plot only needs its own data, so the densities are estimated in separate
+# processes.  These only return the densities on the grid, which are small, so
+# a figure can also be drawn by the process that writes it.
+# Figures are created directly (rather than through pyplot) so that nothing
+# holds on to them once they have been saved.
+################################################################################
+def estimateDensities(job):
+    (p, LBData, UBData, TrueLBp, TrueUBp, Labels) = job
+
+    LeftLB = min(np.amin(d) for d in LBData)
+    LeftUB = max(np.amax(d) for d in LBData)
+    RightLB = min(np.amin(d) for d in UBData)
+    RightUB = max(np.amax(d) for d in UBData)
+
+    LeftGrid = np.linspace( LeftLB, LeftUB, PLOTGRIDDIM)
+    RightGrid = np.linspace(RightLB, RightUB, PLOTGRIDDIM)
+
+    kwargs = dict(var_type='c', bw='normal_reference')
+    LeftPlots = []
+    RightPlots = []
+    for i in range(len(LBData)):
+        LeftDens = sm.nonparametric.KDEMultivariate(data=LBData[i], **kwargs)
+        LeftPlots.append(LeftDens.pdf(LeftGrid))
+        RightDens = sm.nonparametric.KDEMultivariate(data=UBData[i], **kwargs)
+        RightPlots.append(RightDens.pdf(RightGrid))
+
+    return (LeftGrid, RightGrid, LeftPlots, RightPlots)
+
+def drawDensityPlot(job, densities=None):
+    (p, LBData, UBData, TrueLBp, TrueUBp, Labels) = job
+    if densities is None:
+        densities = estimateDensities(job)
+    (LeftGrid, RightGrid, LeftPlots, RightPlots) = densities
+    (LeftLB, LeftUB) = (LeftGrid[0], LeftGrid[-1])
+    (RightLB, RightUB) = (RightGrid[0], RightGrid[-1])
+
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    (axleft, axright) = fig.subplots(1, 2, sharey=True)
+
+    Height = 0
+    LegendPlots = []
+    for i in range(len(LeftPlots)):
+        pl, = axleft.plot(LeftGrid, LeftPlots[i], color=NPLOTCOLORLIST[i],
+                linewidth=PLOTLINEWIDTH)
+        LegendPlots.append(pl)
+        axright.plot(RightGrid, RightPlots[i], color=NPLOTCOLORLIST[i],
+                linewidth=PLOTLINEWIDTH)
+
+        Height = max(Height,
+                     np.amax(np.vstack([LeftPlots[i], RightPlots[i]])))
+
+    ### Cosmetic aspects of the plot
+    axleft.set_xlim(LeftLB, LeftUB)
+    axright.set_xlim(RightLB, RightUB)
+    axleft.yaxis.set_ticks_position('none')
+    axright.yaxis.set_ticks_position('none')
+    axleft.xaxis.set_ticks_position('bottom')
+    axright.xaxis.set_ticks_position('bottom')
+    axleft.get_yaxis().set_ticks([])
+    axright.get_yaxis().set_ticks([])
+
+    YTop = (1 + PERCENTBUFFERY)*Height
+    axright.set_ylim([0, YTop])
+    for (ax, truth) in ((axleft, TrueLBp), (axright, TrueUBp)):
+        ax.plot(truth*np.ones(PLOTGRIDDIM), np.linspace(0, YTop, PLOTGRIDDIM),
+                color='gray',
+                linewidth=1.5,
+                linestyle='--')
+    axleft.xaxis.set_ticks([LeftLB, LeftUB, TrueLBp])
+    axright.xaxis.set_ticks([RightLB, RightUB, TrueUBp])
+    majorFormatter = FuncFormatter(removeLeadingZero)
+    axleft.xaxis.set_major_formatter(majorFormatter)
+    axright.xaxis.set_major_formatter(majorFormatter)
+
+    axleft.set_title('Lower bound')
+    axright.set_title('Upper bound')
+    fig.legend( LegendPlots, Labels,
+                loc='lower center',
+                ncol=2,
+                frameon=False)
+    fig.subplots_adjust(bottom=0.15)
+    return fig
+
+def savePNGPlot(job):
+    # Draw and save in the worker, so only the file name comes back
+    (fn, job) = job
+    drawDensityPlot(job).savefig(fn)
+    return fn
+
+def fnPNGPlot(p):
+    return 'MCDensityPlot_' + p + '.png'
+
+def mapPlotJobs(func, jobs):
+    # Results come back in order, and each worker handles one job at a time.
+    # Workers are forked so that they do not rerun this script when started,
+    # so where fork is not available (e.g. Windows) the jobs are run here.
+    if 'fork' in multiprocessing.get_all_start_methods():
+        with multiprocessing.get_context('fork').Pool(PLOTWORKERS) as pool:
+            for r in pool.imap(func, jobs):
+                yield r
+    else:
+        for job in jobs:
+            yield func(job)
 
 ################################################################################
 ################################################################################
 ################################################################################
 CodeDir = os.path.dirname(os.path.abspath(sys.argv[0]))
-ResultsDir = os.path.abspath(sys.argv[1])
+(Args, DryRun, Force) = parseBuildArgs(sys.argv)
+ResultsDir = os.path.abspath(Args[0])
 if not os.path.isdir(ResultsDir):
     print ('Could not find directory ' + ResultsDir)
     sys.exit()
+Plan = BuildPlan(ResultsDir, sys.argv[0], DryRun, Force)
 
 NDIRLIST = [dirname for dirname in os.listdir(ResultsDir)
             if os.path.isdir(os.path.join(ResultsDir, dirname))]
@@ -60,183 +179,146 @@ for n in NDIRLIST:
 
     MinCrit[n] = np.loadtxt(os.path.join(ResultsDir, n, FNMINCRITERION))
 
-# Table specification and header
-fout = open(os.path.join(ResultsDir, FNOUT), 'w')
-colspec = 'cl' + (1 + 2*len(NLIST))*'c'
-startTable(fout, colspec)
-insertTopRule(fout)
-
-row = 5*['']
-row[2] = '\multicolumn{' + '%d' % len(NLIST) + '}{c}' + \
-            '{$\hat{\\theta}{}^{\star}_{\\text{lb}}$}'
-row[4] = '\multicolumn{' + '%d' % len(NLIST) + '}{c}' + \
-            '{$\hat{\\theta}{}^{\star}_{\\text{ub}}$}'
-writeRow(fout, row)
-insertCMidRule(fout, 3, 3 + len(NLIST) - 1, SPEC='lr')
-insertCMidRule(fout, 3 + 1 + len(NLIST), 3 + 1 + 2*len(NLIST) - 1, SPEC='l')
-
-row = (len(colspec)-1)*['']
-row[0] = '\multicolumn{2}{r}{sample size}'
-count = 0
-for n in NLIST:
-    ntotal = '$%d$' % round(n*NBASE)
-    row[1 + count] = ntotal
-    row[1 + 1 + len(NLIST) + count] = ntotal
-    count = count + 1
-writeRow(fout, row)
-insertMidRule(fout)
-
-row = len(colspec)*['']
-FirstFlag = True
-for p in PARAMUNIVERSE.keys():
-    if p in ParamNames:
-        if FirstFlag:
-            FirstFlag = False
-        else:
-            insertCMidRule(fout, 2, len(colspec), 'l')
-
-        row[0] = '\multirow{6}{*}{' + PARAMUNIVERSE[p] + '}'
-        row[1] = 'true'
-        for c in range(0,len(NLIST)):
-            row[2 + c] = formatNum(TrueLB.loc[p][0])
-            row[2 + 1 + len(NLIST) + c] = formatNum(TrueUB.loc[p][0])
-        writeRow(fout, row)
-
-        row[0] = ''
-        row[1] = 'mean'
-
-        for i, n in enumerate(NDIRLIST):
-            row[2 + i] = formatNum(LB[n][p].mean())
-            row[2 + 1 + len(NLIST) + i] = formatNum(UB[n][p].mean())
-        writeRow(fout, row)
-
-        row[0] = ''
-        row[1] = 'std'
-        for i, n in enumerate(NDIRLIST):
-            row[2 + i] = formatNum(LB[n][p].std())
-            row[2 + 1 + len(NLIST) + i] = formatNum(UB[n][p].std())
-        writeRow(fout, row)
-
-        row[0] = ''
-        row[1] = 'rmse'
-        for i, n in enumerate(NDIRLIST):
-            row[2 + i] = formatNum(\
-                        np.sqrt(\
-                              (LB[n][p].mean() - TrueLB.loc[p][0])**2 \
-                            + LB[n][p].var()\
-                        ))
-            row[2 + 1 + len(NLIST) + i] = formatNum(\
-                        np.sqrt(\
-                              (UB[n][p].mean() - TrueUB.loc[p][0])**2 \
-                            + UB[n][p].var()\
-                        ))
-        writeRow(fout, row)
-
-        row[0] = ''
-        row[1] = '5/95\%'
-        for i, n in enumerate(NDIRLIST):
-            row[2 + i] = formatNum(percentile(LB[n][p], 5))
-            row[2 + 1 + len(NLIST) + i] = formatNum(percentile(UB[n][p], 95))
-        writeRow(fout, row)
-
-        row[0] = ''
-        row[1] = 'min/max'
-        for i, n in enumerate(NDIRLIST):
-            row[2 + i] = formatNum(min(LB[n][p]))
-            row[2 + 1 + len(NLIST) + i] = formatNum(max(UB[n][p]))
-        writeRow(fout, row)
-
-
-insertMidRule(fout)
-row = (len(colspec) - 1)*['']
-row[0] = '\multicolumn{2}{r}{$\mathbb{P}[\Theta^{\star}=\emptyset \\text{ in sample}]$}'
-for i, n in enumerate(NDIRLIST):
-    row[1 + i] = formatNum(float(np.count_nonzero(MinCrit[n]))/len(MinCrit[n]))
-    row[1 + 1 + len(NLIST) + i] = '--'
-writeRow(fout, row)
-
-insertBottomRule(fout)
-endTable(fout)
-createTableViewerAndCompile(os.path.join(CodeDir, FNVIEWTEMPLATE),
-                            FNOUT, ResultsDir)
+# The table depends on every sample size, the plots only on those in NPLOTLIST
+TableDeps = [os.path.join(CodeDir, FNVIEWTEMPLATE)]
+for n in NDIRLIST:
+    TableDeps.extend([os.path.join(ResultsDir, n, f) for f in \
+        [FNLB, FNUB, FNTRUEBOUNDS, FNMINCRITERION]])
+
+if Plan.stale(FNOUT, TableDeps):
+    # Table specification and header
+    fout = open(os.path.join(ResultsDir, FNOUT), 'w')
+    colspec = 'cl' + (1 + 2*len(NLIST))*'c'
+    startTable(fout, colspec)
+    insertTopRule(fout)
+
+    row = 5*['']
+    row[2] = '\multicolumn{' + '%d' % len(NLIST) + '}{c}' + \
+                '{$\hat{\\theta}{}^{\star}_{\\text{lb}}$}'
+    row[4] = '\multicolumn{' + '%d' % len(NLIST) + '}{c}' + \
+                '{$\hat{\\theta}{}^{\star}_{\\text{ub}}$}'
+    writeRow(fout, row)
+    insertCMidRule(fout, 3, 3 + len(NLIST) - 1, SPEC='lr')
+    insertCMidRule(fout, 3 + 1 + len(NLIST), 3 + 1 + 2*len(NLIST) - 1, SPEC='l')
+
+    row = (len(colspec)-1)*['']
+    row[0] = '\multicolumn{2}{r}{sample size}'
+    count = 0
+    for n in NLIST:
+        ntotal = '$%d$' % round(n*NBASE)
+        row[1 + count] = ntotal
+        row[1 + 1 + len(NLIST) + count] = ntotal
+        count = count + 1
+    writeRow(fout, row)
+    insertMidRule(fout)
+
+    row = len(colspec)*['']
+    FirstFlag = True
+    for p in PARAMUNIVERSE.keys():
+        if p in ParamNames:
+            if FirstFlag:
+                FirstFlag = False
+            else:
+                insertCMidRule(fout, 2, len(colspec), 'l')
+
+            row[0] = '\multirow{6}{*}{' + PARAMUNIVERSE[p] + '}'
+            row[1] = 'true'
+            for c in range(0,len(NLIST)):
+                row[2 + c] = formatNum(TrueLB.loc[p][0])
+                row[2 + 1 + len(NLIST) + c] = formatNum(TrueUB.loc[p][0])
+            writeRow(fout, row)
+
+            row[0] = ''
+            row[1] = 'mean'
+
+            for i, n in enumerate(NDIRLIST):
+                row[2 + i] = formatNum(LB[n][p].mean())
+                row[2 + 1 + len(NLIST) + i] = formatNum(UB[n][p].mean())
+            writeRow(fout, row)
+
+            row[0] = ''
+            row[1] = 'std'
+            for i, n in enumerate(NDIRLIST):
+                row[2 + i] = formatNum(LB[n][p].std())
+                row[2 + 1 + len(NLIST) + i] = formatNum(UB[n][p].std())
+            writeRow(fout, row)
+
+            row[0] = ''
+            row[1] = 'rmse'
+            for i, n in enumerate(NDIRLIST):
+                row[2 + i] = formatNum(\
+                            np.sqrt(\
+                                  (LB[n][p].mean() - TrueLB.loc[p][0])**2 \
+                                + LB[n][p].var()\
+                            ))
+                row[2 + 1 + len(NLIST) + i] = formatNum(\
+                            np.sqrt(\
+                                  (UB[n][p].mean() - TrueUB.loc[p][0])**2 \
+                                + UB[n][p].var()\
+                            ))
+            writeRow(fout, row)
+
+            row[0] = ''
+            row[1] = '5/95\%'
+            for i, n in enumerate(NDIRLIST):
+                row[2 + i] = formatNum(percentile(LB[n][p], 5))
+                row[2 + 1 + len(NLIST) + i] = formatNum(percentile(UB[n][p], 95))
+            writeRow(fout, row)
+
+            row[0] = ''
+            row[1] = 'min/max'
+            for i, n in enumerate(NDIRLIST):
+                row[2 + i] = formatNum(min(LB[n][p]))
+                row[2 + 1 + len(NLIST) + i] = formatNum(max(UB[n][p]))
+            writeRow(fout, row)
+
+
+    insertMidRule(fout)
+    row = (len(colspec) - 1)*['']
+    row[0] = '\multicolumn{2}{r}{$\mathbb{P}[\Theta^{\star}=\emptyset \\text{ in sample}]$}'
+    for i, n in enumerate(NDIRLIST):
+        row[1 + i] = formatNum(float(np.count_nonzero(MinCrit[n]))/len(MinCrit[n]))
+        row[1 + 1 + len(NLIST) + i] = '--'
+    writeRow(fout, row)
+
+    insertBottomRule(fout)
+    endTable(fout)
+    createTableViewerAndCompile(os.path.join(CodeDir, FNVIEWTEMPLATE),
+                                FNOUT, ResultsDir)
+    Plan.done(FNOUT)
 
 ################################################################################
 # Lets also make some plots while we're at it
 ################################################################################
+PlotDeps = [os.path.join(ResultsDir, NDIRLIST[0], FNTRUEBOUNDS)]
+for n in NPLOTLIST:
+    PlotDeps.extend([os.path.join(ResultsDir, NDIRLIST[n], f) for f in \
+        [FNLB, FNUB]])
+
+PlotJobs = []
 for p in PARAMUNIVERSE.keys():
     if p in ParamNames:
-        LBComb = np.vstack((LB[NDIRLIST[n]][p] for n in NPLOTLIST))
-        LeftLB = np.amin(LBComb)
-        LeftUB = np.amax(LBComb)
-        UBComb = np.vstack((UB[NDIRLIST[n]][p] for n in NPLOTLIST))
-        RightLB = np.amin(UBComb)
-        RightUB = np.amax(UBComb)
-
-        LeftGrid = np.linspace( LeftLB, LeftUB, PLOTGRIDDIM)
-        RightGrid = np.linspace(RightLB, RightUB, PLOTGRIDDIM)
-
-        fig,(axleft,axright) = plt.subplots(1,2, sharey=True)
-        kwargs = dict(var_type='c', bw='normal_reference')
-
-        Height = 0
-        LegendPlots = []
-        LegendLabels = []
-        for i, n in enumerate(NPLOTLIST):
-            LabelPDF = 'n = %d' % (NLIST[n]*NBASE)
-            LegendLabels.append(LabelPDF)
-
-            LeftDens = sm.nonparametric.KDEMultivariate(
-                    data=LB[NDIRLIST[n]][p], **kwargs)
-            LeftPlot = LeftDens.pdf(LeftGrid)
-            pl, = axleft.plot(LeftGrid, LeftPlot, color=NPLOTCOLORLIST[i],
-                    linewidth=PLOTLINEWIDTH)
-            LegendPlots.append(pl)
-
-            RightDens = sm.nonparametric.KDEMultivariate(
-                    data=UB[NDIRLIST[n]][p], **kwargs)
-            RightPlot = RightDens.pdf(RightGrid)
-            pr, = axright.plot(RightGrid, RightPlot, color=NPLOTCOLORLIST[i],
-                    linewidth=PLOTLINEWIDTH)
-
-            Height = max(Height, np.amax(np.vstack([LeftPlot, RightPlot])))
-
-        ### Cosmetic aspects of the plot
-        axleft.set_xlim(LeftLB, LeftUB)
-        axright.set_xlim(RightLB, RightUB)
-        axleft.yaxis.set_ticks_position('none')
-        axright.yaxis.set_ticks_position('none')
-        axleft.xaxis.set_ticks_position('bottom')
-        axright.xaxis.set_ticks_position('bottom')
-        axleft.get_yaxis().set_ticks([])
-        axright.get_yaxis().set_ticks([])
-
-        YTop = (1 + PERCENTBUFFERY)*Height
-        axes = plt.gca()
-        axes.set_ylim([0, YTop])
-        PlotLeftID = axleft.plot(   TrueLB.loc[p][0]*np.ones(PLOTGRIDDIM), \
-                                    np.linspace(0, YTop, PLOTGRIDDIM))
-        PlotRightID = axright.plot(  TrueUB.loc[p][0]*np.ones(PLOTGRIDDIM), \
-                                    np.linspace(0, YTop, PLOTGRIDDIM))
-        plt.setp(   [PlotLeftID, PlotRightID],
-                    color='gray',
-                    linewidth=1.5,
-                    linestyle='--')
-        xticks = [('%4.3f' % s) for s in \
-                    [   LeftLB, LeftUB,
-                        RightLB, RightUB,
-                        TrueLB.loc[p][0], TrueUB.loc[p][0]]]
-        axleft.xaxis.set_ticks([LeftLB, LeftUB, TrueLB.loc[p][0]])
-        axright.xaxis.set_ticks([RightLB, RightUB, TrueUB.loc[p][0]])
-        majorFormatter = FuncFormatter(removeLeadingZero)
-        axleft.xaxis.set_major_formatter(majorFormatter)
-        axright.xaxis.set_major_formatter(majorFormatter)
-
-        axleft.set_title('Lower bound')
-        axright.set_title('Upper bound')
-        fig.legend( LegendPlots, LegendLabels,
-                    loc='lower center',
-                    ncol=2,
-                    frameon=False)
-        plt.subplots_adjust(bottom=0.15)
-
-        plt.savefig(os.path.join(ResultsDir, 'MCDensityPlot_' + p))
+        PlotJobs.append((p,
+                         [LB[NDIRLIST[n]][p] for n in NPLOTLIST],
+                         [UB[NDIRLIST[n]][p] for n in NPLOTLIST],
+                         TrueLB.loc[p][0], TrueUB.loc[p][0],
+                         ['n = %d' % (NLIST[n]*NBASE) for n in NPLOTLIST]))
+
+if PLOTFORMAT == 'png':
+    PlotJobs = [(os.path.join(ResultsDir, fnPNGPlot(job[0])), job) \
+                for job in PlotJobs if Plan.stale(fnPNGPlot(job[0]), PlotDeps)]
+    for fn in mapPlotJobs(savePNGPlot, PlotJobs):
+        Plan.done(os.path.basename(fn))
+elif PLOTFORMAT == 'pdf':
+    # One page per parameter: the workers only estimate the densities, and
+    # this process draws and writes the pages in order, one at a time
+    if Plan.stale(FNPLOTPDF, PlotDeps):
+        with PdfPages(os.path.join(ResultsDir, FNPLOTPDF)) as pdf:
+            for (densities, job) in zip(
+                    mapPlotJobs(estimateDensities, PlotJobs), PlotJobs):
+                pdf.savefig(drawDensityPlot(job, densities))
+        Plan.done(FNPLOTPDF)
+else:
+    print ('Unrecognized PLOTFORMAT ' + PLOTFORMAT)
+
+Plan.finish()
@@ -7,6 +7,7 @@ import numpy as np
 
 from TableTools import *
 from StatedepTools import *
+from BuildTools import *
 
 ################################################################################
 # HARD-CODING
@@ -14,6 +15,7 @@ from StatedepTools import *
 LEVELS = [1, 5, 10]
 TESTS = ['SS', 'CNS']
 TOL = 1e-3
+SEFONTSIZE = '\\scriptsize'
 FNOUT = 'TableMCTest.tex'
 
 ################################################################################
@@ -21,17 +23,33 @@ FNOUT = 'TableMCTest.tex'
 ################################################################################
 ################################################################################
 CodeDir = os.path.dirname(os.path.abspath(sys.argv[0]))
-ResultsDir = os.path.abspath(sys.argv[1])
+(Args, DryRun, Force) = parseBuildArgs(sys.argv)
+ResultsDir = os.path.abspath(Args[0])
 if not os.path.isdir(ResultsDir):
     print ('Could not find directory ' + ResultsDir)
 
+Plan = BuildPlan(ResultsDir, sys.argv[0], DryRun, Force)
+Deps = [os.path.join(ResultsDir, FNREJECTMASK % (l,t)) \
+        for l in LEVELS for t in TESTS]
+Deps.extend([os.path.join(ResultsDir, FNTRUEBOUNDS),
+             os.path.join(ResultsDir, FNTESTPOINTS),
+             os.path.join(CodeDir, FNVIEWTEMPLATE)])
+if not Plan.stale(FNOUT, Deps):
+    Plan.finish()
+    sys.exit()
+
 # Load data
+# Points that were dropped in a sequential Monte Carlo are NaN after they
+# were dropped, so each point has its own number of replications.
 RejectProb = {}
+RejectSE = {}
 for l in LEVELS:
     for t in TESTS:
         fn = os.path.join(ResultsDir, FNREJECTMASK % (l,t))
-        R = np.loadtxt(fn)
-        RejectProb[l,t] = R.mean(axis=0)
+        R = np.loadtxt(fn, ndmin=2)
+        M = np.sum(~np.isnan(R), axis=0)
+        RejectProb[l,t] = np.nanmean(R, axis=0)
+        RejectSE[l,t] = np.sqrt(RejectProb[l,t]*(1 - RejectProb[l,t])/M)
 
 TrueBounds = np.loadtxt(os.path.join(ResultsDir, FNTRUEBOUNDS), usecols=(1,2))
 TestPoints = np.loadtxt(os.path.join(ResultsDir, FNTESTPOINTS))
@@ -63,7 +81,7 @@ for l in LEVELS:
     firsttest = True
     for t in TESTS:
         if firsttest:
-            row[0] = ('\multirow{%d' % len(TESTS)) + \
+            row[0] = ('\multirow{%d' % (2*len(TESTS))) + \
                      '}{*}{' + ('%.2f' % (.01*l)).lstrip('0') + '}'
             firsttest = False
         else:
@@ -72,8 +90,16 @@ for l in LEVELS:
         row[2:] = [formatNum(p) for p in RejectProb[l,t]]
         writeRow(fout, row)
 
+        # Monte Carlo standard errors
+        row[0:2] = ['', '']
+        row[2:] = ['(' + formatNum(se, SEFONTSIZE) + ')' \
+                   for se in RejectSE[l,t]]
+        writeRow(fout, row)
+
 insertBottomRule(fout)
 endTable(fout)
 
 createTableViewerAndCompile(os.path.join(CodeDir, FNVIEWTEMPLATE),
                             FNOUT, ResultsDir)
+Plan.done(FNOUT)
+Plan.finish()
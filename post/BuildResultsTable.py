@@ -17,6 +17,7 @@ from shutil import copyfile
 
 from TableTools import *
 from StatedepTools import *
+from BuildTools import *
 
 ################################################################################
 # HARDCODED VARIABLES
@@ -64,15 +65,17 @@ ASSUMPTIONFORMAT = dict(( \
 
 ################################################################################
 CodeDir = os.path.dirname(os.path.abspath(sys.argv[0]))
-ResultsDir = os.path.abspath(sys.argv[1])
+(Args, DryRun, Force) = parseBuildArgs(sys.argv)
+ResultsDir = os.path.abspath(Args[0])
 if not os.path.isdir(ResultsDir):
     print ('Could not find directory ' + ResultsDir)
 
 SimNames = getSimNames(ResultsDir)
-copyfile(os.path.join(CodeDir, FNVIEWTEMPLATE),
-         os.path.join(ResultsDir, FNVIEWTEMPLATE))
-
-fout = open(os.path.join(ResultsDir, FNOUT), 'w')
+Plan = BuildPlan(ResultsDir, sys.argv[0], DryRun, Force)
+if Plan.stale(FNVIEWTEMPLATE, [os.path.join(CodeDir, FNVIEWTEMPLATE)]):
+    copyfile(os.path.join(CodeDir, FNVIEWTEMPLATE),
+             os.path.join(ResultsDir, FNVIEWTEMPLATE))
+    Plan.done(FNVIEWTEMPLATE)
 
 #%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
 # Column spec
@@ -101,217 +104,237 @@ FileListAssumptions = [os.path.join(ResultsDir, SimNames[d], \
 assert(len(FileListBounds) == len(FileListAssumptions))
 assumptions = createDataFrame(FileListAssumptions)
 
-# Left align for row labels
-colspec = 'l' + len(lb.columns)*'c'
-numcols = len(colspec)
-startTable(fout, colspec)
-insertTopRule(fout)
-
-# For each simulation determine if its pdbr or not
-ListPDBR = [os.path.isfile(os.path.join(ResultsDir, SimNames[d], FNPDBR)) \
-        for d in range(0,len(SimNames))]
-# Make sure PDBR's come at the end
-for i in range(1,len(ListPDBR)):
-    assert(not(ListPDBR[i-1] and not ListPDBR[i]))
-
-################################################################################
-# Column header
-################################################################################
-row = 2*['']
-row[0] = '\t'
-# sim types
-row[1] = '\multicolumn{%d}{c}{\\textbf{DPO}}' % (len(ListPDBR) - sum(ListPDBR))
-if sum(ListPDBR) > 0:
-    row.append('\multicolumn{%d}{c}{\\textbf{PDBR}}' % sum(ListPDBR))
-writeRow(fout, row)
-
-# dividing lines
-insertCMidRule(fout, 2, (len(ListPDBR) - sum(ListPDBR)) + 1, 'lr')
-if sum(ListPDBR) > 0:
-    insertCMidRule(fout, (len(ListPDBR) - sum(ListPDBR)) + 2, numcols, 'l')
-
-# numbers
-row = numcols*['']
-for i in range(0, len(lb.columns)):
-    row[1+i] = '(' + lb.columns[i].lstrip('0') + ')'
-    row[1+i] = '\\textbf{' + row[1+i] + '}'
-
-writeRow(fout, row)
-
-
-################################################################################
-# Assumptions
-################################################################################
-insertMidRule(fout)
-subtitlerow = generateSubTitleRow(numcols, 'Assumptions')
-writeRow(fout, subtitlerow)
-insertMidRule(fout)
-
-for a in ASSUMPTIONLABEL.keys():
-    if a in assumptions.index and any(assumptions.loc[a,:].values > 0):
-        row[0] = ASSUMPTIONLABEL[a]
-        datastring = assumptions.loc[a,:].values
-        f = ASSUMPTIONFORMAT.get(a)
-        for i in range(0,len(datastring)):
-            row[1 + i] = f(datastring[i])
-        writeRow(fout, row)
-
-#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
-# Specification
-#%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
-insertMidRule(fout)
-subtitlerow = generateSubTitleRow(numcols, 'Misspecification')
-writeRow(fout, subtitlerow)
-insertMidRule(fout)
-
-FileListMinCriterion = [os.path.join(ResultsDir, SimNames[d], \
-    FNMINCRITERION) for d in range(0,len(SimNames))]
-assert(len(FileListBounds) == len(FileListMinCriterion))
-mincrit = createDataFrame(FileListMinCriterion)
-toprow = ['$\Theta^{\star} = \emptyset$']
-for (pos, i) in enumerate(mincrit.iloc[0,:].values):
-    s = '\multirow{2}{*}{'
-    if ListPDBR[pos]:
-        s = s + ''
-    else:
-        if i <= 0:
-            s = s + 'No'
+# Everything the table depends on, so it is only rebuilt when one of these
+# files changed (e.g. a single SimNum finished)
+ResultDeps = []
+for s in SimNames:
+    ResultDeps.extend([os.path.join(ResultsDir, s, f) for f in \
+        [FNBOUNDS, FNCRBOUNDS, FNASSUMPTIONS, FNMINCRITERION, \
+         FNMISSPECIFICATION, FNPDBR]])
+TableDeps = [os.path.join(CodeDir, FNVIEWTEMPLATE)] + ResultDeps
+
+if Plan.stale(FNOUT, TableDeps):
+    fout = open(os.path.join(ResultsDir, FNOUT), 'w')
+
+    # Left align for row labels
+    colspec = 'l' + len(lb.columns)*'c'
+    numcols = len(colspec)
+    startTable(fout, colspec)
+    insertTopRule(fout)
+
+    # For each simulation determine if its pdbr or not
+    ListPDBR = [os.path.isfile(os.path.join(ResultsDir, SimNames[d], FNPDBR)) \
+            for d in range(0,len(SimNames))]
+    # Make sure PDBR's come at the end
+    for i in range(1,len(ListPDBR)):
+        assert(not(ListPDBR[i-1] and not ListPDBR[i]))
+
+    ################################################################################
+    # Column header
+    ################################################################################
+    row = 2*['']
+    row[0] = '\t'
+    # sim types
+    row[1] = '\multicolumn{%d}{c}{\\textbf{DPO}}' % (len(ListPDBR) - sum(ListPDBR))
+    if sum(ListPDBR) > 0:
+        row.append('\multicolumn{%d}{c}{\\textbf{PDBR}}' % sum(ListPDBR))
+    writeRow(fout, row)
+
+    # dividing lines
+    insertCMidRule(fout, 2, (len(ListPDBR) - sum(ListPDBR)) + 1, 'lr')
+    if sum(ListPDBR) > 0:
+        insertCMidRule(fout, (len(ListPDBR) - sum(ListPDBR)) + 2, numcols, 'l')
+
+    # numbers
+    row = numcols*['']
+    for i in range(0, len(lb.columns)):
+        row[1+i] = '(' + lb.columns[i].lstrip('0') + ')'
+        row[1+i] = '\\textbf{' + row[1+i] + '}'
+
+    writeRow(fout, row)
+
+
+    ################################################################################
+    # Assumptions
+    ################################################################################
+    insertMidRule(fout)
+    subtitlerow = generateSubTitleRow(numcols, 'Assumptions')
+    writeRow(fout, subtitlerow)
+    insertMidRule(fout)
+
+    for a in ASSUMPTIONLABEL.keys():
+        if a in assumptions.index and any(assumptions.loc[a,:].values > 0):
+            row[0] = ASSUMPTIONLABEL[a]
+            datastring = assumptions.loc[a,:].values
+            f = ASSUMPTIONFORMAT.get(a)
+            for i in range(0,len(datastring)):
+                row[1 + i] = f(datastring[i])
+            writeRow(fout, row)
+
+    #%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+    # Specification
+    #%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+    insertMidRule(fout)
+    subtitlerow = generateSubTitleRow(numcols, 'Misspecification')
+    writeRow(fout, subtitlerow)
+    insertMidRule(fout)
+
+    FileListMinCriterion = [os.path.join(ResultsDir, SimNames[d], \
+        FNMINCRITERION) for d in range(0,len(SimNames))]
+    assert(len(FileListBounds) == len(FileListMinCriterion))
+    mincrit = createDataFrame(FileListMinCriterion)
+    toprow = ['$\Theta^{\star} = \emptyset$']
+    for (pos, i) in enumerate(mincrit.iloc[0,:].values):
+        s = '\multirow{2}{*}{'
+        if ListPDBR[pos]:
+            s = s + ''
         else:
-            s = s + 'Yes'
-    s = s + '}'
-    toprow.extend([s])
-writeRow(fout, toprow)
-bottomrow = ['in sample']
-bottomrow.extend(['' for i in mincrit.iloc[0,:].values])
-writeRow(fout, bottomrow, SKIPPT=5)
-
-try:
-    FileListMisspecification = [os.path.join(ResultsDir, SimNames[d], \
-        FNMISSPECIFICATION) for d in range(0,len(SimNames))]
-    assert(len(FileListBounds) == len(FileListMisspecification))
-    misspec = createDataFrame(FileListMisspecification)
-except:
-    misspec = mincrit.copy(deep=True)
-    misspec[:] = float('nan')
-
-toprow = ['p-value for']
-for (pos, i) in enumerate(misspec.iloc[0,:].values):
-    if i < 1 and not ListPDBR[pos]:
-        s = formatNum(i)
-    else:
-        s = ''
-    toprow.extend(['\multirow{2}{*}{' + s + '}'])
-writeRow(fout, toprow)
-bottomrow = ['$H_{0}: \Theta^{\star} \\neq \emptyset$']
-bottomrow.extend(['' for i in misspec.iloc[0,:].values])
-writeRow(fout, bottomrow)
-
-################################################################################
-# Bounds
-################################################################################
-insertMidRule(fout)
-if FlagCR:
-    s = 'Bounds and 95\% Confidence Intervals'
-else:
-    s = 'Bounds'
-subtitlerow = generateSubTitleRow(numcols, s)
-writeRow(fout, subtitlerow)
-insertMidRule(fout)
-
-first = True
-
-for p in PARAMUNIVERSE.keys():
-    if p in lb.index:
-        if first:
-            first = False
+            if i <= 0:
+                s = s + 'No'
+            else:
+                s = s + 'Yes'
+        s = s + '}'
+        toprow.extend([s])
+    writeRow(fout, toprow)
+    bottomrow = ['in sample']
+    bottomrow.extend(['' for i in mincrit.iloc[0,:].values])
+    writeRow(fout, bottomrow, SKIPPT=5)
+
+    try:
+        FileListMisspecification = [os.path.join(ResultsDir, SimNames[d], \
+            FNMISSPECIFICATION) for d in range(0,len(SimNames))]
+        assert(len(FileListBounds) == len(FileListMisspecification))
+        misspec = createDataFrame(FileListMisspecification)
+    except:
+        misspec = mincrit.copy(deep=True)
+        misspec[:] = float('nan')
+
+    toprow = ['p-value for']
+    for (pos, i) in enumerate(misspec.iloc[0,:].values):
+        if i < 1 and not ListPDBR[pos]:
+            s = formatNum(i)
         else:
-            insertCMidRule(fout, 2, numcols, 'l')
+            s = ''
+        toprow.extend(['\multirow{2}{*}{' + s + '}'])
+    writeRow(fout, toprow)
+    bottomrow = ['$H_{0}: \Theta^{\star} \\neq \emptyset$']
+    bottomrow.extend(['' for i in misspec.iloc[0,:].values])
+    writeRow(fout, bottomrow)
+
+    ################################################################################
+    # Bounds
+    ################################################################################
+    insertMidRule(fout)
+    if FlagCR:
+        s = 'Bounds and 95\% Confidence Intervals'
+    else:
+        s = 'Bounds'
+    subtitlerow = generateSubTitleRow(numcols, s)
+    writeRow(fout, subtitlerow)
+    insertMidRule(fout)
 
-        rowcrlb = numcols*['']
-        rowlb = numcols*['']
-        rowub = numcols*['']
-        rowcrub = numcols*['']
+    first = True
 
-        if FlagCR:
-            rowcrlb[0] = '\t\multirow{4}{*}{' + PARAMUNIVERSE[p] + '}'
-        else:
-            rowlb[0] = '\t\multirow{2}{*}{' + PARAMUNIVERSE[p] + '}'
-
-        crlbp = (crlb.loc[p,:].values).astype(numpy.float)
-        crubp = (crub.loc[p,:].values).astype(numpy.float)
-        lbp = (lb.loc[p,:].values).astype(numpy.float)
-        ubp = (ub.loc[p,:].values).astype(numpy.float)
-
-        pointid = [     (numpy.isfinite(lbp[i])) \
-                    and (ubp[i] - lbp[i] == 0) \
-                    for i in range(0,len(lbp))]
-
-        for i in range(0,len(lbp)):
-            if not pointid[i]:
-                rowcrlb[1+i] = formatNum(crlbp[i], CRFONTSIZE)
-                rowlb[1+i] = formatNum(lbp[i])
-                rowub[1+i] = formatNum(ubp[i])
-                rowcrub[1+i] = formatNum(crubp[i], CRFONTSIZE)
-            elif pointid[i]:
-                rowcrlb[1+i] = formatNum(crlbp[i], CRFONTSIZE)
-                rowlb[1+i] = '\multirow{2}{*}{' + formatNum(lbp[i]) + '}'
-                rowcrub[1+i] = formatNum(crubp[i], CRFONTSIZE)
+    for p in PARAMUNIVERSE.keys():
+        if p in lb.index:
+            if first:
+                first = False
             else:
-                rowlb[1+i] = '---'
+                insertCMidRule(fout, 2, numcols, 'l')
 
-        if FlagCR:
-            writeRow(fout, rowcrlb)
-        writeRow(fout, rowlb)
-        writeRow(fout, rowub)
-        if FlagCR:
-            writeRow(fout, rowcrub)
+            rowcrlb = numcols*['']
+            rowlb = numcols*['']
+            rowub = numcols*['']
+            rowcrub = numcols*['']
 
-insertBottomRule(fout)
-endTable(fout)
-fout.close()
-createTableViewerAndCompile(os.path.join(CodeDir, FNVIEWTEMPLATE),
-                            FNOUT, ResultsDir)
+            if FlagCR:
+                rowcrlb[0] = '\t\multirow{4}{*}{' + PARAMUNIVERSE[p] + '}'
+            else:
+                rowlb[0] = '\t\multirow{2}{*}{' + PARAMUNIVERSE[p] + '}'
+
+            crlbp = (crlb.loc[p,:].values).astype(numpy.float)
+            crubp = (crub.loc[p,:].values).astype(numpy.float)
+            lbp = (lb.loc[p,:].values).astype(numpy.float)
+            ubp = (ub.loc[p,:].values).astype(numpy.float)
+
+            pointid = [     (numpy.isfinite(lbp[i])) \
+                        and (ubp[i] - lbp[i] == 0) \
+                        for i in range(0,len(lbp))]
+
+            for i in range(0,len(lbp)):
+                if not pointid[i]:
+                    rowcrlb[1+i] = formatNum(crlbp[i], CRFONTSIZE)
+                    rowlb[1+i] = formatNum(lbp[i])
+                    rowub[1+i] = formatNum(ubp[i])
+                    rowcrub[1+i] = formatNum(crubp[i], CRFONTSIZE)
+                elif pointid[i]:
+                    rowcrlb[1+i] = formatNum(crlbp[i], CRFONTSIZE)
+                    rowlb[1+i] = '\multirow{2}{*}{' + formatNum(lbp[i]) + '}'
+                    rowcrub[1+i] = formatNum(crubp[i], CRFONTSIZE)
+                else:
+                    rowlb[1+i] = '---'
+
+            if FlagCR:
+                writeRow(fout, rowcrlb)
+            writeRow(fout, rowlb)
+            writeRow(fout, rowub)
+            if FlagCR:
+                writeRow(fout, rowcrub)
+
+    insertBottomRule(fout)
+    endTable(fout)
+    fout.close()
+    createTableViewerAndCompile(os.path.join(CodeDir, FNVIEWTEMPLATE),
+                                FNOUT, ResultsDir)
+    Plan.done(FNOUT)
 
 #%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
 # Compile plots if multiple sigma estimates in this set
 #%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
 if any(assumptions.loc['SigmaST',:].values > 0):
-    order = assumptions.columns.argsort()
-
-    with open(os.path.join(ResultsDir, 'BoundsSigma.csv'), mode='w') as outf:
-        outfwriter = csv.writer(outf, delimiter=',')
+    # Order by sigma rather than by SimNum, since points added later by
+    # PlanSigmaGrid.py get higher SimNums
+    order = assumptions.loc['SigmaST',:].values.argsort()
 
-        headerrow = ['Sigma']
-        for p in lb.index:
-            headerrow.extend([p + ' LB', p + ' UB'])
-        outfwriter.writerow(headerrow)
+    if Plan.stale('BoundsSigma.csv', ResultDeps):
+        with open(os.path.join(ResultsDir, 'BoundsSigma.csv'), mode='w') \
+                as outf:
+            outfwriter = csv.writer(outf, delimiter=',')
 
-        # for r in lb.columns:
-        for r in order:
-            datarow = []
-            datarow.append(assumptions.ix['SigmaST', r])
+            headerrow = ['Sigma']
             for p in lb.index:
-                datarow.extend([lb.ix[p,r], ub.ix[p,r]])
-            outfwriter.writerow(datarow)
+                headerrow.extend([p + ' LB', p + ' UB'])
+            outfwriter.writerow(headerrow)
+
+            # for r in lb.columns:
+            for r in order:
+                datarow = []
+                datarow.append(assumptions.ix['SigmaST', r])
+                for p in lb.index:
+                    datarow.extend([lb.ix[p,r], ub.ix[p,r]])
+                outfwriter.writerow(datarow)
+        Plan.done('BoundsSigma.csv')
 
     # reader = csv.reader(open(os.path.join(ResultsDir, 'BoundsSigma.csv')),
                         # delimiter=',')
     # sortedreader = sorted(reader, key=operator.itemgetter(0))
 
-    with open(os.path.join(ResultsDir, 'CIsSigma.csv'), mode='w') as outf:
-        outfwriter = csv.writer(outf, delimiter=',')
+    if Plan.stale('CIsSigma.csv', ResultDeps):
+        with open(os.path.join(ResultsDir, 'CIsSigma.csv'), mode='w') as outf:
+            outfwriter = csv.writer(outf, delimiter=',')
 
-        headerrow = ['Sigma']
-        for p in crlb.index:
-            headerrow.extend([p + ' LB', p + ' UB'])
-        outfwriter.writerow(headerrow)
-
-        for r in order:
-            datarow = []
-            datarow.append(assumptions.ix['SigmaST', r])
+            headerrow = ['Sigma']
             for p in crlb.index:
-                datarow.extend([crlb.ix[p,r], crub.ix[p,r]])
-            outfwriter.writerow(datarow)
+                headerrow.extend([p + ' LB', p + ' UB'])
+            outfwriter.writerow(headerrow)
+
+            for r in order:
+                datarow = []
+                datarow.append(assumptions.ix['SigmaST', r])
+                for p in crlb.index:
+                    datarow.extend([crlb.ix[p,r], crub.ix[p,r]])
+                outfwriter.writerow(datarow)
+        Plan.done('CIsSigma.csv')
 
     # Initialize Jinja templating
     latex_jinja_env = jinja2.Environment(
@@ -323,7 +346,7 @@ if any(assumptions.loc['SigmaST',:].values > 0):
             comment_end_string = '}',
             trim_blocks = True,
             autoescape = False,
-            loader = jinja2.FileSystemLoader(os.path.abspath('.'))
+            loader = jinja2.FileSystemLoader(CodeDir)
     )
     templatesigma = latex_jinja_env.get_template(FNTEMPLATESIGMA)
 
@@ -337,6 +360,14 @@ if any(assumptions.loc['SigmaST',:].values > 0):
         c['parameter'] = PARAMUNIVERSE[p]
 
         fn = 'SigmaPlot' + p + '.tex'
+        # The results are included so that a dry run sees a change in the
+        # csv files before they are rewritten
+        PlotDeps = [os.path.join(ResultsDir, 'BoundsSigma.csv'),
+                    os.path.join(ResultsDir, 'CIsSigma.csv'),
+                    os.path.join(CodeDir, FNTEMPLATESIGMA)] + ResultDeps
+        if not Plan.stale(os.path.splitext(fn)[0] + '.pdf', PlotDeps):
+            continue
+
         with open(os.path.join(ResultsDir, fn), 'w') as f:
             f.write(templatesigma.render(c))
 
@@ -344,3 +375,6 @@ if any(assumptions.loc['SigmaST',:].values > 0):
         os.chdir(ResultsDir)
         callLatexQuietly(fn)
         os.chdir(cwd)
+        Plan.done(os.path.splitext(fn)[0] + '.pdf')
+
+Plan.finish()
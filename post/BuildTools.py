@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+#coding=utf-8
+
+import os
+import sys
+import json
+import hashlib
+
+################################################################################
+# HARDCODING
+################################################################################
+FNMANIFEST = '.BuildManifest.json'
+HASHBLOCKSIZE = 2**20
+
+################################################################################
+# Dependency tracking for the table and plot builders
+#
+# Every output (a .tex table, a plot, ...) is recorded in a manifest that lives
+# in the directory the builder writes to.  For each output the manifest holds a
+# single hash that summarizes the contents of all of its dependencies: the
+# result files it reads, the templates it renders and the source of the
+# builder itself.  An output is rebuilt only if it is missing or if this hash
+# has changed since the last time it was built.
+################################################################################
+def parseBuildArgs(argv):
+    # Split command line arguments into positional arguments and flags.
+    #   --dry-run   report what would be rebuilt, but do not build anything
+    #   --force     rebuild everything regardless of the manifest
+    args = [a for a in argv[1:] if not a.startswith('--')]
+    flags = [a for a in argv[1:] if a.startswith('--')]
+    for f in flags:
+        if f not in ('--dry-run', '--force'):
+            print ('Unrecognized option ' + f)
+            sys.exit()
+    return (args, '--dry-run' in flags, '--force' in flags)
+
+def hashFile(fn, h=None):
+    if h is None:
+        h = hashlib.sha1()
+    with open(fn, 'rb') as f:
+        block = f.read(HASHBLOCKSIZE)
+        while block:
+            h.update(block)
+            block = f.read(HASHBLOCKSIZE)
+    return h
+
+def hashDependencies(deps):
+    # Missing files hash differently from empty files, and the file name is
+    # part of the hash so that renaming a dependency triggers a rebuild.
+    h = hashlib.sha1()
+    for d in sorted(set(os.path.abspath(d) for d in deps)):
+        h.update(d.encode('utf-8'))
+        if os.path.isfile(d):
+            h.update(b'\x01')
+            hashFile(d, h)
+        else:
+            h.update(b'\x00')
+    return h.hexdigest()
+
+def builderDependencies(builder):
+    # The builder "version" is the source of the builder plus the shared
+    # modules it imports, so that editing any of them triggers a rebuild.
+    codedir = os.path.dirname(os.path.abspath(builder))
+    return [os.path.abspath(builder),
+            os.path.join(codedir, 'TableTools.py'),
+            os.path.join(codedir, 'StatedepTools.py'),
+            os.path.join(codedir, 'BuildTools.py')]
+
+def loadManifest(dirname):
+    fn = os.path.join(dirname, FNMANIFEST)
+    if not os.path.isfile(fn):
+        return {}
+    try:
+        with open(fn, 'r') as f:
+            return json.load(f)
+    except ValueError:
+        print ('Could not parse ' + fn + ', so rebuilding everything.')
+        return {}
+
+def saveManifest(dirname, manifest):
+    fn = os.path.join(dirname, FNMANIFEST)
+    with open(fn + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(fn + '.tmp', fn)
+
+class BuildPlan:
+    # Keeps track of which outputs of one builder need to be regenerated.
+    #
+    # Typical use:
+    #   plan = BuildPlan(ResultsDir, sys.argv[0], DryRun, Force)
+    #   if plan.stale('TableResults.tex', deps):
+    #       ... build the table ...
+    #       plan.done('TableResults.tex')
+    #   plan.finish()
+    def __init__(self, dirname, builder, dryrun=False, force=False):
+        self.dirname = dirname
+        self.dryrun = dryrun
+        self.force = force
+        self.builderdeps = builderDependencies(builder)
+        self.manifest = loadManifest(dirname)
+        self.pending = {}
+        self.rebuilt = []
+        self.skipped = []
+
+    def stale(self, output, deps):
+        digest = hashDependencies(list(deps) + self.builderdeps)
+        self.pending[output] = digest
+        isstale = (   self.force \
+                   or self.manifest.get(output) != digest \
+                   or not os.path.exists(os.path.join(self.dirname, output)))
+        if isstale:
+            self.rebuilt.append(output)
+        else:
+            self.skipped.append(output)
+        if self.dryrun:
+            return False
+        return isstale
+
+    def done(self, output):
+        self.manifest[output] = self.pending[output]
+        saveManifest(self.dirname, self.manifest)
+
+    def finish(self):
+        if self.dryrun:
+            print ('Dry run in ' + self.dirname + ':')
+            for o in self.rebuilt:
+                print ('\twould rebuild ' + o)
+            for o in self.skipped:
+                print ('\tup to date    ' + o)
+        elif self.skipped:
+            print ('Skipped %d up-to-date output(s) in %s.' \
+                   % (len(self.skipped), self.dirname))
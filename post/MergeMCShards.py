@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+#coding=utf-8
+
+import sys
+import os
+import re
+import argparse
+import numpy as np
+
+from StatedepTools import *
+
+################################################################################
+# HARD-CODING
+################################################################################
+SHARDPATTERN = re.compile(r'^shard\d+$')
+FNSHARD = 'Shard.out'
+FNREPLICATIONS = 'Replications.out'
+FNREJPROBPATTERN = re.compile(r'^RejProb_(A\d+_\w+)\.out$')
+FNREJECTPATTERN = re.compile(r'^Reject_A\d+_(\w+)\.out$')
+FNPVALUE = 'PValue.out' # One line per test for each replication
+SAMEFILES = [FNTRUEBOUNDS, FNTESTPOINTS] # Identical in every shard
+HEADERFILES = [FNLB, FNUB] # First line is a header
+PRINTCOLS = 8 # MCSettings.PrintCols in MonteCarlo.m
+
+################################################################################
+# Merge the shards of a Monte Carlo study (see RunMonteCarlo.m)
+#
+# Every directory under the directories passed that has shard<k>
+# subdirectories is merged: the rows that each shard wrote for its
+# replications are put in replication order and written to that directory
+# under the same file names, so the table builders can be run on it as if the
+# study had been run by one process.
+# The running rejection probabilities (RejProb_*.out) are recomputed from the
+# rejections (Reject_*.out), since each shard only has its own.
+#
+# Each replication has one row in every file, except PValue.out, which has one
+# row for each test (the tests are the ones in the names of Reject_*.out).
+# A shard that is still running (or stopped) may also have the rows of one
+# replication that is not in Replications.out yet; these are left out.
+#
+# Nothing is written for a directory if a replication is missing or run by
+# more than one shard, if a shard is missing Shard.out or Replications.out,
+# if the number of rows in some file does not match the replications, or if
+# the shards do not agree on TrueBounds.out and TestPoints.out (e.g. they were
+# run with different settings).
+################################################################################
+class ShardError(Exception):
+    pass
+
+def readLines(fn):
+    with open(fn, 'r') as f:
+        return f.read().splitlines()
+
+def readShard(shardDir):
+    try:
+        (firstm, lastm, m) = [int(x) for x in \
+            readLines(os.path.join(shardDir, FNSHARD))[0].split()]
+        reps = [int(x) for x in \
+                readLines(os.path.join(shardDir, FNREPLICATIONS)) \
+                if x.strip()]
+    except (IOError, OSError):
+        raise ShardError('%s has no %s or %s; was it run as a shard?' \
+                         % (shardDir, FNSHARD, FNREPLICATIONS))
+    except (IndexError, ValueError):
+        raise ShardError('Could not read %s or %s in %s.' \
+                         % (FNSHARD, FNREPLICATIONS, shardDir))
+    return {'dir': shardDir, 'range': (firstm, lastm), 'M': m, 'reps': reps}
+
+def checkReplications(shards):
+    Ms = set(s['M'] for s in shards)
+    if len(Ms) > 1:
+        raise ShardError('Shards are from studies with different M: %s' \
+                         % sorted(Ms))
+    M = Ms.pop()
+
+    owner = {}
+    for s in shards:
+        for m in s['reps']:
+            if m in owner:
+                raise ShardError('Replication %d is in both %s and %s.' \
+                                 % (m, owner[m], s['dir']))
+            owner[m] = s['dir']
+    missing = sorted(set(range(1, M + 1)) - set(owner))
+    if missing:
+        raise ShardError('%d of %d replications are missing: %s' \
+                         % (len(missing), M, formatRanges(missing)))
+
+def formatRanges(ms):
+    ranges = []
+    for m in ms:
+        if ranges and (m == ranges[-1][1] + 1):
+            ranges[-1][1] = m
+        else:
+            ranges.append([m, m])
+    return ', '.join(('%d' % a) if a == b else ('%d-%d' % (a, b)) \
+                     for (a, b) in ranges)
+
+def mergeRows(shards, fn, perRep=1):
+    # Rows of fn from every shard, in replication order, where each
+    # replication has perRep rows
+    header = None
+    rows = []
+    for s in shards:
+        lines = readLines(os.path.join(s['dir'], fn))
+        if fn in HEADERFILES:
+            if (header is not None) and (lines[0] != header):
+                raise ShardError('Headers of %s differ across shards.' % fn)
+            (header, lines) = (lines[0], lines[1:])
+        extra = len(lines) - perRep*len(s['reps'])
+        if not (0 <= extra <= perRep):
+            raise ShardError('%s in %s has %d rows for %d replications '
+                             '(expected %d per replication).' \
+                             % (fn, s['dir'], len(lines), len(s['reps']),
+                                perRep))
+        for (i, m) in enumerate(s['reps']):
+            rows.append((m, lines[perRep*i:perRep*(i + 1)]))
+    rows.sort(key=lambda r: r[0])
+    return ([] if header is None else [header]) \
+           + [l for r in rows for l in r[1]]
+
+def runningRejProb(rejectLines):
+    # Same as RejCount./RejM in MonteCarlo.m, with NaN for dropped points
+    R = np.loadtxt(rejectLines, ndmin=2)
+    count = np.nancumsum(R, axis=0)
+    m = np.cumsum(~np.isnan(R), axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        P = count/m
+    fmt = ' %%%d.%df' % (PRINTCOLS, PRINTCOLS - 3)
+    return [''.join((fmt % p).replace('nan', 'NaN') for p in row) \
+            for row in P]
+
+def mergeDirectory(dirname, shardDirs, dryRun):
+    shards = [readShard(d) for d in shardDirs]
+    checkReplications(shards)
+
+    names = sorted(set.union(*[set(os.listdir(s['dir'])) for s in shards]))
+    tests = set(FNREJECTPATTERN.match(fn).group(1) for fn in names \
+                if FNREJECTPATTERN.match(fn))
+    merged = {}
+    for fn in names:
+        if fn in (FNSHARD, FNREPLICATIONS) or FNREJPROBPATTERN.match(fn):
+            continue
+        missing = [s['dir'] for s in shards \
+                   if not os.path.isfile(os.path.join(s['dir'], fn))]
+        if missing:
+            raise ShardError('%s is missing from %s.' \
+                             % (fn, ', '.join(missing)))
+        if fn in SAMEFILES:
+            contents = set(tuple(readLines(os.path.join(s['dir'], fn))) \
+                           for s in shards)
+            if len(contents) > 1:
+                raise ShardError('%s differs across shards.' % fn)
+            merged[fn] = list(contents.pop())
+        elif fn == FNPVALUE:
+            merged[fn] = mergeRows(shards, fn, max(len(tests), 1))
+        elif fn.endswith('.out'):
+            merged[fn] = mergeRows(shards, fn)
+
+    for fn in list(merged):
+        if fn.startswith('Reject_'):
+            rejprob = 'RejProb_' + fn[len('Reject_'):]
+            merged[rejprob] = runningRejProb(merged[fn])
+
+    M = shards[0]['M']
+    print ('%s: merging %d shards with %d replications into %d files.' \
+           % (dirname, len(shards), M, len(merged)))
+    if dryRun:
+        return
+    for (fn, lines) in sorted(merged.items()):
+        with open(os.path.join(dirname, fn), 'w') as f:
+            f.write(''.join(l + '\n' for l in lines))
+
+def findShardedDirectories(root):
+    for (dirname, subdirs, _) in os.walk(root):
+        shardDirs = sorted(os.path.join(dirname, d) for d in subdirs \
+                           if SHARDPATTERN.match(d))
+        if shardDirs:
+            subdirs[:] = [d for d in subdirs if not SHARDPATTERN.match(d)]
+            yield (dirname, shardDirs)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Merge the shards of Monte Carlo studies.')
+    parser.add_argument('dirs', nargs='+',
+                        help='directories to search for shards')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='check the shards without writing anything')
+    args = parser.parse_args()
+
+    found = False
+    failed = False
+    for root in args.dirs:
+        for (dirname, shardDirs) in findShardedDirectories(root):
+            found = True
+            try:
+                mergeDirectory(dirname, shardDirs, args.dry_run)
+            except ShardError as e:
+                print ('%s: not merged. %s' % (dirname, e))
+                failed = True
+    if not found:
+        print ('No shards found in ' + ', '.join(args.dirs))
+    if failed or not found:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
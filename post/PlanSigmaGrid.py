@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+#coding=utf-8
+
+import sys
+import os
+import csv
+import math
+import argparse
+
+from TableTools import getSimNames
+
+################################################################################
+# HARD-CODING
+################################################################################
+FNBOUNDSSIGMA = 'BoundsSigma.csv'
+FNCISSIGMA = 'CIsSigma.csv'
+FNPLAN = 'SigmaPlan.csv'
+PINTOL = 1e-3 # Changes smaller than this are treated as no change
+MINSPACING = .0125 # Do not propose points closer together than this
+NUMPROPOSALS = 4
+SIGMADIGITS = 4
+
+################################################################################
+# Propose the next SigmaST values to run for a sensitivity analysis.
+#
+# Reads BoundsSigma.csv and CIsSigma.csv (written by BuildResultsTable.py) and
+# looks at each interval between two completed sigma values:
+#
+#   - The estimated lower bounds are non-increasing in sigma and the upper
+#     bounds are non-decreasing, since a larger sigma only relaxes ST.
+#     So if no bound moves across an interval, every sigma inside it has the
+#     same bounds.  The confidence intervals need not be monotone in sigma,
+#     so such an interval is only skipped if the confidence intervals at its
+#     ends are also the same (or were not computed); otherwise it is ranked
+#     after every interval in which a bound moves, so that the confidence
+#     intervals inside it are still checked.
+#   - Intervals in which some endpoint crosses a threshold of interest
+#     (e.g. the lower end of a confidence interval crossing 0) are proposed
+#     first, since they bracket where the qualitative conclusion changes.
+#   - The remaining intervals are ranked by how much the endpoints move.
+#
+# The midpoint of each selected interval is proposed.
+################################################################################
+def readSigmaFile(fn):
+    with open(fn, 'r') as f:
+        reader = csv.reader(f, delimiter=',')
+        header = next(reader)
+        rows = [[float(x) if x not in ('', 'nan') else float('nan') \
+                 for x in r] for r in reader if r]
+    data = {}
+    for r in rows:
+        if r[0] < 0: # Not a sigma specification (no ST)
+            continue
+        data[round(r[0], SIGMADIGITS)] = dict(zip(header[1:], r[1:]))
+    return data
+
+def crossesThreshold(v0, v1, threshold):
+    if math.isnan(v0) or math.isnan(v1):
+        return False
+    return (v0 - threshold)*(v1 - threshold) < 0
+
+def scoreIntervals(columns, threshold):
+    # columns is a dict of {column name: {sigma: value}}, where the names of
+    # the columns for the bounds start with 'bounds '
+    sigmas = sorted(set.intersection(*[set(c.keys()) \
+                                       for c in columns.values()]))
+    intervals = []
+    for (s0, s1) in zip(sigmas[:-1], sigmas[1:]):
+        if (s1 - s0) < 2*MINSPACING:
+            continue
+        change = 0
+        boundschange = 0
+        crossing = []
+        for (name, c) in columns.items():
+            if math.isnan(c[s0]) or math.isnan(c[s1]):
+                continue
+            change = max(change, abs(c[s1] - c[s0]))
+            if name.startswith('bounds '):
+                boundschange = max(boundschange, abs(c[s1] - c[s0]))
+            if (threshold is not None) \
+                    and crossesThreshold(c[s0], c[s1], threshold):
+                crossing.append(name)
+        pinned = (boundschange <= PINTOL)
+        if pinned and (change <= PINTOL) and not crossing:
+            continue # bounds pinned down by monotonicity, and CIs the same
+        intervals.append((s0, s1, change, crossing, pinned))
+
+    # Threshold crossings first, then intervals in which a bound moves, then
+    # by size of the change
+    intervals.sort(key=lambda i: (len(i[3]) == 0, i[4], -i[2]))
+    return intervals
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Propose the next SigmaST values to run.')
+    parser.add_argument('resultsdir')
+    parser.add_argument('--savedir', required=True,
+        help='SaveDir that was passed to RunSIPP for these results')
+    parser.add_argument('--threshold', type=float, default=None,
+        help='value whose crossing by a bound or CI endpoint is of interest')
+    parser.add_argument('--proposals', type=int, default=NUMPROPOSALS)
+    args = parser.parse_args()
+
+    ResultsDir = os.path.abspath(args.resultsdir)
+    if not os.path.isdir(ResultsDir):
+        print ('Could not find directory ' + ResultsDir)
+        sys.exit()
+
+    columns = {}
+    for (tag, fn) in (('bounds', FNBOUNDSSIGMA), ('CI', FNCISSIGMA)):
+        fn = os.path.join(ResultsDir, fn)
+        if not os.path.isfile(fn):
+            print ('Could not find ' + fn + '; run BuildResultsTable.py first.')
+            sys.exit()
+        data = readSigmaFile(fn)
+        for s in data:
+            for (name, v) in data[s].items():
+                columns.setdefault(tag + ' ' + name, {})[s] = v
+
+    intervals = scoreIntervals(columns, args.threshold)
+    proposals = intervals[:args.proposals]
+    if not proposals:
+        print ('Nothing left to resolve at a spacing of %g.' % MINSPACING)
+        return
+
+    SimNames = getSimNames(ResultsDir)
+    NextSimNum = max([int(s) for s in SimNames if s.isdigit()] + [0]) + 1
+    SimSet = os.path.basename(ResultsDir)
+    SaveDir = args.savedir
+
+    with open(os.path.join(ResultsDir, FNPLAN), mode='w') as outf:
+        outfwriter = csv.writer(outf, delimiter=',')
+        outfwriter.writerow(['SimNum', 'Sigma', 'From', 'To', 'Change',
+                             'Crossing', 'BoundsPinned'])
+        for (i, (s0, s1, change, crossing, pinned)) in enumerate(proposals):
+            sigma = round((s0 + s1)/2, SIGMADIGITS)
+            outfwriter.writerow([NextSimNum + i, sigma, s0, s1,
+                                 '%.4f' % change, ';'.join(crossing),
+                                 int(pinned)])
+            print ('%% [%.4f, %.4f] change %.4f %s%s' \
+                   % (s0, s1, change,
+                      ('crosses at ' + ', '.join(crossing) + ' ') \
+                      if crossing else '',
+                      '(bounds pinned, checking CIs)' if pinned else ''))
+            print ("RunSIPP('%s', '%s', %d, 1, %s)" \
+                   % (SaveDir, SimSet, NextSimNum + i, repr(sigma)))
+
+if __name__ == '__main__':
+    main()
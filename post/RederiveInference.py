@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+#coding=utf-8
+
+import sys
+import os
+import csv
+import math
+import argparse
+import numpy as np
+
+################################################################################
+# HARD-CODING
+################################################################################
+FNINDEX = 'BootstrapIndex.tsv'
+BOOTSTRAPSUBDIR = 'Bootstrap'
+DEFAULTLEVELS = [.01, .05, .10]
+
+################################################################################
+# Redo the inference for saved bootstrap statistics
+#
+# DPO saves the bootstrap statistics for every tested point when
+# Settings.SaveBootstrapDir is set (RunSIPP.m saves them in Bootstrap/ in each
+# results directory). This recomputes, for each saved point and test, the same
+# quantities as TestListOfPoints.m but at any levels and RejectTol:
+#
+#   PValue = 1 - mean(TS > BSStat + RejectTol)
+#   CV     = the ceil((1 - level)*B)'th smallest BSStat (no interpolation)
+#   Reject = TS > CV + RejectTol
+#
+# Points that were skipped because TS <= SkipTestingTol have BSStat = +Inf,
+# so they have PValue = 1 and are never rejected, just as in DPO.
+#
+# Points that were run with the sequential bootstrap have NaN for the
+# replications that were never solved. As in DPO these count as -Inf for
+# PValue and CV, so PValue is only a lower bound. Reject is only reported
+# where it is known whatever the unsolved replications would have been, and is
+# left empty otherwise (which can happen at levels other than the ones the
+# sequential bootstrap stopped for).
+#
+# With --cr, also summarize the confidence regions implied by the tested
+# points for each parameter, test and level: the smallest and largest points
+# that are not rejected, and the nearest rejected points outside of them.
+# The endpoints of the confidence region are between these. The tested
+# points were chosen to bracket the endpoints at the original level, so at
+# other levels the brackets can be wide.
+################################################################################
+def findIndex(path):
+    for d in (path, os.path.join(path, BOOTSTRAPSUBDIR)):
+        if os.path.isfile(os.path.join(d, FNINDEX)):
+            return d
+    print ('Could not find %s in %s' % (FNINDEX, path))
+    sys.exit(1)
+
+def readIndex(bsdir):
+    # A point that was tested again with the same settings has the same file,
+    # in which case the last line for it is the most recent.
+    with open(os.path.join(bsdir, FNINDEX), 'r') as f:
+        rows = list(csv.DictReader(f, delimiter='\t'))
+    byfile = {}
+    for r in rows:
+        byfile[r['File']] = r
+    entries = []
+    for r in byfile.values():
+        entries.append({
+            'File': r['File'],
+            'Test': r['Test'],
+            'Parameter': r['Parameter'],
+            'Point': float(r['Point']),
+            'TS': float(r['TS']),
+            'B': int(r['B']),
+            'BSUsed': int(r['BSUsed']),
+            'RejectTol': float(r['RejectTol'])})
+    entries.sort(key=lambda e: (e['Parameter'], e['Test'], e['Point']))
+    return entries
+
+def computeQuantile(bsstat, q):
+    # Same as ComputeQuantile.m
+    y = np.sort(bsstat)
+    return y[int(math.ceil(q*len(y))) - 1]
+
+def rederive(entry, bsstat, levels, tol):
+    B = entry['B']
+    TS = entry['TS']
+    solved = ~np.isnan(bsstat)
+    complete = entry['BSUsed'] == B or solved.all()
+    bs = np.where(solved, bsstat, -np.inf)
+
+    out = {'PValue': 1 - np.mean(TS > bs + tol), 'Exact': int(complete)}
+    # Number of solved replications that do not count toward rejection
+    k = np.sum(~(TS > bsstat[solved] + tol))
+    n = np.sum(solved)
+    for a in levels:
+        cv = computeQuantile(bs, 1 - a)
+        out['CV', a] = cv
+        if complete:
+            out['Reject', a] = int(TS > cv + tol)
+        else:
+            # Known if it can no longer reject or rejects whatever the rest are
+            # (see SolveBootstrapProblems in TestRequests.m)
+            K = math.floor((a + tol)*B)
+            if k > K:
+                out['Reject', a] = 0
+            elif k + (B - n) <= K:
+                out['Reject', a] = 1
+            else:
+                out['Reject', a] = None
+    return out
+
+def levelName(a):
+    return 'A%d' % round(100*a)
+
+def formatValue(v):
+    if v is None:
+        return ''
+    if isinstance(v, float):
+        return '%.10g' % v
+    return str(v)
+
+def summarizeCR(entries, results, levels):
+    rows = []
+    keys = sorted(set((e['Parameter'], e['Test']) for e in entries))
+    for (param, test) in keys:
+        idx = [i for (i, e) in enumerate(entries) \
+               if (e['Parameter'], e['Test']) == (param, test)]
+        for a in levels:
+            accepted = [entries[i]['Point'] for i in idx \
+                        if results[i]['Reject', a] == 0]
+            rejected = [entries[i]['Point'] for i in idx \
+                        if results[i]['Reject', a] == 1]
+            row = [param, test, levelName(a)]
+            if not accepted:
+                rows.append(row + 4*[''])
+                continue
+            (lo, hi) = (min(accepted), max(accepted))
+            below = [p for p in rejected if p < lo]
+            above = [p for p in rejected if p > hi]
+            row.extend([max(below) if below else '', lo, hi,
+                        min(above) if above else ''])
+            rows.append(row)
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Redo inference from saved bootstrap statistics.')
+    parser.add_argument('dir',
+                        help='bootstrap directory, or a results directory '
+                             'containing ' + BOOTSTRAPSUBDIR)
+    parser.add_argument('--levels', type=float, nargs='+',
+                        default=DEFAULTLEVELS)
+    parser.add_argument('--reject-tol', type=float, default=None,
+                        help='RejectTol to use instead of the saved one')
+    parser.add_argument('--tests', nargs='+', default=None)
+    parser.add_argument('--cr', action='store_true',
+                        help='summarize the implied confidence regions')
+    parser.add_argument('--out', default=None,
+                        help='file to write to instead of standard output')
+    args = parser.parse_args()
+
+    bsdir = findIndex(args.dir)
+    entries = readIndex(bsdir)
+    if args.tests is not None:
+        entries = [e for e in entries if e['Test'] in args.tests]
+
+    results = []
+    for e in entries:
+        bsstat = np.fromfile(os.path.join(bsdir, e['File']), dtype='<f8')
+        if len(bsstat) != e['B']:
+            print ('%s has %d statistics but B = %d.' \
+                   % (e['File'], len(bsstat), e['B']))
+            sys.exit(1)
+        tol = e['RejectTol'] if args.reject_tol is None else args.reject_tol
+        results.append(rederive(e, bsstat, args.levels, tol))
+
+    fout = open(args.out, 'w') if args.out else sys.stdout
+    writer = csv.writer(fout, delimiter='\t', lineterminator='\n')
+    if args.cr:
+        writer.writerow(['Parameter', 'Test', 'Level', 'LeftRejected',
+                         'LeftAccepted', 'RightAccepted', 'RightRejected'])
+        for row in summarizeCR(entries, results, args.levels):
+            writer.writerow([formatValue(v) for v in row])
+    else:
+        header = ['Parameter', 'Test', 'Point', 'TS', 'BSUsed', 'Exact',
+                  'PValue']
+        for a in args.levels:
+            header.extend(['CV_' + levelName(a), 'Reject_' + levelName(a)])
+        writer.writerow(header)
+        for (e, r) in zip(entries, results):
+            row = [e['Parameter'], e['Test'], e['Point'], e['TS'],
+                   e['BSUsed'], r['Exact'], r['PValue']]
+            for a in args.levels:
+                row.extend([r['CV', a], r['Reject', a]])
+            writer.writerow([formatValue(v) for v in row])
+    if args.out:
+        fout.close()
+
+    inexact = sum(1 for r in results if not r['Exact'])
+    if inexact:
+        sys.stderr.write(('%d of %d points were run with the sequential '
+                          'bootstrap, so their p-values are lower bounds.\n') \
+                         % (inexact, len(results)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,18 @@
+%###############################################################################
+% AggregationKey
+%
+% Hash of everything that decides which latent types are merged when
+% Settings.AggregateLatentTypes is on (see AggregateLatentTypes in
+% CreateAMPLSets): T, the observed sequences, the sets that are compared
+% (DistinguishingSets), and the dimensions of the ST and MTS sets.
+%
+% Two specifications with the same key merge the same latent types, so an AMPL
+% instance can be reused between them (see PrepareAMPLSession), and a check by
+% ValidateAggregation carries over from one to the other.
+%###############################################################################
+function Key = AggregationKey(Settings, Data)
+    Key = ComputeHash('Aggregation', Settings.T, unique(Data.Y, 'rows'),...
+        DistinguishingSets(Settings),...
+        Settings.Assumption_ST*(Settings.Assumption_DimST + 1),...
+        Settings.Assumption_DimMTS);
+end
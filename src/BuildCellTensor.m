@@ -0,0 +1,62 @@
+%###############################################################################
+% BuildCellTensor
+%
+% Tabulate the data into a sparse array of counts indexed by
+% (history, covariate cell).
+%
+% Y is the usual N x (T+1) wide array of binary outcomes.
+% Age is N x (T+1) and the covariate cell is determined by age in period 0.
+% AgeBinEdges are the edges of the age bins, so that cell k contains ages in
+% [AgeBinEdges(k), AgeBinEdges(k+1)), except that the last bin also contains
+% its right edge.
+% If AgeBinEdges is empty then each age in period 0 is its own cell.
+%
+% Tensor is a structure with fields:
+%   Counts
+%       sparse 2^(T+1) x NumCells array, with Counts(y,c) the number of
+%       observations with history y (coded as in WideToBinary) in cell c
+%   N, T
+%   CellAge
+%       NumCells x 2 array of the [lower, upper] ages in each cell
+%   Entry
+%       N x 1 linear index of each observation into Counts.
+%       This lets ResampleCellTensor reproduce the same draws as ResampleData.
+%###############################################################################
+function Tensor = BuildCellTensor(Y, Age, AgeBinEdges)
+    if ~exist('AgeBinEdges')
+        AgeBinEdges = [];
+    end
+    assert(all(ismember(Y(:), [0, 1])));
+    assert(size(Age, 1) == size(Y, 1));
+
+    [N, T1] = size(Y);
+    T = T1 - 1;
+
+    % Same coding as WideToBinary, but vectorized
+    YInt = Y*(2.^((T:-1:0)')) + 1;
+
+    Age0 = Age(:,1);
+    if isempty(AgeBinEdges)
+        AgeBinEdges = unique(Age0)';
+        CellAge = [AgeBinEdges' AgeBinEdges'];
+        [~, CellIdx] = ismember(Age0, AgeBinEdges);
+    else
+        if any(diff(AgeBinEdges) <= 0)
+            error('AgeBinEdges should be strictly increasing.');
+        end
+        CellIdx = discretize(Age0, AgeBinEdges);
+        if any(isnan(CellIdx))
+            error('Some ages in period 0 are outside of [%g, %g].',...
+                AgeBinEdges(1), AgeBinEdges(end));
+        end
+        CellAge = [AgeBinEdges(1:end-1)' AgeBinEdges(2:end)'];
+    end
+    NumCells = size(CellAge, 1);
+
+    Tensor.Counts = sparse(YInt, CellIdx, 1, 2^(T+1), NumCells);
+    Tensor.N = N;
+    Tensor.T = T;
+    Tensor.AgeBinEdges = AgeBinEdges;
+    Tensor.CellAge = CellAge;
+    Tensor.Entry = sub2ind(size(Tensor.Counts), YInt(:), CellIdx(:));
+end
@@ -1,11 +1,23 @@
 %###############################################################################
 % BuildConfidenceRegions
+%
+% If Settings.PriorCR is not empty, its row p holds predicted [left right]
+% endpoints for Settings.ParametersToTest{p} (e.g. from a run with a nearby
+% SigmaST), and the search for the first test and level opens with a narrow
+% bracket around these (see BracketCREndpoint).
+% A NaN means there is no prediction for that endpoint.
+% The other tests and levels are bracketed by the points already tested.
+%
+% LPIterations are the solver iterations used for the bootstrap problems
+% (see SolveBootstrapProblems in TestRequests).
 %###############################################################################
-function CR = BuildConfidenceRegions(ampl, Settings, Data, Bounds)
+function [CR LPIterations] = ...
+    BuildConfidenceRegions(ampl, Settings, Data, Bounds)
 
 % Initial brackets
 WorstUBLeft = Bounds(:,1);
 WorstLBRight = Bounds(:,2);
+LPIterations = zeros(1, 2);
 
 if (length(Settings.ParametersToTest) == 0)
     warning('Called BuildConfidenceRegions with ParametersToTest empty.');
@@ -29,7 +41,11 @@ for j = 1:1:length(Settings.Tests)
                     Settings.ActiveTest{:}));
         end
 
+        PredictedCR = [NaN NaN];
         if ((j == 1) & (a == 1))
+            if ~isempty(Settings.PriorCR)
+                PredictedCR = Settings.PriorCR(p,:);
+            end
             LeftBracket(1) = 0;
             LeftBracket(2) = WorstUBLeft(p,1);
             RightBracket(1) = WorstLBRight(p,1);
@@ -78,16 +94,20 @@ for j = 1:1:length(Settings.Tests)
 
         % Passing back settings so keep track of points that have been tested
         % already.
-        [LeftEndpoint PointList RejectList] = BracketCREndpoint(ampl,...
-            LeftBracket(2), LeftBracket(1),...
-            Settings, Data, PointList, RejectList);
+        [LeftEndpoint PointList RejectList Iterations] = ...
+            BracketCREndpoint(ampl,...
+                LeftBracket(2), LeftBracket(1),...
+                Settings, Data, PointList, RejectList, PredictedCR(1));
+        LPIterations = LPIterations + Iterations;
 
         if (Settings.Noise >= 1)
             disp(sprintf('\tRight endpoint', RightBracket));
         end
-        [RightEndpoint PointList RejectList] = BracketCREndpoint(ampl,...
-            RightBracket(1), RightBracket(2),...
-            Settings, Data, PointList, RejectList);
+        [RightEndpoint PointList RejectList Iterations] = ...
+            BracketCREndpoint(ampl,...
+                RightBracket(1), RightBracket(2),...
+                Settings, Data, PointList, RejectList, PredictedCR(2));
+        LPIterations = LPIterations + Iterations;
 
         if (Settings.Noise >= 1)
             disp(sprintf(['Final %-.0f%% confidence region for %s '...
@@ -113,25 +133,28 @@ end
 % Depending on whether In is smaller than Out or not the script determines where
 % this is a left endpoint or right endpoint, then proceeds with bracketing.
 %
+% If Predicted is passed and lies strictly between In and Out, then the
+% bracket is first narrowed around it: points at distance
+% Settings.PriorCRWidth, 2*Settings.PriorCRWidth, ... from Predicted are tested
+% on the Out side until one is rejected, and then Predicted and points at
+% distance PriorCRWidth, 3*PriorCRWidth, ... on the In side until one is not
+% rejected.
+% If the prediction is good this leaves a bracket of width PriorCRWidth after
+% two tests, so bisection only needs a few more.
+% If it is bad the steps double, so this costs at most a few tests more than
+% starting from [In, Out].
+%
 % PointList and RejectList keep track of all points that have been tested
 % so far and whether they were rejected or not at the levels and tests
 % for which confidence interval are to be built.
 %###############################################################################
-function [Endpoint PointList RejectList] = ...
-    BracketCREndpoint(ampl, In, Out, Settings, Data, PointList, RejectList)
+function [Endpoint PointList RejectList LPIterations] = ...
+    BracketCREndpoint(ampl, In, Out, Settings, Data, PointList, RejectList,...
+                        Predicted)
 %###############################################################################
+    LPIterations = zeros(1, 2);
 
-    if (In < Out) % Right-hand side bracket
-        RightBracket = 1;
-        dirstr = 'right';
-        LB = In;
-        UB = Out;
-    else % Left-hand bracket
-        RightBracket = 0;
-        dirstr = 'left';
-        LB = Out;
-        UB = In;
-    end
+    Dir = sign(Out - In); % 1 for a right-hand bracket, -1 for a left-hand one
 
     numfmt = '%8.6f';
     bracketfmt = ['[' numfmt ', ' numfmt ']'];
@@ -139,51 +162,104 @@ function [Endpoint PointList RejectList] = ...
     colfmtwide = sprintf('%%-%ds', collenwide);
     collen = round(collenwide/2);
     colfmt = sprintf('%%-%ds', collen);
-    rowfmt1 = ['\t' colfmtwide colfmt]; % First half of a row line
-    rowfmt2 = [colfmt colfmt colfmt '\n']; % Second half of a row line
+    Fmt.num = numfmt;
+    Fmt.bracket = bracketfmt;
+    Fmt.row1 = ['\t' colfmtwide colfmt]; % First half of a row line
+    Fmt.row2 = [colfmt colfmt colfmt colfmt '\n']; % Second half of a row line
     if (Settings.Noise >= 1)
-        fprintf([rowfmt1 rowfmt2], 'Bracket', 'Midpoint', 'TS', 'CV', 'Reject');
+        fprintf([Fmt.row1 Fmt.row2], 'Bracket', 'Point', 'TS', 'CV',...
+                'Reject', 'Draws');
     end
 
-    while (UB - LB) > Settings.BracketTol
-        t = (UB + LB)/2; % Test the midpoint
-        PointList = [PointList; t];
-
-        if (Settings.Noise >= 1)
-            fprintf(rowfmt1, sprintf(bracketfmt, LB, UB), sprintf(numfmt, t));
+    if ~exist('Predicted', 'var')
+        Predicted = NaN;
+    end
+    if ((Predicted - In)*Dir > 0) & ((Out - Predicted)*Dir > 0)
+        % Move out from the prediction until a point is rejected
+        Step = Settings.PriorCRWidth;
+        t = Predicted + Dir*Step;
+        while ((Out - t)*Dir > 0)
+            [CurReject PointList RejectList Iterations] = ...
+                TestCRPoint(ampl, t, In, Out, Settings, Data,...
+                            PointList, RejectList, Fmt);
+            LPIterations = LPIterations + Iterations;
+            if CurReject
+                Out = t;
+                break;
+            end
+            In = t;
+            Step = 2*Step;
+            t = Predicted + Dir*Step;
         end
 
-        [TS PValue CV Reject] ...
-            = TestListOfPoints(ampl, Settings, Data, t, Settings.LevelsCR);
-        RejectList(:, size(RejectList,2) + 1, :) = Reject;
-
-        CurReject = ...
-            Reject( Index(Settings.ActiveLevel, Settings.LevelsCR),...
-                    Index(Settings.ActiveTest, Settings.Tests));
-        CurCV = CV( Index(Settings.ActiveLevel, Settings.LevelsCR),...
-                     Index(Settings.ActiveTest, Settings.Tests));
-
-        if (Settings.Noise >= 1)
-            fprintf(rowfmt2, sprintf(numfmt, TS), sprintf(numfmt, CurCV),...
-                     sprintf('%d', CurReject));
+        % Then move in from the prediction until a point is not rejected
+        Step = Settings.PriorCRWidth;
+        t = Predicted;
+        while ((t - In)*Dir > 0)
+            [CurReject PointList RejectList Iterations] = ...
+                TestCRPoint(ampl, t, In, Out, Settings, Data,...
+                            PointList, RejectList, Fmt);
+            LPIterations = LPIterations + Iterations;
+            if ~CurReject
+                In = t;
+                break;
+            end
+            Out = t;
+            t = Predicted - Dir*(2*Step - Settings.PriorCRWidth);
+            Step = 2*Step;
         end
-        diary off; diary on; % Flush
+    end
 
-        % Adjust bracket depending on whether this was a right or left bracket
-        % and depending on whether there was a rejection at the midpoint
-        if RightBracket
-            if CurReject
-                UB = t;
-            else
-                LB = t;
-            end
+    while abs(Out - In) > Settings.BracketTol
+        t = (In + Out)/2; % Test the midpoint
+        [CurReject PointList RejectList Iterations] = ...
+            TestCRPoint(ampl, t, In, Out, Settings, Data,...
+                        PointList, RejectList, Fmt);
+        LPIterations = LPIterations + Iterations;
+
+        % Adjust bracket depending on whether there was a rejection at the
+        % midpoint
+        if CurReject
+            Out = t;
         else
-            if CurReject
-                LB = t;
-            else
-                UB = t;
-            end
+            In = t;
         end
     end
-    Endpoint = (LB + UB)/2;
+    Endpoint = (In + Out)/2;
+end
+
+%###############################################################################
+% TestCRPoint
+%
+% Test a single point t for BracketCREndpoint, add it to PointList and
+% RejectList, and print a row of output for it.
+% CurReject is whether t was rejected by the active test at the active level.
+%###############################################################################
+function [CurReject PointList RejectList LPIterations] = ...
+    TestCRPoint(ampl, t, In, Out, Settings, Data, PointList, RejectList, Fmt)
+%###############################################################################
+    PointList = [PointList; t];
+
+    if (Settings.Noise >= 1)
+        fprintf(Fmt.row1, sprintf(Fmt.bracket, min(In, Out), max(In, Out)),...
+                sprintf(Fmt.num, t));
+    end
+
+    [TS PValue CV Reject BSUsed LPIterations] ...
+        = TestListOfPoints(ampl, Settings, Data, t, Settings.LevelsCR);
+    RejectList(:, size(RejectList,2) + 1, :) = Reject;
+
+    CurReject = ...
+        Reject( Index(Settings.ActiveLevel, Settings.LevelsCR),...
+                Index(Settings.ActiveTest, Settings.Tests));
+    CurCV = CV( Index(Settings.ActiveLevel, Settings.LevelsCR),...
+                 Index(Settings.ActiveTest, Settings.Tests));
+
+    CurBSUsed = BSUsed(1, Index(Settings.ActiveTest, Settings.Tests));
+
+    if (Settings.Noise >= 1)
+        fprintf(Fmt.row2, sprintf(Fmt.num, TS), sprintf(Fmt.num, CurCV),...
+                 sprintf('%d', CurReject), sprintf('%d', CurBSUsed));
+    end
+    diary off; diary on; % Flush
 end
@@ -0,0 +1,43 @@
+%###############################################################################
+% CellTensorPMF
+%
+% Marginal and conditional distributions from a tensor of counts built by
+% BuildCellTensor.
+%
+% Dim = 'Y'
+%   PMF is the 2^(T+1) x 1 distribution of histories (indexed as in
+%   WideToBinary) conditional on the covariate cell being in Given.
+% Dim = 'Cell'
+%   PMF is the NumCells x 1 distribution of covariate cells conditional on
+%   the history being in Given.
+%
+% If Given is empty or omitted then the marginal distribution is returned.
+% Count is the number of observations that were conditioned on.
+%###############################################################################
+function [PMF Count] = CellTensorPMF(Tensor, Dim, Given)
+    if ~exist('Given')
+        Given = [];
+    end
+
+    switch Dim
+        case 'Y'
+            if isempty(Given)
+                PMF = full(sum(Tensor.Counts, 2));
+            else
+                PMF = full(sum(Tensor.Counts(:, Given), 2));
+            end
+        case 'Cell'
+            if isempty(Given)
+                PMF = full(sum(Tensor.Counts, 1))';
+            else
+                PMF = full(sum(Tensor.Counts(Given, :), 1))';
+            end
+        otherwise
+            error('Dim should be either Y or Cell, not %s.', Dim);
+    end
+
+    Count = sum(PMF);
+    if (Count > 0)
+        PMF = PMF/Count;
+    end
+end
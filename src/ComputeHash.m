@@ -0,0 +1,57 @@
+%*******************************************************************************
+% ComputeHash
+%
+% SHA-1 hash (as a hex string) of any number of inputs, each of which can be a
+% string, a numeric or logical array, or a cell array or structure of these.
+% Numbers are hashed by their exact double representation along with the size
+% of the array they are in, so e.g. [1 2] and [1; 2] hash differently.
+% uint8 arrays (e.g. the contents of a file, see HashFiles) are hashed as the
+% bytes themselves, without converting them to double.
+% Structures are hashed with their fields in sorted order, so the order in
+% which fields were added does not matter.
+%*******************************************************************************
+function Hash = ComputeHash(varargin)
+    md = java.security.MessageDigest.getInstance('SHA-1');
+    for i = 1:1:length(varargin)
+        AddToHash(md, varargin{i});
+    end
+    Hash = sprintf('%02x', typecast(md.digest(), 'uint8'));
+end
+
+function AddToHash(md, x)
+    if iscell(x)
+        md.update(typecast(uint8('c'), 'int8'));
+        AddToHash(md, size(x));
+        for j = 1:1:numel(x)
+            AddToHash(md, x{j});
+        end
+    elseif isstruct(x)
+        md.update(typecast(uint8('t'), 'int8'));
+        AddToHash(md, size(x));
+        Fields = sort(fieldnames(x));
+        for j = 1:1:numel(x)
+            for f = 1:1:length(Fields)
+                AddToHash(md, Fields{f});
+                AddToHash(md, x(j).(Fields{f}));
+            end
+        end
+    elseif ischar(x)
+        md.update(typecast(uint8('s'), 'int8'));
+        AddToHash(md, size(x));
+        md.update(typecast(unicode2native(x(:)', 'UTF-8'), 'int8'));
+    elseif isa(x, 'uint8')
+        md.update(typecast(uint8('b'), 'int8'));
+        md.update(typecast(double(size(x)), 'int8'));
+        if ~isempty(x)
+            md.update(typecast(x(:)', 'int8'));
+        end
+    elseif isnumeric(x) | islogical(x)
+        md.update(typecast(uint8('n'), 'int8'));
+        md.update(typecast(double(size(x)), 'int8'));
+        if ~isempty(x)
+            md.update(typecast(double(full(x(:)')), 'int8'));
+        end
+    else
+        error('ComputeHash cannot hash a %s.', class(x));
+    end
+end
@@ -0,0 +1,97 @@
+%###############################################################################
+% ComputeMaxImpliedChange
+%
+% The largest change PSD[t] - PSD[tt] in PSD over time periods that is allowed
+% by the assumptions, for all t ~= tt.
+%
+% The feasible set for these problems does not involve the observed
+% probabilities, except through YHAT (which determines UHAT) and through MTS
+% (which uses the observed probabilities in its denominators).
+% So the answer only depends on T, YHAT, the assumptions (including SigmaST),
+% and the observed probabilities if MTS is imposed.
+% Results are cached by a hash of these (see ResultCache), so that other runs
+% with the same data and assumptions can reuse them. The hash also includes
+% the model and the code that sets up the problems, and the solver settings,
+% so that results on disk are not reused after any of these change.
+%
+% On a cache miss all T*(T-1) problems are solved as one batch by a loop inside
+% AMPL, rather than by switching the objective and solving from MATLAB one
+% problem at a time.
+%###############################################################################
+function [MaxImpliedChange CacheHit] = ComputeMaxImpliedChange(ampl, Settings)
+    T = Settings.T;
+    Key = MaxImpliedChangeKey(ampl, Settings);
+    [MaxImpliedChange CacheHit] = ...
+        ResultCache(Settings, 'MaxImpliedChange', Key);
+    if CacheHit
+        return;
+    end
+
+    ChangeOptimizationProblem(ampl, Settings, 'MaxImpliedChange');
+    BatchCmd = ...
+        ['for {t in 1..T, tt in 1..T : t <> tt} {'...
+         '    objective ChangeInPSD[t,tt];'...
+         '    solve;'...
+         '    let MaxImpliedChangeResult[t,tt] := solve_result;'...
+         '    let MaxImpliedChangeVal[t,tt] := ChangeInPSD[t,tt];'...
+         '}'];
+    if Settings.NoisyOptimization
+        ampl.eval(BatchCmd);
+    else
+        evalc('ampl.eval(BatchCmd)');
+    end
+
+    MaxImpliedChange = zeros(T, T);
+    for t = 1:1:T
+        for tt = 1:1:T
+            if (tt == t)
+                continue; % obviously 0 in this case
+            end
+            SolveResult = ampl.getValue(...
+                sprintf('MaxImpliedChangeResult[%d,%d]', t, tt));
+            assert(~strcmp(SolveResult, 'infeasible')); % should not be infeas
+
+            MaxImpliedChange(t,tt) = ampl.getValue(...
+                sprintf('MaxImpliedChangeVal[%d,%d]', t, tt));
+        end
+    end
+
+    ResultCache(Settings, 'MaxImpliedChange', Key, MaxImpliedChange);
+end
+
+%###############################################################################
+% MaxImpliedChangeKey
+%###############################################################################
+function Key = MaxImpliedChangeKey(ampl, Settings)
+    YHat = cell2mat(cell(ampl.getSet('YHAT').get().toArray()));
+
+    ST = Settings.Assumption_ST;
+    MTS = Settings.Assumption_MTS;
+    Assumptions = [ Settings.Assumption_MTR,...
+                    Settings.Assumption_MATR,...
+                    ST,...
+                    ST*Settings.Assumption_DimST,...
+                    ST*Settings.Assumption_SigmaST,...
+                    Settings.Assumption_TIV,...
+                    Settings.Assumption_DSC,...
+                    MTS,...
+                    MTS*Settings.Assumption_DimMTS];
+
+    if MTS
+        Q = ampl.getData('Q').getColumnAsDoubles('Q');
+    else
+        Q = [];
+    end
+
+    OptPeriod = Settings.OptPeriod;
+    if isempty(OptPeriod) % Same as T + 1 (see CreateAMPLSets)
+        OptPeriod = Settings.T + 1;
+    end
+    Solver = {Settings.Solver, Settings.PreSolveEps,...
+              Settings.FeasTolDefault, OptPeriod};
+    Code = HashFiles({which('DPO.mod'), [mfilename('fullpath') '.m'],...
+                      which('ChangeOptimizationProblem.m')});
+
+    Key = ComputeHash('MaxImpliedChange', Settings.T, sort(YHat(:)),...
+                      Assumptions, Q, Solver, Code);
+end
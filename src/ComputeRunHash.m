@@ -0,0 +1,34 @@
+%###############################################################################
+% ComputeRunHash
+%
+% Hash that identifies the results of calling Program ('DPO' or 'PDBR') with
+% SettingsIn. It combines
+%   - the effective settings, i.e. SettingsIn with the defaults of Program
+%     filled in (see HashSettings for what is left out), but without PriorCR
+%     and PriorCRWidth, as in BootstrapKey in TestRequests,
+%   - the contents of the data file, and
+%   - the contents of the code (.m, .mod and .py files) in the directory that
+%     Program is in, and of the files in the optional cell array ExtraFiles
+%     (e.g. the script that calls Program).
+% So two runs with the same hash produce the same results, up to BracketTol
+% for the endpoints of the confidence regions (PriorCR only changes how these
+% are bracketed).
+%###############################################################################
+function Hash = ComputeRunHash(Program, SettingsIn, ExtraFiles)
+    if ~exist('ExtraFiles', 'var')
+        ExtraFiles = {};
+    end
+    SettingsIn.GetDefaultSettings = 1;
+    [~, Settings] = feval(Program, SettingsIn);
+
+    CodeDir = fileparts(which(Program));
+    CodeFiles = [dir(fullfile(CodeDir, '*.m'));...
+                 dir(fullfile(CodeDir, '*.mod'));...
+                 dir(fullfile(CodeDir, '*.py'))];
+    CodeFiles = [sort(fullfile(CodeDir, {CodeFiles.name})) ExtraFiles(:)'];
+
+    Hash = ComputeHash(Program,...
+                       HashSettings(Settings, {'PriorCR', 'PriorCRWidth'}),...
+                       HashFiles({Settings.DataPath}),...
+                       HashFiles(CodeFiles));
+end
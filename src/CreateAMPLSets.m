@@ -2,14 +2,52 @@
 % CreateAMPLSets
 %
 % Create set definitions in AMPL.
+%
+% Built describes the sets that are already defined in this AMPL instance
+% (see PrepareAMPLSession) and is returned updated.
+% If it is empty or not passed, then every set is created.
+% Otherwise the sets that only depend on T and YHAT are assumed to be there
+% already, and the sets that depend on the assumptions are only (re)created
+% if they are needed and were built for different assumptions.
+%
+% If Settings.AggregateLatentTypes is on, then the latent types in UHAT that
+% are in exactly the same sets (among the ones that are used for the
+% assumptions and parameters in Settings) are merged into one, since the LP
+% only depends on P through the sums over these sets (see
+% AggregateLatentTypes). This needs every set to be created, so Built can
+% only be passed if it is for the same AggregationKey, in which case no set
+% needs to be updated.
 %###############################################################################
-function [] = CreateAMPLSets(ampl, Settings, Data)
+function [Built] = CreateAMPLSets(ampl, Settings, Data, Built)
 
 TicTotal = tic;
 
+if ~exist('Built', 'var')
+    Built = [];
+end
+FlagBuildAll = isempty(Built); % Nothing is there yet, so build every set
+if FlagBuildAll
+    Built.DimST = NaN;
+    Built.DSC = 0;
+    Built.DimMTS = NaN;
+    Built.TIV = 0;
+    Built.Aggregation = [];
+end
+
+% Sets are only filled once they have all been created if aggregating
+if Settings.AggregateLatentTypes
+    Pending = containers.Map('KeyType', 'double', 'ValueType', 'any');
+else
+    Pending = [];
+end
+
 if (Settings.Noise >= 1)
     disp(repmat('=', 1, Settings.DisplaySepLen));
-    disp('Started creating set definitions...')
+    if FlagBuildAll
+        disp('Started creating set definitions...')
+    else
+        disp('Reusing set definitions, updating those for the assumptions...')
+    end
 end
 
 T = Settings.T;
@@ -22,58 +60,64 @@ ampl.getParameter('T').setValues(T);
 for t = 1:1:(T+1)
     AllYSeqsWide{t} = AllBinaryArray(t);
     AllYSeqsInt{t} = WideToBinary(AllYSeqsWide{t});
-    FillAMPLSet(ampl, 'YSEQS', [t], AllYSeqsInt{t}(:)');
+    if FlagBuildAll
+        FillAMPLSet(ampl, Pending, 'YSEQS', [t], AllYSeqsInt{t}(:)');
+    end
 end
 
-%###########################################################################
-% Fill in YHAT
-% I found that not doing this first could lead to errors with the
-% Matlab AMPL API since other sets are indexed based on it.
-%###########################################################################
-TicYHat = tic;
-YHat = unique(Data.Y, 'rows');
-YHatInt = WideToBinary(YHat);
-
-FillAMPLSet(ampl, 'YHAT', [], YHatInt(:)');
-clear YHatInt;
-TimeYHat = toc(TicYHat);
-
-%##########################################################################
-% U_OBSEQ[y] and U_HAT
-%
-% Fix an observed sequence y.
-% The pattern for U sequences that need to be summed over
-% to match observational equivalence for y is:
-%   u_{t_{0} = y_{0}
-%   if y_{0} = 0 then u_{1}(0) = y_{1}
-%                else u_{1}(1) = y_{1}
-%   if y_{1} = 0 then u_{2}(0) = y_{2}
-%                else u_{2}(1) = y_{2}
-%   and so on
-%
-% NOTE: The convention for u sequences in the code differs
-% from that in the paper.
-% In the code it is:
-%   (u(0), u_{1}(0),...,u_{T}(0),
-%          u_{1}(1),...,u_{T}(1))
-%
-% UHAT is then the union of U_OBSEQ[y] for all y
-%##########################################################################
-TicUHat = tic;
-for y = 1:1:size(YHat, 1)
-    YSeq = YHat(y,:);
-    UPatObsEq = BuildUPatternToMatchY(YSeq, T);
-
-    M = MatchPattern(UPatObsEq);
-    UObsEqInt(y,:) = M(:)';
-    YSeqInt = WideToBinary(YSeq);
-    UObsEqIdx(y,:) = [YSeqInt];
+TimeYHat = 0;
+TimeUHat = 0;
+if FlagBuildAll
+    %###########################################################################
+    % Fill in YHAT
+    % I found that not doing this first could lead to errors with the
+    % Matlab AMPL API since other sets are indexed based on it.
+    %###########################################################################
+    TicYHat = tic;
+    YHat = unique(Data.Y, 'rows');
+    YHatInt = WideToBinary(YHat);
+
+    FillAMPLSet(ampl, Pending, 'YHAT', [], YHatInt(:)');
+    clear YHatInt;
+    TimeYHat = toc(TicYHat);
+
+    %##########################################################################
+    % U_OBSEQ[y] and U_HAT
+    %
+    % Fix an observed sequence y.
+    % The pattern for U sequences that need to be summed over
+    % to match observational equivalence for y is:
+    %   u_{t_{0} = y_{0}
+    %   if y_{0} = 0 then u_{1}(0) = y_{1}
+    %                else u_{1}(1) = y_{1}
+    %   if y_{1} = 0 then u_{2}(0) = y_{2}
+    %                else u_{2}(1) = y_{2}
+    %   and so on
+    %
+    % NOTE: The convention for u sequences in the code differs
+    % from that in the paper.
+    % In the code it is:
+    %   (u(0), u_{1}(0),...,u_{T}(0),
+    %          u_{1}(1),...,u_{T}(1))
+    %
+    % UHAT is then the union of U_OBSEQ[y] for all y
+    %##########################################################################
+    TicUHat = tic;
+    for y = 1:1:size(YHat, 1)
+        YSeq = YHat(y,:);
+        UPatObsEq = BuildUPatternToMatchY(YSeq, T);
+
+        M = MatchPattern(UPatObsEq);
+        UObsEqInt(y,:) = M(:)';
+        YSeqInt = WideToBinary(YSeq);
+        UObsEqIdx(y,:) = [YSeqInt];
+    end
+    UHatInt = sort(UObsEqInt(:)); % Keep this around--needed later
+    FillAMPLSet(ampl, Pending, 'UHAT', [], UHatInt(:)');
+    FillAMPLSet(ampl, Pending, 'U_OEQ', UObsEqIdx, UObsEqInt);
+    clear UObsEqInt UObsEqIdx;
+    TimeUHat = toc(TicUHat);
 end
-UHatInt = sort(UObsEqInt(:)); % Keep this around--needed later
-FillAMPLSet(ampl, 'UHAT', [], UHatInt(:)');
-FillAMPLSet(ampl, 'U_OEQ', UObsEqIdx, UObsEqInt);
-clear UObsEqInt UObsEqIdx;
-TimeUHat = toc(TicUHat);
 
 %###############################################################################
 %###############################################################################
@@ -94,125 +138,128 @@ else
     end
 end
 
-%###################################################################
-% U_PSD
-% Pattern for PSD is:
-%   u_{t}(0) = 0
-%   u_{t}(1) = 1
-%###################################################################
-for t = 1:1:T
-    UPat = -1*ones(1, 1 + 2*T);
-    UPat(1 + t) = 0;
-    UPat(1 + T + t) = 1;
-    UPSDInt(t,:) = MatchPattern(UPat);
-    UList = sort(UPSDInt(t,:));
-    FillAMPLSet(ampl, 'U_PSD', [t], UList(:)');
-end
-clear UPSDInt;
-
-%*******************************************************************************
-% U_AE1
-% Pattern is:
-%   u_{t}(1) = 1
-% so a special case of above
-%*******************************************************************************
-for t = 1:1:T
-    UPat = -1*ones(1, 1 + 2*T);
-    UPat(1 + T + t) = 1;
-    UAE1Int(t,:) = MatchPattern(UPat);
-    UList = sort(UAE1Int(t,:));
-    FillAMPLSet(ampl, 'U_AE1', [t], UList(:)');
-end
-clear UAE1Int;
-
-%###################################################################
-% U_NSD
-% Pattern for NSD is:
-%   u_{t}(0) = 1
-%   u_{t}(1) = 0
-%###################################################################
-for t = 1:1:T
-    UPat = -1*ones(1, 1 + 2*T);
-    UPat(1 + t) = 1;
-    UPat(1 + T + t) = 0;
-    UNSDInt(t,:) = MatchPattern(UPat);
-    UList = sort(UNSDInt(t,:));
-    FillAMPLSet(ampl, 'U_NSD', [t], UList(:)');
-end
-clear UNSDInt;
-
-%*******************************************************************************
-% U_AE0
-% Pattern is:
-%   u_{t}(0) = 1
-% so a special case of above
-%*******************************************************************************
-for t = 1:1:T
-    UPat = -1*ones(1, 1 + 2*T);
-    UPat(1 + t) = 1;
-    UAE0Int(t,:) = MatchPattern(UPat);
-    UList = sort(UAE0Int(t,:));
-    FillAMPLSet(ampl, 'U_AE0', [t], UList(:)');
-end
-clear UAE0Int;
-
-%###############################################################################
-% PSD_G0, PSD_G00
-%
-% PSD_G0
-% Loop over t
-%   For each t, find all Y, such that Y_{t} = 0.
-%   Pass this set to AMPL as Y_G0[t].
-%   Loop over y in Y_G0[t]
-%       For each y in Y_G0[t], find all U = u that could generate y
-%       Pass this set to AMPL as U_PSD_G0_DEN
-%       Then further restrict these U to those with U_{t}(0) = 0, U_{t}(1) = 1
-%       Pass this set to AMPL as U_PSD_G0_NUM
-%
-% PSD_G00
-%   Start with all Y such that Y_{t} = 0 from above.
-%   Restrict this set to all Y such that also Y_{t-1} = 0.
-%   Then repeat the same steps as above with this set.
-%###############################################################################
-for t = 1:1:T
-    % Given Y_{t} = 0
-    YPat = -1*ones(1, 1 + T);
-    YPat(t+1) = 0;
-    [YG0Int YG0Wide] = MatchPattern(YPat);
-    FillAMPLSet(ampl, 'Y_G0', [t], YG0Int(:)');
-    UG0Num = FindConditionalPSDSequences(YG0Wide, T, t);
-    FillAMPLSet(ampl, 'U_PSD_G0_NUM', [t], UG0Num(:)');
-
-    % Given Y_{t} = 0, Y_{t-1} = 0
-    I = find(YG0Wide(:,1+(t-1)) == 0);
-    YG00Int = YG0Int(I);
-    YG00Wide = YG0Wide(I,:);
-    FillAMPLSet(ampl, 'Y_G00', [t], YG00Int(:)');
-    UG00Num = FindConditionalPSDSequences(YG00Wide, T, t);
-    FillAMPLSet(ampl, 'U_PSD_G00_NUM', [t], UG00Num(:)');
-end
+if FlagBuildAll
+    %###################################################################
+    % U_PSD
+    % Pattern for PSD is:
+    %   u_{t}(0) = 0
+    %   u_{t}(1) = 1
+    %###################################################################
+    for t = 1:1:T
+        UPat = -1*ones(1, 1 + 2*T);
+        UPat(1 + t) = 0;
+        UPat(1 + T + t) = 1;
+        UPSDInt(t,:) = MatchPattern(UPat);
+        UList = sort(UPSDInt(t,:));
+        FillAMPLSet(ampl, Pending, 'U_PSD', [t], UList(:)');
+    end
+    clear UPSDInt;
+
+    %***************************************************************************
+    % U_AE1
+    % Pattern is:
+    %   u_{t}(1) = 1
+    % so a special case of above
+    %***************************************************************************
+    for t = 1:1:T
+        UPat = -1*ones(1, 1 + 2*T);
+        UPat(1 + T + t) = 1;
+        UAE1Int(t,:) = MatchPattern(UPat);
+        UList = sort(UAE1Int(t,:));
+        FillAMPLSet(ampl, Pending, 'U_AE1', [t], UList(:)');
+    end
+    clear UAE1Int;
+
+    %###################################################################
+    % U_NSD
+    % Pattern for NSD is:
+    %   u_{t}(0) = 1
+    %   u_{t}(1) = 0
+    %###################################################################
+    for t = 1:1:T
+        UPat = -1*ones(1, 1 + 2*T);
+        UPat(1 + t) = 1;
+        UPat(1 + T + t) = 0;
+        UNSDInt(t,:) = MatchPattern(UPat);
+        UList = sort(UNSDInt(t,:));
+        FillAMPLSet(ampl, Pending, 'U_NSD', [t], UList(:)');
+    end
+    clear UNSDInt;
+
+    %***************************************************************************
+    % U_AE0
+    % Pattern is:
+    %   u_{t}(0) = 1
+    % so a special case of above
+    %***************************************************************************
+    for t = 1:1:T
+        UPat = -1*ones(1, 1 + 2*T);
+        UPat(1 + t) = 1;
+        UAE0Int(t,:) = MatchPattern(UPat);
+        UList = sort(UAE0Int(t,:));
+        FillAMPLSet(ampl, Pending, 'U_AE0', [t], UList(:)');
+    end
+    clear UAE0Int;
+
+    %###########################################################################
+    % PSD_G0, PSD_G00
+    %
+    % PSD_G0
+    % Loop over t
+    %   For each t, find all Y, such that Y_{t} = 0.
+    %   Pass this set to AMPL as Y_G0[t].
+    %   Loop over y in Y_G0[t]
+    %       For each y in Y_G0[t], find all U = u that could generate y
+    %       Pass this set to AMPL as U_PSD_G0_DEN
+    %       Then further restrict these U to those with
+    %           U_{t}(0) = 0, U_{t}(1) = 1
+    %       Pass this set to AMPL as U_PSD_G0_NUM
+    %
+    % PSD_G00
+    %   Start with all Y such that Y_{t} = 0 from above.
+    %   Restrict this set to all Y such that also Y_{t-1} = 0.
+    %   Then repeat the same steps as above with this set.
+    %###########################################################################
+    for t = 1:1:T
+        % Given Y_{t} = 0
+        YPat = -1*ones(1, 1 + T);
+        YPat(t+1) = 0;
+        [YG0Int YG0Wide] = MatchPattern(YPat);
+        FillAMPLSet(ampl, Pending, 'Y_G0', [t], YG0Int(:)');
+        UG0Num = FindConditionalPSDSequences(YG0Wide, T, t);
+        FillAMPLSet(ampl, Pending, 'U_PSD_G0_NUM', [t], UG0Num(:)');
+
+        % Given Y_{t} = 0, Y_{t-1} = 0
+        I = find(YG0Wide(:,1+(t-1)) == 0);
+        YG00Int = YG0Int(I);
+        YG00Wide = YG0Wide(I,:);
+        FillAMPLSet(ampl, Pending, 'Y_G00', [t], YG00Int(:)');
+        UG00Num = FindConditionalPSDSequences(YG00Wide, T, t);
+        FillAMPLSet(ampl, Pending, 'U_PSD_G00_NUM', [t], UG00Num(:)');
+    end
 
-%###############################################################################
-% PSD_G1, PSD_G11
-%
-% Almost identical to the above
-%###############################################################################
-for t = 1:1:T
-    % Given Y_{t} = 1
-    YPat = -1*ones(1, 1 + T);
-    YPat(t+1) = 1;
-    [YG1Int YG1Wide] = MatchPattern(YPat);
-    FillAMPLSet(ampl, 'Y_G1', [t], YG1Int(:)');
-    UG1Num = FindConditionalPSDSequences(YG1Wide, T, t);
-    FillAMPLSet(ampl, 'U_PSD_G1_NUM', [t], UG1Num(:)');
-
-    % Given Y_{t} = 1, Y_{t-1} = 1
-    I = find(YG1Wide(:,1+(t-1)) == 1);
-    YG11Int = YG1Int(I);
-    YG11Wide = YG1Wide(I,:);
-    FillAMPLSet(ampl, 'Y_G11', [t], YG11Int(:)');
-    UG11Num = FindConditionalPSDSequences(YG11Wide, T, t);
-    FillAMPLSet(ampl, 'U_PSD_G11_NUM', [t], UG11Num(:)');
+    %###########################################################################
+    % PSD_G1, PSD_G11
+    %
+    % Almost identical to the above
+    %###########################################################################
+    for t = 1:1:T
+        % Given Y_{t} = 1
+        YPat = -1*ones(1, 1 + T);
+        YPat(t+1) = 1;
+        [YG1Int YG1Wide] = MatchPattern(YPat);
+        FillAMPLSet(ampl, Pending, 'Y_G1', [t], YG1Int(:)');
+        UG1Num = FindConditionalPSDSequences(YG1Wide, T, t);
+        FillAMPLSet(ampl, Pending, 'U_PSD_G1_NUM', [t], UG1Num(:)');
+
+        % Given Y_{t} = 1, Y_{t-1} = 1
+        I = find(YG1Wide(:,1+(t-1)) == 1);
+        YG11Int = YG1Int(I);
+        YG11Wide = YG1Wide(I,:);
+        FillAMPLSet(ampl, Pending, 'Y_G11', [t], YG11Int(:)');
+        UG11Num = FindConditionalPSDSequences(YG11Wide, T, t);
+        FillAMPLSet(ampl, Pending, 'U_PSD_G11_NUM', [t], UG11Num(:)');
+    end
 end
 
 TimeParams = toc(TicParams);
@@ -239,33 +286,43 @@ if Settings.Assumption_ST
             DimST, MaxDimST);
     end
 
-    ampl.getParameter('DIMST').setValues(DimST);
-    USTEquateWide = AllBinaryArray(2*(DimST + 1));
-    USTEquateInt = WideToBinary(USTEquateWide);
-    USTEquateInt = sort(USTEquateInt);
-    FillAMPLSet(ampl, 'U_ST_EQUATE', [], USTEquateInt(:)');
+    if (Built.DimST ~= DimST)
+        if ~isnan(Built.DimST)
+            % The index sets of U_ST and SIGMAST depend on DIMST
+            ampl.eval('reset data DIMST, U_ST_EQUATE, U_ST, SIGMAST;');
+        end
 
-    for u = 1:1:size(USTEquateWide, 1)
-        USeq = USTEquateWide(u,:);
-        USeqInt = WideToBinary(USeq);
+        ampl.getParameter('DIMST').setValues(DimST);
+        USTEquateWide = AllBinaryArray(2*(DimST + 1));
+        USTEquateInt = WideToBinary(USTEquateWide);
+        USTEquateInt = sort(USTEquateInt);
+        FillAMPLSet(ampl, Pending, 'U_ST_EQUATE', [], USTEquateInt(:)');
 
-        for t = 1:1:(T - DimST)
-            UPat = -1*ones(1, 1 + 2*T);
+        for u = 1:1:size(USTEquateWide, 1)
+            USeq = USTEquateWide(u,:);
+            USeqInt = WideToBinary(USeq);
 
-            % First half of USeq gets assigned to (U_{t}(0),...,U_{t+m}(0))
-            % Second half gets assigned to (U_{t}(1),...,U_{t+m}(1))
-            UPat((1 + t):(1 + t + DimST)) ...
-                = USeq(1:(DimST + 1));
-            UPat((1 + T + t):(1 + T + t + DimST))...
-                = USeq((DimST + 2):end);
+            for t = 1:1:(T - DimST)
+                UPat = -1*ones(1, 1 + 2*T);
 
-            USTInt = MatchPattern(UPat);
-            USTInt = sort(USTInt);
+                % First half of USeq gets assigned to
+                %   (U_{t}(0),...,U_{t+m}(0))
+                % Second half gets assigned to
+                %   (U_{t}(1),...,U_{t+m}(1))
+                UPat((1 + t):(1 + t + DimST)) ...
+                    = USeq(1:(DimST + 1));
+                UPat((1 + T + t):(1 + T + t + DimST))...
+                    = USeq((DimST + 2):end);
 
-            FillAMPLSet(ampl, 'U_ST', [t USeqInt], USTInt(:)');
+                USTInt = MatchPattern(UPat);
+                USTInt = sort(USTInt);
+
+                FillAMPLSet(ampl, Pending, 'U_ST', [t USeqInt], USTInt(:)');
+            end
         end
+        clear USTEquateWide USTEquateInt;
+        Built.DimST = DimST;
     end
-    clear USTEquateWide USTEquateInt;
 
     Idx = [];
     Val = [];
@@ -294,7 +351,7 @@ TimeST = toc(TicST);
 % for t ~= s, and d in 0..1
 %###############################################################################
 TicDSC = tic;
-if Settings.Assumption_DSC
+if Settings.Assumption_DSC & ~Built.DSC
     USeqIdx = [];
     USeqInt = [];
     for t = 1:1:T
@@ -316,8 +373,9 @@ if Settings.Assumption_DSC
             end
         end
     end
-    FillAMPLSet(ampl, 'U_DSC', USeqIdx, USeqInt);
+    FillAMPLSet(ampl, Pending, 'U_DSC', USeqIdx, USeqInt);
     clear UPat UDSCInt UIdx USeqInt count;
+    Built.DSC = 1;
 end
 TimeDSC = toc(TicDSC);
 
@@ -342,86 +400,95 @@ if ~ismember(DimMTS, [2:1:T])
             ' and T = %d.'], DimMTS, T);
 end
 
-%###############################################################################
-% A ``conditioning sequence'' refers to
-%    (Y_{t-2},...,Y_{t-q})
-% but does not include Y_{t-1}
-% for q = 2,...,DimMTS
-%
-% The maximum length of a conditioning sequence that starts at time t
-% is (DimMTS - 1) if t - DimMTS >= 0
-% and is (t-1) if t - DimMTS < 0
-%###############################################################################
-MaxLen = nan(T,1);
-for t = 2:1:T
-    if (t - DimMTS) >= 0
-        MaxLen(t,1) = DimMTS - 1;
-    else
-        MaxLen(t,1) = t - 1;
+if (Built.DimMTS ~= DimMTS)
+    if ~isnan(Built.DimMTS)
+        % The index sets of the MTS sets depend on Y_MTS_LENMAX
+        ampl.eval('reset data Y_MTS_LENMAX, Y_MTS_DENOM_SUM, U_MTS_NUMER;');
     end
-end
-ampl.getParameter('Y_MTS_LENMAX').setValues((2:1:t)', MaxLen(2:1:t));
-
-for t = 2:1:T
-for q = 1:1:MaxLen(t)
-    YMTSSumInt = [];
-    YMTSSumWide = [];
-    YMTSSumIdx = [];
-
-    for ytm1 = 0:1:1
-        % For each conditioning sequence y' = (ytm1, y)
-        % find all full sequences yy of length T
-        % such that Pr[y'] = sum {yy} Pr[yy]
-        % This set gets summed over for the denominator term
-        for y = 1:1:size(AllYSeqsWide{q}, 1)
-            YPat = -1*ones(1, 1 + T);
-
-            % Note that position t of YPat corresponds to Y_{t-1}
-            % since MATLAB only does base-1 numbering
-            YPat(t) = ytm1;
-            YPat((t-q):(t-1)) = AllYSeqsWide{q}(y,:);
-            [YMTSSumInt(y,:) YMTSSumWide{y}] = MatchPattern(YPat);
-            YMTSSumIdx(y,:) = [t ytm1 q AllYSeqsInt{q}(y)];
-        end
-        FillAMPLSet(ampl, 'Y_MTS_DENOM_SUM', YMTSSumIdx, YMTSSumInt);
-
-        % Now for each d, and each conditioning sequence y' = (ytm1,y),
-        % find the set of u to sum over in the numerator.
-        % The way I do this is to take the sequences yy of length T
-        % that were determined above to be the ones that would get summed
-        % over to get conditioning sequence y'.
-        % Truncate these sequences yy at time (t-1).
-        % Keep only the unique sequences.
-        % Then use each one to create a pattern for U sequences.
-        % Also, add to this pattern that U_{t}(d) = 1
-        % Get all such U's
-        % Repeat for every unique yy
-        for y = 1:1:size(AllYSeqsWide{q}, 1)
-            YMTSSumTrunc = YMTSSumWide{y}(:,1:t); % time 0 to time t-1
-            YMTSSumTrunc = unique(YMTSSumTrunc, 'rows');
-
-            MTSNumerInt = cell(2,1);
-            for yy = 1:1:size(YMTSSumTrunc, 1)
-                YYSeq = YMTSSumTrunc(yy,:);
-
-                UPatBase = BuildUPatternToMatchY(YYSeq, T);
 
+    %###########################################################################
+    % A ``conditioning sequence'' refers to
+    %    (Y_{t-2},...,Y_{t-q})
+    % but does not include Y_{t-1}
+    % for q = 2,...,DimMTS
+    %
+    % The maximum length of a conditioning sequence that starts at time t
+    % is (DimMTS - 1) if t - DimMTS >= 0
+    % and is (t-1) if t - DimMTS < 0
+    %###########################################################################
+    MaxLen = nan(T,1);
+    for t = 2:1:T
+        if (t - DimMTS) >= 0
+            MaxLen(t,1) = DimMTS - 1;
+        else
+            MaxLen(t,1) = t - 1;
+        end
+    end
+    ampl.getParameter('Y_MTS_LENMAX').setValues((2:1:t)', MaxLen(2:1:t));
+
+    for t = 2:1:T
+    for q = 1:1:MaxLen(t)
+        YMTSSumInt = [];
+        YMTSSumWide = [];
+        YMTSSumIdx = [];
+
+        for ytm1 = 0:1:1
+            % For each conditioning sequence y' = (ytm1, y)
+            % find all full sequences yy of length T
+            % such that Pr[y'] = sum {yy} Pr[yy]
+            % This set gets summed over for the denominator term
+            for y = 1:1:size(AllYSeqsWide{q}, 1)
+                YPat = -1*ones(1, 1 + T);
+
+                % Note that position t of YPat corresponds to Y_{t-1}
+                % since MATLAB only does base-1 numbering
+                YPat(t) = ytm1;
+                YPat((t-q):(t-1)) = AllYSeqsWide{q}(y,:);
+                [YMTSSumInt(y,:) YMTSSumWide{y}] = MatchPattern(YPat);
+                YMTSSumIdx(y,:) = [t ytm1 q AllYSeqsInt{q}(y)];
+            end
+            FillAMPLSet(ampl, Pending, 'Y_MTS_DENOM_SUM', YMTSSumIdx,...
+                YMTSSumInt);
+
+            % Now for each d, and each conditioning sequence y' = (ytm1,y),
+            % find the set of u to sum over in the numerator.
+            % The way I do this is to take the sequences yy of length T
+            % that were determined above to be the ones that would get summed
+            % over to get conditioning sequence y'.
+            % Truncate these sequences yy at time (t-1).
+            % Keep only the unique sequences.
+            % Then use each one to create a pattern for U sequences.
+            % Also, add to this pattern that U_{t}(d) = 1
+            % Get all such U's
+            % Repeat for every unique yy
+            for y = 1:1:size(AllYSeqsWide{q}, 1)
+                YMTSSumTrunc = YMTSSumWide{y}(:,1:t); % time 0 to time t-1
+                YMTSSumTrunc = unique(YMTSSumTrunc, 'rows');
+
+                MTSNumerInt = cell(2,1);
+                for yy = 1:1:size(YMTSSumTrunc, 1)
+                    YYSeq = YMTSSumTrunc(yy,:);
+
+                    UPatBase = BuildUPatternToMatchY(YYSeq, T);
+
+                    for d = 0:1:1
+                        UPat = UPatBase;
+                        UPat(1 + d*T + t) = 1;
+
+                        UList = MatchPattern(UPat);
+
+                        MTSNumerInt{d+1} = [MTSNumerInt{d+1}; UList(:)];
+                    end
+                end
                 for d = 0:1:1
-                    UPat = UPatBase;
-                    UPat(1 + d*T + t) = 1;
-
-                    UList = MatchPattern(UPat);
-
-                    MTSNumerInt{d+1} = [MTSNumerInt{d+1}; UList(:)];
+                    FillAMPLSet(ampl, Pending, 'U_MTS_NUMER',...
+                        [t d ytm1 q AllYSeqsInt{q}(y)], MTSNumerInt{d+1}');
                 end
             end
-            for d = 0:1:1
-                FillAMPLSet(ampl, 'U_MTS_NUMER',...
-                    [t d ytm1 q AllYSeqsInt{q}(y)], MTSNumerInt{d+1}');
-            end
         end
     end
-end
+    end
+    Built.DimMTS = DimMTS;
 end
 TimeMTS = toc(TicMTS);
 
@@ -429,7 +496,7 @@ TimeMTS = toc(TicMTS);
 % TIV
 %###############################################################################
 TicTIV = tic;
-if Settings.Assumption_TIV
+if Settings.Assumption_TIV & ~Built.TIV
     for t = 1:1:T
         for r = 0:1:(t-1)
             for y = 1:1:size(AllYSeqsWide{r+1}, 1)
@@ -443,15 +510,31 @@ if Settings.Assumption_TIV
                         UTIVPat(1 + T + t) = u1;
                         UTIVList = MatchPattern(UTIVPat);
                         UTIVIdx = [t r u0 u1 AllYSeqsInt{r+1}(y)];
-                        FillAMPLSet(ampl, 'U_TIV', UTIVIdx, UTIVList(:)');
+                        FillAMPLSet(ampl, Pending, 'U_TIV', UTIVIdx,...
+                            UTIVList(:)');
                     end
                 end
             end
         end
     end
+    Built.TIV = 1;
 end
 TimeTIV = toc(TicTIV);
 
+%###############################################################################
+% Aggregate latent types and fill in the sets
+%###############################################################################
+TicAggregate = tic;
+if Settings.AggregateLatentTypes
+    if FlagBuildAll
+        Built.Aggregation = AggregateLatentTypes(ampl, Settings, Pending);
+    elseif (Pending.Count > 0)
+        % PrepareAMPLSession only reuses sets with the same AggregationKey
+        error('Sets can only be reused if they are aggregated in the same way.')
+    end
+end
+TimeAggregate = toc(TicAggregate);
+
 if (Settings.Noise >= 1)
     disp(sprintf('Finished creating set definitions in %5.3f seconds:',...
         toc(TicTotal)));
@@ -463,6 +546,7 @@ if (Settings.Noise >= 1)
     disp(sprintf(fmt, 'DSC', TimeDSC));
     disp(sprintf(fmt, 'MTS', TimeMTS));
     disp(sprintf(fmt, 'TIV', TimeTIV));
+    disp(sprintf(fmt, 'Aggregate', TimeAggregate));
     disp(repmat('=', 1, Settings.DisplaySepLen));
 end
 
@@ -532,8 +616,16 @@ end
 % Each row of Val are the values to be set to this index of the set.
 %
 % Note that Val(i,:)' needs to be a column or AMPL will say "too many members"
+%
+% If Pending is a containers.Map then the set is not filled, but is added to
+% Pending to be filled later (see AggregateLatentTypes).
 %###############################################################################
-function FillAMPLSet(ampl, SetName, Idx, Val)
+function FillAMPLSet(ampl, Pending, SetName, Idx, Val)
+    if isa(Pending, 'containers.Map')
+        Pending(Pending.Count + 1) = {SetName, Idx, Val};
+        return;
+    end
+
     a = ampl.getSet(SetName);
     if isempty(Idx)
         assert(min(size(Val,1)) == 1);
@@ -546,3 +638,102 @@ function FillAMPLSet(ampl, SetName, Idx, Val)
         end
     end
 end
+
+%###############################################################################
+% AggregateLatentTypes
+%
+% Every constraint and objective in DPO.mod only depends on P (and H) through
+% sums over sets of latent types intersected with UHAT, and through the total
+% over UHAT. So two latent types in UHAT that are in exactly the same sets can
+% be merged into one, whose probability is the sum of theirs, without changing
+% the value of any of the problems. The only exception is ZeroOne_CNS, which
+% bounds each type, and is scaled by the number of types that were merged
+% (USIZE).
+%
+% Only the sets that are used with the assumptions and parameters in Settings
+% are compared (see DistinguishingSets). The others are still filled in the
+% same way, but would not give the same sums as without aggregation.
+%
+% Each latent type is replaced by the smallest type that it is merged with in
+% UHAT and in every set of latent types in Pending (types that are not in UHAT
+% are left alone since they drop out of the sums), then every set in Pending
+% is filled in the order it was created.
+%
+% Returns the merged types as a structure with
+%   UHat:   the latent types in UHAT without aggregation
+%   Class:  for each type in UHat, the index of its merged type in Rep
+%   Rep:    the latent types that are left in UHAT
+%   Size:   the number of types in UHat merged into each element of Rep
+% (see ExpandAggregatedSolution).
+%###############################################################################
+function Aggregation = AggregateLatentTypes(ampl, Settings, Pending)
+    Calls = values(Pending);
+    Names = cellfun(@(c) c{1}, Calls, 'UniformOutput', false);
+    UHatInt = Calls{find(strcmp(Names, 'UHAT'), 1)}{3};
+    UHatInt = sort(UHatInt(:));
+
+    % Membership of each type in UHAT (rows) in each of the sets (columns)
+    Rows = {};
+    Cols = {};
+    NumCols = 0;
+    for c = find(ismember(Names, DistinguishingSets(Settings)))
+        Val = Calls{c}{3};
+        if isempty(Calls{c}{2})
+            Val = Val(:)';
+        end
+        for i = 1:1:size(Val, 1)
+            [IsIn Loc] = ismember(Val(i,:), UHatInt);
+            Rows{end + 1} = Loc(IsIn)';
+            Cols{end + 1} = (NumCols + i)*ones(sum(IsIn), 1);
+        end
+        NumCols = NumCols + size(Val, 1);
+    end
+    M = sparse(vertcat(Rows{:}, []), vertcat(Cols{:}, []), 1,...
+               length(UHatInt), NumCols) > 0;
+    [~, ~, Class] = unique(full(M), 'rows');
+    clear M Rows Cols;
+
+    Aggregation.UHat = UHatInt;
+    Aggregation.Class = Class;
+    Aggregation.Rep = accumarray(Class, UHatInt, [], @min);
+    Aggregation.Size = accumarray(Class, 1);
+    RepOf = Aggregation.Rep(Class);
+
+    for c = 1:1:length(Calls)
+        [SetName Idx Val] = deal(Calls{c}{:});
+        if strcmp(SetName, 'UHAT')
+            FillAMPLSet(ampl, [], 'UHAT', [], sort(Aggregation.Rep)');
+            ampl.getParameter('USIZE').setValues(Aggregation.Rep,...
+                Aggregation.Size);
+        elseif ~strncmp(SetName, 'U_', 2) | strcmp(SetName, 'U_ST_EQUATE')
+            FillAMPLSet(ampl, [], SetName, Idx, Val);
+        elseif isempty(Idx)
+            FillAMPLSet(ampl, [], SetName, [],...
+                MapToRep(Val(:)', UHatInt, RepOf));
+        else
+            for i = 1:1:size(Idx, 1)
+                FillAMPLSet(ampl, [], SetName, Idx(i,:),...
+                    MapToRep(Val(i,:), UHatInt, RepOf));
+            end
+        end
+    end
+
+    if (Settings.Noise >= 1)
+        disp(sprintf(['Aggregated %d latent types in UHAT into %d '...
+                      '(%4.1f%% fewer).'], length(UHatInt),...
+                     length(Aggregation.Rep),...
+                     100*(1 - length(Aggregation.Rep)/length(UHatInt))));
+    end
+end
+
+%###############################################################################
+% MapToRep
+%
+% Replace the latent types in V that are in UHatInt by the type that they are
+% merged with, and remove the duplicates.
+%###############################################################################
+function V = MapToRep(V, UHatInt, RepOf)
+    [IsIn Loc] = ismember(V, UHatInt);
+    V(IsIn) = RepOf(Loc(IsIn));
+    V = unique(V);
+end
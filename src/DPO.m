@@ -8,6 +8,11 @@
 % Input:
 %   SettingsIn
 %       a structure containing all options (see defaults below)
+%   DataIn
+%       optional data to use instead of loading Settings.DataPath
+%       (pass [] to skip)
+%   Session
+%       optional session returned by a previous call (see below)
 %
 % Output:
 %   Results
@@ -16,14 +21,24 @@
 %       the updated structure of settings, which might be useful
 %   Data
 %       the data -- useful if running a Monte Carlo
+%   Session
+%       if this output is requested, then the AMPL instance is left open and
+%       returned in Session so that it can be passed to the next call.
+%       Creating the set definitions is then only done once for all calls with
+%       the same T and observed sequences (see PrepareAMPLSession).
+%       Close it with Session.ampl.close() when done.
+%       If Settings.AggregateLatentTypes is on, then Session.Sets.Aggregation
+%       describes which latent types were merged (see CreateAMPLSets and
+%       ExpandAggregatedSolution).
 %###############################################################################
-function [Results Settings Data] = DPO(SettingsIn, DataIn)
+function [Results Settings Data Session] = DPO(SettingsIn, DataIn, Session)
 %###############################################################################
 % Define defaults, apply input
 %###############################################################################
 % Settings that control the data, model, modelling assumptions, and parameters
 Settings.DataPath = '';
 Settings.T = [];
+Settings.AgeBinEdges = []; % Age cells in Data.Cells; [] is one cell per age
 Settings.OptPeriod = [];
 Settings.Parameters = {'PSD', 'PSD_G0', 'PSD_G00', 'PSD_G1', 'PSD_G11'};
 Settings.Assumption_MTR = 0;
@@ -46,6 +61,8 @@ Settings.PointsToTest = {};
 Settings.AssumeIDSetNonempty = 0;
 Settings.ComputeCFHNBounds = 1;
 Settings.CalculateMaxImpliedChange = 1;
+Settings.CacheDir = ''; % Where to cache results that can be reused across runs
+Settings.SaveBootstrapDir = ''; % Where to save bootstrap statistics, if at all
 
 % Settings that control options or tuning parameters for statistical inference
 Settings.B = 500;
@@ -55,6 +72,9 @@ Settings.SSExp = 2/3;
 Settings.Tests = {'CNS'};
 Settings.LevelsCR = [.05];
 Settings.LevelsTestList = [.01 .05 .10];
+Settings.SequentialBootstrap = 0; % Stop once decisions are known
+Settings.PriorCR = []; % Predicted CR endpoints (see BuildConfidenceRegions)
+Settings.PriorCRWidth = .005; % Initial width of brackets around PriorCR
 
 % Less important numerical tuning parameters and solver options
 Settings.Solver = 'cplex';
@@ -66,6 +86,8 @@ Settings.FeasTolStepFactor = 10;
 Settings.FeasTolMax = 1e-3;
 Settings.PreSolveEps = 1e-10;
 Settings.DeclareCriterionToBeZeroTol = 1e-6;
+Settings.AggregateLatentTypes = 0; % Merge latent types the LPs can't tell apart
+                                   % (1 once validated, 2 to skip the check)
 
 % Output options
 Settings.Noise = 1;
@@ -78,6 +100,9 @@ if ~isstruct(SettingsIn)
 else
     Settings = UpdateStruct(Settings, SettingsIn, 1);
 end
+if ~exist('Session', 'var')
+    Session = [];
+end
 
 if Settings.GetDefaultSettings
     Results = [];
@@ -113,7 +138,7 @@ end
 % Load data into Matlab (not AMPL)
 % If DataIn was passed then bypass this -- this is only used for Monte Carlos
 %###############################################################################
-if ~exist('DataIn')
+if ~exist('DataIn') | isempty(DataIn)
     [Settings Data] = LoadData(Settings);
 else
     Data = DataIn;
@@ -122,15 +147,32 @@ else
 end
 
 %###############################################################################
-% Initialize an instance of AMPL
+% Aggregating latent types is only allowed once ValidateAggregation has found
+% that it gives the same bounds for these assumptions and parameters
+%###############################################################################
+if ~ismember(Settings.AggregateLatentTypes, [0 1 2])
+    error('Settings.AggregateLatentTypes should be 0, 1 or 2.')
+end
+if (Settings.AggregateLatentTypes == 1)
+    [~, Validated] = ResultCache(Settings, 'AggregationValidated',...
+        AggregationKey(Settings, Data));
+    if ~Validated
+        error(['Aggregating latent types has not been validated for these '...
+               'assumptions and parameters. Run ValidateAggregation first, '...
+               'or set Settings.AggregateLatentTypes = 2 to skip the '...
+               'check.']);
+    end
+end
+
+%###############################################################################
+% Initialize an instance of AMPL (or reuse the one in Session)
 % Set some solver options (inside InitializeAMPL)
 % Create set definitions (this can take a while)
 %###############################################################################
-ampl = InitializeAMPL({'DPO.mod'}, Settings);
-CleanUpAMPL = onCleanup(@()ampl.close());
-
-% Create set definitions in AMPL
-CreateAMPLSets(ampl, Settings, Data);
+[ampl Session] = PrepareAMPLSession(Session, Settings, Data);
+if (nargout < 4)
+    CleanUpAMPL = onCleanup(@()ampl.close());
+end
 
 %###############################################################################
 % Update data (probabilities) in AMPL
@@ -151,33 +193,18 @@ if (Settings.Noise >= 1)
     disp(repmat('=', 1, Settings.DisplaySepLen));
 end
 
+% Solver iterations used for bootstrap problems
+% [Iterations Solves]
+Results.LPIterations = zeros(1, 2);
+
 %###############################################################################
 % Calculate max implied change in PSD under Sigma_ST
 %###############################################################################
 if Settings.CalculateMaxImpliedChange
-    Results.MaxImpliedChange = zeros(Settings.T, Settings.T);
-    ChangeOptimizationProblem(ampl, Settings, 'MaxImpliedChange');
-
-    for t = 1:1:Settings.T
-        for tt = 1:1:Settings.T
-            if (tt == t)
-                continue; % obviously 0 in this case
-            end
-            ObjectiveName = sprintf('ChangeInPSD[%d, %d];', t, tt);
-            ampl.eval(['objective ' ObjectiveName ';']);
-
-            if Settings.NoisyOptimization
-                eval('ampl.solve');
-            else
-                evalc('ampl.solve');
-            end
-
-            SolveResult = ampl.getValue('solve_result');
-            assert(~strcmp(SolveResult, 'infeasible')); % should not be infeas
-
-            Results.MaxImpliedChange(t,tt) = ...
-                SafelyGetObjective(ampl, ObjectiveName);
-        end
+    [Results.MaxImpliedChange CacheHit] = ...
+        ComputeMaxImpliedChange(ampl, Settings);
+    if (Settings.Noise >= 1) & CacheHit
+        disp('Reusing cached max implied change in PSD.');
     end
 else
     Results.MaxImpliedChange = -1*ones(Settings.T, Settings.T);
@@ -202,31 +229,54 @@ if (Settings.Noise >= 1)
 end
 
 %###############################################################################
-% Test a list of points
+% Test a list of points and conduct misspecification test
+%
+% These are done together with one pass over the bootstrap draws for each test
+% (see TestRequests).
 %###############################################################################
+Requests = struct('Param', {}, 'Points', {}, 'Levels', {});
 if Settings.TestAListOfPoints
     if ~isnumeric(Settings.LevelsTestList) | ~all(Settings.LevelsTestList > 0)
         error('LevelsTestList is incorrectly specified.')
     end
 
     for p = 1:1:length(Settings.ParametersToTest)
-        Settings.ActiveParam = Settings.ParametersToTest{p};
+        Requests(end + 1) = struct('Param', Settings.ParametersToTest{p},...
+                                   'Points', Settings.PointsToTest{p},...
+                                   'Levels', Settings.LevelsTestList);
         if (Settings.Noise >= 1)
             str = sprintf('Testing these points for %s:\n\t',...
-                Settings.ActiveParam);
+                Settings.ParametersToTest{p});
             str = [str sprintf('%5.3f  ', Settings.PointsToTest{p})];
             disp(str);
         end
+    end
+end
+if (Settings.RunMisspecificationTest)
+    if (Settings.Noise >= 1)
+        disp('Conducting a misspecification test...')
+    end
+    % Note that what you put for "Points" is not important w/ MS
+    % as long as it is a scalar (otherwise you run it multiple times)
+    Requests(end + 1) = struct('Param', 'MS', 'Points', [-123], 'Levels', []);
+end
+if ~isempty(Requests)
+    [Requests Iterations] = TestRequests(ampl, Settings, Data, Requests);
+    Results.LPIterations = Results.LPIterations + Iterations;
+end
 
-        [Results.TS{p} Results.PValue{p} Results.CV{p} Results.Reject{p}] ...
-            = TestListOfPoints(ampl, Settings, Data,...
-                Settings.PointsToTest{p}, Settings.LevelsTestList);
+if Settings.TestAListOfPoints
+    for p = 1:1:length(Settings.ParametersToTest)
+        Results.TS{p} = Requests(p).TS;
+        Results.PValue{p} = Requests(p).PValue;
+        Results.CV{p} = Requests(p).CV;
+        Results.Reject{p} = Requests(p).Reject;
 
         if (Settings.Noise >= 1)
             DisplayTable = table(Settings.PointsToTest{p}, Results.PValue{p})
             DisplayTable.Properties.VariableNames = {'Point', 'PValue'};
 
-            disp('Done. P-values:')
+            disp(['Done. P-values for ' Settings.ParametersToTest{p} ':'])
             disp(DisplayTable);
             disp(repmat('=', 1, Settings.DisplaySepLen));
         end
@@ -243,6 +293,19 @@ else
     Results.Reject{1} = Results.CV{1};
 end
 
+if (Settings.RunMisspecificationTest)
+    Results.MSTS = Requests(end).TS;
+    Results.MSPValue = Requests(end).PValue;
+    if (Settings.Noise >= 1)
+        disp(sprintf('Misspecification test p-value was %7.5f',...
+            Results.MSPValue));
+        disp(repmat('=', 1, Settings.DisplaySepLen));
+    end
+else
+    Results.MSTS = -1;
+    Results.MSPValue = -1*ones( 1, length(Settings.Tests));
+end
+
 %###############################################################################
 % Construct confidence intervals -- if flag is on
 %###############################################################################
@@ -250,10 +313,16 @@ if Settings.BuildConfidenceRegions
     if ~isnumeric(Settings.LevelsCR) | ~all(Settings.LevelsCR > 0)
         error('LevelsCR is incorrectly specified.')
     end
+    if ~isempty(Settings.PriorCR) & ...
+        ~isequal(size(Settings.PriorCR), [length(Settings.ParametersToTest) 2])
+        error('PriorCR is incorrectly specified.')
+    end
     if (Settings.Noise >= 1)
         disp('Building confidence regions...')
     end
-    Results.CR = BuildConfidenceRegions(ampl, Settings, Data, Results.Bounds);
+    [Results.CR Iterations] = ...
+        BuildConfidenceRegions(ampl, Settings, Data, Results.Bounds);
+    Results.LPIterations = Results.LPIterations + Iterations;
 
     if (Settings.Noise >= 1)
         disp(repmat('=', 1, Settings.DisplaySepLen));
@@ -268,25 +337,10 @@ else
     CR(:,:,:,2) = -1;
 end
 
-%###############################################################################
-% Conduct misspecification test
-%###############################################################################
-if (Settings.RunMisspecificationTest)
-    if (Settings.Noise >= 1)
-        disp('Conducting a misspecification test...')
-    end
-    Settings.ActiveParam = 'MS';
-    % Note that what you put for "Points" is not important w/ MS
-    % as long as it is a scalar (otherwise you run it multiple times)
-    [Results.MSTS Results.MSPValue] = ...
-        TestListOfPoints(ampl, Settings, Data, [-123]);
-    if (Settings.Noise >= 1)
-        disp(sprintf('p-value was %7.5f', Results.MSPValue));
-        disp(repmat('=', 1, Settings.DisplaySepLen));
-    end
-else
-    Results.MSTS = -1;
-    Results.MSPValue = -1*ones( 1, length(Settings.Tests));
+if (Settings.Noise >= 1) & (Results.LPIterations(2) > 0)
+    It = Results.LPIterations;
+    disp(sprintf('Bootstrap problems: %d solves (%.1f iterations each).',...
+                 It(2), It(1)/It(2)));
 end
 
 if (Settings.Noise >= 1)
@@ -43,14 +43,20 @@ param Q_Sample {y in YHAT} default Q[y];
 #               U_{1}(1),...,U_{T}(1))
 # This set is only indexed over UHAT for computational speed.
 # H[u] is the local deviation version used in CNS
+#
+# If latent types are aggregated (see AggregateLatentTypes in CreateAMPLSets.m)
+# then each u in UHAT stands for USIZE[u] latent types that are in exactly the
+# same sets, and P[u] is the sum of their probabilities.
 ################################################################################
 set UHAT within DomU;
+param USIZE {u in UHAT} integer >= 1, default 1;
 var P {u in UHAT} in [0,1];
 var H {u in UHAT} default 0;
 
 param r_ZeroOne_CNS >= 0, default 0;
 subject to ZeroOne_CNS {u in UHAT}:
-    1 - r_ZeroOne_CNS >= P[u] + H[u]/SQRTN >= r_ZeroOne_CNS;
+    USIZE[u]*(1 - r_ZeroOne_CNS) >= P[u] + H[u]/SQRTN
+        >= USIZE[u]*r_ZeroOne_CNS;
 
 #*******************************************************************************
 #*******************************************************************************
@@ -835,3 +841,7 @@ subject to EstimatedIDSet_Sample: # Used in CNS to keep sample probabilities
     Criterion_Sample <= CriterionHat*(1 + Tau);
 
 maximize ChangeInPSD {t in 1..T, tt in 1..T}: PSD[t] - PSD[tt];
+
+# Filled in by the batch of solves in ComputeMaxImpliedChange
+param MaxImpliedChangeVal {t in 1..T, tt in 1..T} default 0;
+param MaxImpliedChangeResult {t in 1..T, tt in 1..T} symbolic default '';
@@ -0,0 +1,35 @@
+%###############################################################################
+% DistinguishingSets
+%
+% Sets of latent types that the problems for Settings sum over.
+% U_OEQ is the data. The sets for the conditional PSD parameters are always
+% used since PSD_G0_Bound and the like are imposed when estimating the
+% identified set of any parameter.
+%###############################################################################
+function Names = DistinguishingSets(Settings)
+    Names = {'U_OEQ',...
+             'U_PSD_G0_NUM', 'U_PSD_G00_NUM', 'U_PSD_G1_NUM', 'U_PSD_G11_NUM'};
+    if any(ismember(Settings.Parameters, {'PSD', 'ATE', 'TSD'})) ...
+        | Settings.CalculateMaxImpliedChange
+        Names = [Names {'U_PSD'}];
+    end
+    if any(ismember(Settings.Parameters, {'NSD', 'ATE', 'TSD'})) ...
+        | Settings.Assumption_MTR
+        Names = [Names {'U_NSD'}];
+    end
+    if Settings.Assumption_MATR
+        Names = [Names {'U_AE0', 'U_AE1'}];
+    end
+    if Settings.Assumption_ST
+        Names = [Names {'U_ST'}];
+    end
+    if Settings.Assumption_DSC
+        Names = [Names {'U_DSC'}];
+    end
+    if Settings.Assumption_MTS
+        Names = [Names {'U_MTS_NUMER'}];
+    end
+    if Settings.Assumption_TIV
+        Names = [Names {'U_TIV'}];
+    end
+end
@@ -8,13 +8,35 @@
 %
 % Bounds will be +/- Inf if infeasible, but this is only possible if the sample
 % identified set is empty and the user opts to assume that it is non-empty.
+%
+% The minimum criterion and the bounds for each parameter are cached (see
+% ResultCache) by the data in AMPL and the settings that affect them, so they
+% are reused by any other run with the same data and assumptions, even if it
+% is for different parameters or does different inference.
 %*******************************************************************************
 function [Bounds MinCriterion] = EstimateIdentifiedSet(ampl, Settings)
+    % Settings that do not affect the bounds
+    PROCEDUREFIELDS = {'Parameters', 'ParametersToTest', 'PointsToTest',...
+        'BuildConfidenceRegions', 'RunMisspecificationTest',...
+        'TestAListOfPoints', 'LevelsCR', 'LevelsTestList', 'Tests',...
+        'SequentialBootstrap', 'CalculateMaxImpliedChange',...
+        'ComputeCFHNBounds', 'B', 'InitialSeed', 'SSExp', 'BracketTol',...
+        'SkipTestingTol', 'RejectTol', 'PriorCR',...
+        'PriorCRWidth', 'ActiveParam'};
+    YHat = cell2mat(cell(ampl.getSet('YHAT').get().toArray()));
+    Q = ampl.getData('Q').getColumnAsDoubles('Q');
+    BaseKey = ComputeHash(HashSettings(Settings, PROCEDUREFIELDS), YHat, Q);
+
     if (Settings.Noise >= 1)
         disp('Finding minimum criterion ...');
     end
 
-    if Settings.AssumeIDSetNonempty
+    [MinCriterion CacheHit] = ResultCache(Settings, 'MinCriterion', BaseKey);
+    if CacheHit
+        if (Settings.Noise >= 1)
+            disp(sprintf('\tReusing cached value of %19.16f.', MinCriterion));
+        end
+    elseif Settings.AssumeIDSetNonempty
         MinCriterion = 0;
 
         if (Settings.Noise >= 1)
@@ -33,6 +55,9 @@ function [Bounds MinCriterion] = EstimateIdentifiedSet(ampl, Settings)
             disp(repmat('=', 1, Settings.DisplaySepLen));
         end
     end
+    if ~CacheHit
+        ResultCache(Settings, 'MinCriterion', BaseKey, MinCriterion);
+    end
 
     Bounds = zeros(length(Settings.Parameters), 2);
     Bounds(:,1) = +Inf;
@@ -55,6 +80,16 @@ function [Bounds MinCriterion] = EstimateIdentifiedSet(ampl, Settings)
     end
 
     for j = 1:1:length(Settings.Parameters)
+        Key = ComputeHash(BaseKey, Settings.Parameters{j});
+        [Cached CacheHit] = ResultCache(Settings, 'Bounds', Key);
+        if CacheHit
+            if FlagCompute & (Cached(1) == +Inf)
+                return;
+            end
+            Bounds(j,:) = Cached;
+            continue;
+        end
+
         ObjectiveName = ['min' Settings.Parameters{j}];
         ampl.eval(['objective ' ObjectiveName ';']);
 
@@ -75,6 +110,7 @@ function [Bounds MinCriterion] = EstimateIdentifiedSet(ampl, Settings)
         end
 
         if FlagCompute & FlagInfeasible % Return all bounds as +Inf/-Inf
+            ResultCache(Settings, 'Bounds', Key, [+Inf -Inf]);
             return;
         end
 
@@ -93,5 +129,6 @@ function [Bounds MinCriterion] = EstimateIdentifiedSet(ampl, Settings)
         SolveResult = ampl.getValue('solve_result');
         assert(strcmp(SolveResult, 'infeasible') == 0);
         Bounds(j,2) = SafelyGetObjective(ampl, ObjectiveName);
+        ResultCache(Settings, 'Bounds', Key, Bounds(j,:));
     end
 end
@@ -0,0 +1,46 @@
+%###############################################################################
+% ExpandAggregatedSolution
+%
+% Values of variable Name (P by default, or H) from the last solve for every
+% latent type in UHAT as it would be without aggregation.
+%
+% Aggregation is Session.Sets.Aggregation from DPO (see AggregateLatentTypes
+% in CreateAMPLSets). Each merged type stands for Aggregation.Size latent
+% types, and its value is split equally among them. This satisfies every
+% constraint in DPO.mod that the merged value does, and gives the same value
+% for every parameter, since these only depend on the sums over the merged
+% types.
+% If Aggregation is empty (no aggregation) then the values are returned as
+% they are.
+%
+% Output:
+%   U:      the latent types in UHAT, sorted
+%   Value:  the value of Name for each of these
+%###############################################################################
+function [U Value] = ExpandAggregatedSolution(ampl, Aggregation, Name)
+    if ~exist('Name', 'var')
+        Name = 'P';
+    end
+
+    df = ampl.getVariable(Name).getValues('val');
+    h = df.getHeaders();
+    USolved = cell2mat(df.getColumn(h(1)));
+    ValueSolved = df.getColumnAsDoubles('val');
+    [USolved Order] = sort(USolved(:));
+    ValueSolved = ValueSolved(Order);
+
+    if isempty(Aggregation)
+        U = USolved;
+        Value = ValueSolved;
+        return;
+    end
+
+    [IsIn Loc] = ismember(Aggregation.Rep, USolved);
+    if ~all(IsIn)
+        error('The solution does not match the aggregation that was passed.');
+    end
+    RepValue = ValueSolved(Loc);
+
+    U = Aggregation.UHat;
+    Value = RepValue(Aggregation.Class)./Aggregation.Size(Aggregation.Class);
+end
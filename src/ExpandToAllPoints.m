@@ -0,0 +1,22 @@
+%*******************************************************************************
+% ExpandToAllPoints
+%
+% Put values for the points still being tested into a matrix with a row for
+% every point, and NaN for the points that have been dropped in sequential mode
+% (see MonteCarlo).
+% v is either a vector with one value for each active point, or a matrix
+% with a row for each of these and a column for each test (e.g. PValue). The
+% columns are kept, so printing Full(:) with a format for NumPoints values
+% gives one line per column, as before points could be dropped.
+%*******************************************************************************
+function Full = ExpandToAllPoints(v, Active)
+    if isvector(v) & (length(v) == sum(Active))
+        v = v(:);
+    end
+    if (size(v, 1) ~= sum(Active))
+        error('Expected a row of v for each of the %d active points.',...
+            sum(Active));
+    end
+    Full = nan(length(Active), size(v, 2));
+    Full(Active,:) = v;
+end
@@ -0,0 +1,19 @@
+%*******************************************************************************
+% HashFiles
+%
+% Hash of the names (without directory) and contents of a list of files.
+%*******************************************************************************
+function Hash = HashFiles(FileList)
+    Contents = cell(2, length(FileList));
+    for i = 1:1:length(FileList)
+        fid = fopen(FileList{i}, 'r');
+        if (fid < 0)
+            error('Could not open %s to hash it.', FileList{i});
+        end
+        [~, Name, Ext] = fileparts(FileList{i});
+        Contents{1,i} = [Name Ext];
+        Contents{2,i} = fread(fid, Inf, '*uint8');
+        fclose(fid);
+    end
+    Hash = ComputeHash(Contents);
+end
@@ -0,0 +1,19 @@
+%*******************************************************************************
+% HashSettings
+%
+% Hash of the fields of Settings that can change what is computed.
+% Fields that only control screen output or where files are kept are always
+% left out, as are the fields listed in Exclude.
+% The data file is left out since it is hashed by content (see HashFiles).
+%*******************************************************************************
+function Hash = HashSettings(Settings, Exclude)
+    OUTPUTFIELDS = {'Noise', 'NoisyOptimization', 'DisplaySepLen',...
+                    'GetDefaultSettings', 'CacheDir', 'DataPath',...
+                    'BSProgressFrequency', 'SaveBootstrapDir'};
+    if ~exist('Exclude', 'var')
+        Exclude = {};
+    end
+
+    Drop = intersect(fieldnames(Settings), [OUTPUTFIELDS Exclude]);
+    Hash = ComputeHash(rmfield(Settings, Drop));
+end
@@ -2,8 +2,16 @@
 % InitializeAMPL
 %
 % Start an AMPL instance and load model files
+%
+% If an existing instance is passed as ampl then the model files are assumed
+% to be loaded already, and only the options are reset to their defaults.
 %*******************************************************************************
-function [ampl] = InitializeAMPL(ModelFiles, Settings)
+function [ampl] = InitializeAMPL(ModelFiles, Settings, ampl)
+    if exist('ampl', 'var') & ~isempty(ampl)
+        SetAMPLOptions(ampl, Settings);
+        return;
+    end
+
     ampl = AMPL;
 
     for m = 1:1:length(ModelFiles)
@@ -7,6 +7,10 @@
 % times should be numbered starting from 0
 %
 % Data should be sorted by ID then t
+%
+% Data.Cells is a sparse tensor of counts by (history, age cell) that is used
+% in place of the row-level data where possible (see BuildCellTensor).
+% Age cells are set by Settings.AgeBinEdges.
 %###############################################################################
 function [Settings Data] = LoadData(Settings)
     if exist(Settings.DataPath, 'file') ~= 2
@@ -52,4 +56,16 @@ function [Settings Data] = LoadData(Settings)
     % HARDCODED
     %###########################################################################
     Data.Age = reshape(cell2mat(DataIn(IdxT, 4)), Settings.T + 1, Settings.N)';
+
+    %%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+    % TABULATE INTO (HISTORY, COVARIATE CELL) COUNTS
+    %%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+    if ~isfield(Settings, 'AgeBinEdges')
+        Settings.AgeBinEdges = [];
+    end
+    Data.Cells = BuildCellTensor(Data.Y, Data.Age, Settings.AgeBinEdges);
+    if (Settings.Noise >= 1)
+        disp(sprintf('%d observations in %d occupied (history, age) cells.',...
+            Settings.N, nnz(Data.Cells.Counts)));
+    end
 end
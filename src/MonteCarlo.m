@@ -1,5 +1,12 @@
 %*******************************************************************************
 % MonteCarlo
+%
+% Replication m always draws its data with seed MCSettings.InitialSeed + m, so
+% a study can be split into shards that each run replications FirstM through
+% LastM in a separate process.
+% A shard also writes Replications.out (the m for each row of its output) and
+% Shard.out (FirstM, LastM and M), which ./post/MergeMCShards.py uses to put
+% the shards back together into the files that one process would have written.
 %*******************************************************************************
 function MonteCarlo(DPOSettings, MCSettingsIn)
     % Default MC Settings
@@ -8,12 +15,39 @@ function MonteCarlo(DPOSettings, MCSettingsIn)
     MCSettings.InitialSeed = 3131;
     MCSettings.ProgressFrequency = 10;
     MCSettings.PrintCols = 8;
+    MCSettings.FirstM = 1;
+    MCSettings.LastM = []; % Empty means M
+
+    % Sequential mode: stop testing a point once the rejection probability of
+    % every (level, test) for it is settled, and stop the whole study once
+    % every point is settled (or at M).
+    % A rejection probability is settled once at least MinM replications have
+    % been run and its Wilson confidence interval (at level 1 - SeqAlpha)
+    % either has half-width below TargetHalfWidth or excludes the nominal
+    % level. Points that are no longer tested are recorded as NaN.
+    MCSettings.Sequential = 0;
+    MCSettings.MinM = 50;
+    MCSettings.SeqAlpha = .05;
+    MCSettings.TargetHalfWidth = .02;
 
     % Replace with user input
     if exist('MCSettingsIn')
         MCSettings = UpdateStruct(MCSettings, MCSettingsIn, 1);
     end
 
+    if isempty(MCSettings.LastM)
+        MCSettings.LastM = MCSettings.M;
+    end
+    if ~((1 <= MCSettings.FirstM) & (MCSettings.FirstM <= MCSettings.LastM) ...
+         & (MCSettings.LastM <= MCSettings.M))
+        error('MCSettings.FirstM and MCSettings.LastM are incorrectly set.')
+    end
+    FlagShard = (MCSettings.FirstM > 1) | (MCSettings.LastM < MCSettings.M);
+    if FlagShard & MCSettings.Sequential
+        % Which points are still tested depends on all earlier replications
+        error('MCSettings.Sequential cannot be used with a shard of a study.')
+    end
+
     % Fill in any defaults for DPOSettings since some may be used below
     DPOSettings.GetDefaultSettings = 1;
     [~, DPOSettings] = DPO(DPOSettings);
@@ -26,6 +60,11 @@ function MonteCarlo(DPOSettings, MCSettingsIn)
     DPOSettings.ParametersToTest = {DPOSettings.Parameters{1}};
     DPOSettings.BuildConfidenceRegions = 0;
     DPOSettings.RunMisspecificationTest = 0;
+    if MCSettings.Sequential & ~DPOSettings.TestAListOfPoints
+        warning(['MCSettings.Sequential has no effect unless'...
+                 ' DPOSettings.TestAListOfPoints = 1.']);
+        MCSettings.Sequential = 0;
+    end
 
     %%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
     % Run DPO once with original (DGP) data, and record true bounds
@@ -99,6 +138,13 @@ function MonteCarlo(DPOSettings, MCSettingsIn)
     FileMinCriterion = fopen('MinCriterion.out', 'w');
     FileTS = fopen('TestStatistic.out', 'w');
     FileTimes = fopen('Times.out', 'w');
+    if FlagShard
+        fid = fopen('Shard.out', 'w');
+        fprintf(fid, '%d %d %d\n',...
+                MCSettings.FirstM, MCSettings.LastM, MCSettings.M);
+        fclose(fid);
+        FileReplications = fopen('Replications.out', 'w');
+    end
 
     %%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
     % Define some variables for formatting output
@@ -128,8 +174,18 @@ function MonteCarlo(DPOSettings, MCSettingsIn)
     %%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
     DPOSettings.Noise = 0;
     N = round(DGPSettings.N*MCSettings.NMultiplier); % Sample size for MC
+
+    % Running rejection counts by (level, point, test)
+    AllPoints = DPOSettings.PointsToTest{1};
+    NumPoints = length(AllPoints);
+    Active = true(1, NumPoints);
+    RejCount = zeros(length(DPOSettings.LevelsTestList),...
+                     NumPoints, length(DPOSettings.Tests));
+    RejM = zeros(size(RejCount));
+
     disp('Beginning Monte Carlo simulation.')
-    for m = 1:1:MCSettings.M
+    Session = []; % Reuse one AMPL instance across replications
+    for m = MCSettings.FirstM:1:MCSettings.LastM
         if (mod(m,MCSettings.ProgressFrequency) == 0)
             disp(sprintf('Starting replication %d.', m));
         end
@@ -141,35 +197,60 @@ function MonteCarlo(DPOSettings, MCSettingsIn)
         Data = ResampleData(DGPData, N, 1, Seed);
 
         % Run DPO
-        [Results(m), ~, ~] = DPO(DPOSettings, Data);
+        DPOSettings.PointsToTest{1} = AllPoints(Active);
+        [Results(m), ~, ~, Session] = DPO(DPOSettings, Data, Session);
+        Fill = @(v) ExpandToAllPoints(v, Active);
 
         % Record
         fprintf(FileBounds{1}, [PFmtBoundsVec], Results(m).Bounds(:,1));
         fprintf(FileBounds{2}, [PFmtBoundsVec], Results(m).Bounds(:,2));
         if DPOSettings.TestAListOfPoints
-            fprintf(FilePValue, PFmtPtsVec, Results(m).PValue{1}(:));
+            % One line per test, as PValue is NumPoints x NumTests
+            fprintf(FilePValue, PFmtPtsVec, Fill(Results(m).PValue{1}));
 
             for j = 1:1:length(DPOSettings.Tests)
                 for a = 1:1:length(DPOSettings.LevelsTestList)
                     fprintf(FileCV(a,j),...
                             PFmtPtsVec,...
-                            Results(m).CV{1}(a,:,j));
+                            Fill(Results(m).CV{1}(a,:,j)));
                     fprintf(FileRej(a,j),...
                             PFmtPtsVecInt,...
-                            Results(m).Reject{1}(a,:,j));
-                    RejCount = zeros(size(Results(1).Reject{1}(a,:,j)));
-                    for mm = 1:1:m
-                        RejCount =    RejCount ...
-                                    + Results(mm).Reject{1}(a,:,j);
-                    end
-                    RejProb = RejCount/m;
+                            Fill(Results(m).Reject{1}(a,:,j)));
+                    RejCount(a,Active,j) =    RejCount(a,Active,j) ...
+                                            + Results(m).Reject{1}(a,:,j);
+                    RejM(a,Active,j) = RejM(a,Active,j) + 1;
+                    RejProb = RejCount(a,:,j)./RejM(a,:,j);
                     fprintf(FileRejProb(a,j), PFmtPtsVec, RejProb);
                 end
             end
         end
         fprintf(FileMinCriterion, [PFmt '\n'], Results(m).MinCriterion);
-        fprintf(FileTS, PFmtPtsVec, Results(m).TS{1}(:));
+        fprintf(FileTS, PFmtPtsVec, Fill(Results(m).TS{1}));
         fprintf(FileTimes, [PFmt '\n'], toc/60);
+        if FlagShard
+            % Written last, so that every replication listed here is complete
+            fprintf(FileReplications, '%d\n', m);
+        end
+
+        if MCSettings.Sequential & (m >= MCSettings.MinM)
+            Settled = RejectionProbabilitySettled(RejCount, RejM,...
+                DPOSettings.LevelsTestList, MCSettings);
+            NewlySettled = Active & all(all(Settled, 1), 3);
+            if any(NewlySettled)
+                disp(sprintf(['Replication %d: rejection probabilities '...
+                              'settled for points %s.'],...
+                             m, num2str(AllPoints(NewlySettled))));
+                Active(NewlySettled) = false;
+            end
+            if ~any(Active)
+                disp(sprintf(['All rejection probabilities settled after '...
+                              '%d of %d replications.'], m, MCSettings.M));
+                break;
+            end
+        end
+    end
+    if ~isempty(Session)
+        Session.ampl.close();
     end
     fclose('all');
     disp(repmat('=', 1, DPOSettings.DisplaySepLen));
@@ -180,3 +261,26 @@ function MonteCarlo(DPOSettings, MCSettingsIn)
     disp(repmat('=', 1, DPOSettings.DisplaySepLen));
     disp(repmat('=', 1, DPOSettings.DisplaySepLen));
 end
+
+%*******************************************************************************
+% RejectionProbabilitySettled
+%
+% Wilson score intervals for each (level, point, test) rejection probability.
+% Settled is true where the interval is narrow enough or excludes the nominal
+% level. The intervals are not adjusted for looking after every replication,
+% so SeqAlpha should be taken as a rough guide rather than an exact level.
+%*******************************************************************************
+function Settled = RejectionProbabilitySettled(RejCount, RejM, Levels,...
+                                               MCSettings)
+    z = sqrt(2)*erfinv(1 - MCSettings.SeqAlpha);
+    PHat = RejCount./max(RejM, 1);
+    Center = (PHat + z^2./(2*RejM))./(1 + z^2./RejM);
+    HalfWidth = (z./(1 + z^2./RejM)).*...
+                sqrt(PHat.*(1 - PHat)./RejM + z^2./(4*RejM.^2));
+    Nominal = repmat(Levels(:), 1, size(RejCount, 2), size(RejCount, 3));
+    Settled =    (RejM >= MCSettings.MinM) ...
+              & (   (HalfWidth <= MCSettings.TargetHalfWidth) ...
+                  | (Center - HalfWidth > Nominal) ...
+                  | (Center + HalfWidth < Nominal));
+end
+
@@ -12,6 +12,7 @@ Settings.DataPath = '';
 Settings.T = [];
 Settings.TimeDummies = 1;
 Settings.Age = 0;
+Settings.AgeBinEdges = [];
 Settings.Parameters = { 'ATE', 'PSD', 'NSD',...
                         'PSD_G0', 'PSD_G00',...
                         'PSD_G1', 'PSD_G11'};
@@ -26,12 +27,25 @@ Settings.BSProgressFrequency = 20;
 Settings.OptParamsFile = 'opt-params.csv';
 Settings.TgtParamsFile = 'tgt-params.csv';
 
+% Starting values for knitro from PDBRWarmStart.py
+Settings.WarmStart = 1;
+Settings.WarmStartFile = 'warm-start.csv';
+Settings.PythonCommand = 'python';
+
+Settings.GetDefaultSettings = 0; % Just replace default settings then return
+
 if ~isstruct(SettingsIn)
     error('Expected structure for input. Quitting.');
 else
     Settings = UpdateStruct(Settings, SettingsIn, 0, 0);
 end
 
+if Settings.GetDefaultSettings
+    Results = [];
+    Settings.GetDefaultSettings = 0;
+    return;
+end
+
 %###############################################################################
 % LOAD DATA
 %###############################################################################
@@ -74,10 +88,23 @@ ampl.getParameter('J').setValues(Settings.NumGHPoints);
 ampl.getParameter('ghnodes').setValues((1:1:Settings.NumGHPoints)', nodes);
 ampl.getParameter('ghweights').setValues((1:1:Settings.NumGHPoints)', weights);
 
+%###############################################################################
+% WARM STARTS
+%
+% Approximate maximizers for the sample and every bootstrap draw, computed in
+% one batch outside of AMPL.
+%###############################################################################
+if Settings.WarmStart
+    WarmStart = ComputeWarmStarts(Data, Settings);
+else
+    WarmStart = [];
+end
+
 %###############################################################################
 % POINT ESTIMATES
 %###############################################################################
 SendDataToAMPL(ampl, Data);
+SetStartingValues(ampl, WarmStart, 1);
 MaximizeLikelihood(ampl, Settings.Noise);
 OptT = UpdateOptParamTable(ampl);
 TgtT = UpdateTgtParamTable(ampl, Settings.Parameters);
@@ -106,6 +133,7 @@ for b = 1:1:Settings.B
     end
     DataBS = ResampleData(Data, N, 1, Settings.InitialSeed + b);
     SendDataToAMPL(ampl, DataBS)
+    SetStartingValues(ampl, WarmStart, b + 1);
     MaximizeLikelihood(ampl, Settings.Noise);
     OptT = UpdateOptParamTable(ampl, OptT);
     TgtT = UpdateTgtParamTable(ampl, Settings.Parameters, TgtT);
@@ -189,6 +217,89 @@ function SendDataToAMPL(ampl, Data)
     disp(sprintf('Initializing data took %5.3f seconds', toc));
 end
 
+%###############################################################################
+%###############################################################################
+%###############################################################################
+% ComputeWarmStarts
+%
+% Observations with the same (y, x) have the same likelihood contribution, so
+% the sample and each bootstrap draw can be described by counts over the
+% distinct (y, x) rows. These are passed to PDBRWarmStart.py, which returns
+% its maximizers in the opt-params.csv format, one row for the sample and one
+% for each bootstrap draw.
+%
+% Returns [] (so knitro starts cold) if the Python script fails.
+%###############################################################################
+function WarmStart = ComputeWarmStarts(Data, Settings)
+    WarmStart = [];
+    tic;
+
+    [N, T, K] = size(Data.X);
+    Rows = [Data.Y reshape(Data.X, N, T*K)];
+    [Groups, ~, GroupIdx] = unique(Rows, 'rows');
+    G = size(Groups, 1);
+
+    % Same draws as in the bootstrap loop below
+    B = max(Settings.B, 0);
+    Counts = zeros(G, B + 1);
+    Counts(:,1) = accumarray(GroupIdx, 1, [G 1]);
+    for b = 1:1:B
+        [~, I] = ResampleData(Data, N, 1, Settings.InitialSeed + b,...
+                              isfield(Data, 'Cells'));
+        Counts(:,b+1) = accumarray(GroupIdx(I), 1, [G 1]);
+    end
+
+    FNGroups = [tempname '.csv'];
+    FNCounts = [tempname '.csv'];
+    CleanUpFiles = onCleanup(@()delete(FNGroups, FNCounts));
+
+    Header = arrayfun(@(t) sprintf('y%d', t), (0:1:T), 'UniformOutput', 0);
+    for k = 1:1:K
+        for t = 1:1:T
+            Header{end+1} = sprintf('x%d_%d', t, k);
+        end
+    end
+    fid = fopen(FNGroups, 'w');
+    fprintf(fid, '%s\n', strjoin(Header, ','));
+    fclose(fid);
+    dlmwrite(FNGroups, Groups, '-append', 'precision', 17);
+    dlmwrite(FNCounts, Counts, 'precision', 17);
+
+    Script = fullfile(fileparts(mfilename('fullpath')), 'PDBRWarmStart.py');
+    cmd = sprintf('%s "%s" "%s" "%s" "%s" --nodes %d',...
+        Settings.PythonCommand, Script, FNGroups, FNCounts,...
+        Settings.WarmStartFile, Settings.NumGHPoints);
+    [status, out] = system(cmd);
+    if (status ~= 0)
+        warning('Computing warm starts failed, so starting cold:\n%s', out);
+        return;
+    end
+    WarmStart = readtable(Settings.WarmStartFile);
+    assert(height(WarmStart) == B + 1);
+
+    disp(sprintf(['Computing warm starts for %d distinct (y, x) '...
+                  'and %d draws took %5.3f seconds'], G, B, toc));
+end
+
+%###############################################################################
+%###############################################################################
+%###############################################################################
+function SetStartingValues(ampl, WarmStart, r)
+    if isempty(WarmStart)
+        return;
+    end
+
+    ampl.eval(sprintf('let gamma := %.17g;', WarmStart.gamma(r)));
+    ampl.eval(sprintf('let lambda := %.17g;', WarmStart.lambda(r)));
+    ampl.eval(sprintf('let sigma := %.17g;', WarmStart.sigma(r)));
+    k = 1;
+    while ismember(sprintf('beta%d', k), WarmStart.Properties.VariableNames)
+        ampl.eval(sprintf('let beta[%d] := %.17g;',...
+            k, WarmStart.(sprintf('beta%d', k))(r)));
+        k = k + 1;
+    end
+end
+
 %###############################################################################
 %###############################################################################
 %###############################################################################
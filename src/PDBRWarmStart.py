@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+#coding=utf-8
+
+import sys
+import argparse
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import minimize
+from scipy.special import log_ndtr
+
+################################################################################
+# HARD-CODING
+################################################################################
+# Cap on the number of doubles in the (samples x groups x nodes x periods)
+# arrays used to evaluate the likelihood, which determines the batch size.
+MAXBATCHELEMENTS = 2*10**7
+MAXITER = 500
+
+################################################################################
+# Warm starts for PDBR
+#
+# Maximizes the same dynamic random effects probit likelihood as PDBR.mod:
+#
+#   Idx[d,i,j,t] = gamma*d + x[i,t,:]'beta + lambda*y[i,0]
+#                  + sqrt(2)*sigma*ghnodes[j]
+#   LHi = (1/sqrt(pi)) sum_j ghweights[j]
+#         prod_t Phi((2y[i,t] - 1)*Idx[y[i,t-1],i,j,t])
+#
+# Observations with the same (y, x) contribute the same LHi, so the data are
+# passed as G distinct (y, x) groups along with a G x M array of counts, one
+# column for the sample and one for each bootstrap draw.  The likelihood and
+# its gradient are evaluated for a batch of columns at once, and the columns
+# in a batch are maximized jointly since the objective is separable.
+#
+# The maximizers are written in the format of opt-params.csv (llh, gamma,
+# lambda, sigma, beta1, ..., betaK), one row per column of counts, and used by
+# PDBR.m as starting values for knitro.
+################################################################################
+def readGroups(fn):
+    groups = pd.read_csv(fn)
+    ycols = sorted([c for c in groups.columns if c.startswith('y')],
+                   key=lambda c: int(c[1:]))
+    xcols = [c for c in groups.columns if c.startswith('x')]
+    T = len(ycols) - 1
+    K = len(xcols)//T
+    y = groups[ycols].values.astype(float)
+    # Columns are x<t>_<k> with t = 1..T, k = 1..K
+    x = np.zeros((len(groups), T, K))
+    for c in xcols:
+        (t, k) = [int(s) for s in c[1:].split('_')]
+        x[:, t-1, k-1] = groups[c].values
+    return (y, x)
+
+def unpack(theta, K):
+    # theta is M x (3 + K): gamma, lambda, sigma, beta1..betaK
+    return (theta[:, 0], theta[:, 1], theta[:, 2], theta[:, 3:3+K])
+
+def loglik(theta, y, x, W, nodes, weights):
+    # Returns the M log-likelihoods and the M x (3 + K) gradient.
+    K = x.shape[2]
+    (gamma, lam, sigma, beta) = unpack(theta, K)
+    ylag = y[:, :-1]                                    # G x T
+    s = (2*y[:, 1:] - 1)[None, :, None, :]              # 1 x G x 1 x T
+
+    xb = np.einsum('gtk,mk->mgt', x, beta)              # M x G x T
+    base = (  gamma[:, None, None]*ylag[None, :, :]
+            + xb
+            + lam[:, None, None]*y[None, :, 0, None])   # M x G x T
+    shift = np.sqrt(2)*sigma[:, None]*nodes[None, :]    # M x J
+    z = base[:, :, None, :] + shift[:, None, :, None]   # M x G x J x T
+
+    logphi = log_ndtr(s*z)
+    logLgj = logphi.sum(axis=3)                         # M x G x J
+    a = logLgj + np.log(weights)[None, None, :]
+    amax = a.max(axis=2, keepdims=True)
+    ea = np.exp(a - amax)
+    sumea = ea.sum(axis=2, keepdims=True)
+    logLg = (amax + np.log(sumea))[:, :, 0] - 0.5*np.log(np.pi)  # M x G
+    llh = np.einsum('gm,mg->m', W, logLg)
+
+    # d log Phi(s z)/dz = s * phi(s z)/Phi(s z)
+    mills = s*np.exp(-0.5*(s*z)**2 - 0.5*np.log(2*np.pi) - logphi)
+    post = ea/sumea                                     # M x G x J
+    wpost = post*W.T[:, :, None]                        # M x G x J
+
+    dz = np.einsum('mgj,mgjt->mgt', wpost, mills)       # weight on dz/dbase
+    dgamma = np.einsum('mgt,gt->m', dz, ylag)
+    dlambda = np.einsum('mgt,g->m', dz, y[:, 0])
+    dbeta = np.einsum('mgt,gtk->mk', dz, x)
+    dsigma = np.sqrt(2)*np.einsum('mgjt,mgj,j->m', mills, wpost, nodes)
+
+    grad = np.column_stack([dgamma, dlambda, dsigma, dbeta])
+    return (llh, grad)
+
+def maximize(y, x, W, nodes, weights, start):
+    # Jointly maximize the likelihoods for the columns of W.
+    (M, P) = start.shape
+    total = np.maximum(W.sum(axis=0), 1)                # scale by sample size
+
+    def objective(vec):
+        theta = vec.reshape(M, P)
+        (llh, grad) = loglik(theta, y, x, W, nodes, weights)
+        return (-(llh/total).sum(), -(grad/total[:, None]).ravel())
+
+    bounds = [(None, None), (None, None), (0, None)] + [(None, None)]*(P - 3)
+    res = minimize(objective, start.ravel(), jac=True, method='L-BFGS-B',
+                   bounds=bounds*M,
+                   options={'maxiter': MAXITER, 'gtol': 1e-8, 'ftol': 1e-14})
+    theta = res.x.reshape(M, P)
+    (llh, _) = loglik(theta, y, x, W, nodes, weights)
+    return (theta, llh)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Warm starts for the PDBR random effects probit.')
+    parser.add_argument('groups', help='distinct (y, x) rows')
+    parser.add_argument('counts', help='G x M counts, no header')
+    parser.add_argument('outfile')
+    parser.add_argument('--nodes', type=int, default=16,
+                        help='number of Gauss-Hermite nodes')
+    args = parser.parse_args()
+
+    (y, x) = readGroups(args.groups)
+    W = np.loadtxt(args.counts, delimiter=',', ndmin=2)
+    if W.shape[0] != y.shape[0]:
+        print ('Counts have %d rows but there are %d groups.' \
+               % (W.shape[0], y.shape[0]))
+        sys.exit(1)
+    (G, T1) = y.shape
+    K = x.shape[2]
+    (nodes, weights) = np.polynomial.hermite.hermgauss(args.nodes)
+
+    # Sample estimate first from the AMPL defaults (see PDBR.mod), then every
+    # bootstrap draw starts from the sample estimate.
+    start = np.zeros((1, 3 + K))
+    start[0, 2] = 1
+    (thetahat, llhhat) = maximize(y, x, W[:, :1], nodes, weights, start)
+
+    theta = [thetahat]
+    llh = [llhhat]
+    batch = max(1, MAXBATCHELEMENTS//(G*args.nodes*(T1 - 1)))
+    for m in range(1, W.shape[1], batch):
+        Wm = W[:, m:m+batch]
+        startm = np.repeat(thetahat, Wm.shape[1], axis=0)
+        (thetam, llhm) = maximize(y, x, Wm, nodes, weights, startm)
+        theta.append(thetam)
+        llh.append(llhm)
+    theta = np.vstack(theta)
+    llh = np.concatenate(llh)
+
+    out = pd.DataFrame({'llh': llh, 'gamma': theta[:, 0],
+                        'lambda': theta[:, 1], 'sigma': theta[:, 2]})
+    for k in range(K):
+        out['beta%d' % (k + 1)] = theta[:, 3 + k]
+    out.to_csv(args.outfile, index=False, float_format='%.12g')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+%###############################################################################
+% PrepareAMPLSession
+%
+% Get an instance of AMPL with DPO.mod loaded and the sets defined for
+% Settings and Data.
+%
+% Session is either empty or was returned by a previous call to DPO.
+% The sets that take the longest to create only depend on T and YHAT, so if
+% Session holds an instance that was built for the same T and YHAT, then it is
+% reused: the options and the parameters left over from the last run are
+% reset, and only the sets for the assumptions are updated (see
+% CreateAMPLSets).
+% Constraints for the assumptions are dropped and restored by
+% ChangeOptimizationProblem before every solve, and the data are replaced by
+% UpdateAMPLData, so nothing else carries over from the last run.
+% Otherwise the old instance is closed and a new one is started.
+%
+% If Settings.AggregateLatentTypes is on, then which latent types are merged
+% depends on the sets for the assumptions as well, so the instance is only
+% reused if these are the same too (see AggregationKey). No set is updated
+% then.
+%###############################################################################
+function [ampl Session] = PrepareAMPLSession(Session, Settings, Data)
+    Key = ComputeHash('DPO.mod', Settings.T, unique(Data.Y, 'rows'));
+    if Settings.AggregateLatentTypes
+        Key = ComputeHash(Key, AggregationKey(Settings, Data));
+    end
+
+    if ~isempty(Session)
+        if strcmp(Session.Key, Key)
+            ampl = InitializeAMPL({'DPO.mod'}, Settings, Session.ampl);
+            ampl.eval(['reset data Fix, '...
+                       'MaxImpliedChangeVal, MaxImpliedChangeResult;']);
+            Session.Sets = CreateAMPLSets(ampl, Settings, Data, Session.Sets);
+            return;
+        end
+        Session.ampl.close();
+    end
+
+    ampl = InitializeAMPL({'DPO.mod'}, Settings);
+    Session.ampl = ampl;
+    Session.Key = Key;
+    Session.Sets = CreateAMPLSets(ampl, Settings, Data);
+end
@@ -26,7 +26,7 @@ function PrintStructure(s, fid)
             PrintStructure(s.(fields{i}), fid); % Recursion
         else
             if isnumeric(values{i})
-                values{i} = num2str(values{i});
+                values{i} = num2str(values{i}(:)'); % One line for matrices
             end
             stringout = [fields{i} ': '];
             if iscell(values{i})
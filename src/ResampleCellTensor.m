@@ -0,0 +1,17 @@
+%###############################################################################
+% ResampleCellTensor
+%
+% Apply a resample of observations I (as drawn in ResampleData) to a tensor of
+% counts built by BuildCellTensor.
+% Only the drawn observations' cells are tabulated, so this does not touch the
+% row-level data at all.
+%###############################################################################
+function TensorResample = ResampleCellTensor(Tensor, I)
+    TensorResample = Tensor;
+    TensorResample.Entry = Tensor.Entry(I(:));
+    TensorResample.N = length(I);
+
+    [NumY NumCells] = size(Tensor.Counts);
+    [YIdx CellIdx] = ind2sub([NumY NumCells], TensorResample.Entry);
+    TensorResample.Counts = sparse(YIdx, CellIdx, 1, NumY, NumCells);
+end
@@ -3,22 +3,42 @@
 %
 % Draw a random sample of size S with or without replacement from Data.
 % Data is a structure with each field corresponding to a variable.
+%
+% If Data has a tensor of counts (Data.Cells, see BuildCellTensor) then this
+% is resampled with the same draws.
+% Setting CellsOnly = 1 skips the row-level variables and returns only the
+% resampled tensor, which is all that UpdateAMPLData needs.
+% I are the indices of the drawn observations.
 %*******************************************************************************
-function DataResample = ResampleData(Data, S, replacement, Seed)
+function [DataResample I] = ResampleData(Data, S, replacement, Seed, CellsOnly)
     if ~(S >= 0)
         error('Resample size is not a positive integer.');
     end
     if ~(Seed >= 0)
         error('Seed is not a positive integer.');
     end
+    if ~exist('CellsOnly')
+        CellsOnly = 0;
+    end
+    HasCells = isfield(Data, 'Cells');
+    if CellsOnly & ~HasCells
+        error('CellsOnly requested but Data has no tensor of counts.');
+    end
 
     rng(Seed); % The right way
     %rand('seed', Seed); % The wrong way
 
-    FieldNames = fieldnames(Data);
+    FieldNames = setdiff(fieldnames(Data), {'Cells'}, 'stable');
     N = size(Data.(FieldNames{1}), 1);
     I = randsample(N, S, replacement);
 
+    if HasCells
+        DataResample.Cells = ResampleCellTensor(Data.Cells, I);
+        if CellsOnly
+            return;
+        end
+    end
+
     for f = 1:1:length(FieldNames)
         DIM = ndims(Data.(FieldNames{f}));
         if (DIM == 2)
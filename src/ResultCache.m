@@ -0,0 +1,71 @@
+%###############################################################################
+% ResultCache
+%
+% Look up or store a result that has been computed before.
+%
+%   [Value Hit] = ResultCache(Settings, Name, Key)
+%       returns the stored Value for (Name, Key) with Hit = 1, or [] with
+%       Hit = 0 if there is none.
+%   ResultCache(Settings, Name, Key, Value)
+%       stores Value for (Name, Key).
+%
+% Key should be a hash (see ComputeHash) of everything that Value depends on.
+% Results are kept in memory for the duration of the MATLAB session and, if
+% Settings.CacheDir is not empty, on disk in Settings.CacheDir/Name_Key.mat so
+% that other runs can reuse them.
+% At most MAXMEMORYENTRIES results are kept in memory. Once there are that
+% many, the memory is cleared before storing the next one (results on disk
+% are still found).
+%###############################################################################
+function [Value Hit] = ResultCache(Settings, Name, Key, Value)
+    MAXMEMORYENTRIES = 5000;
+    persistent MemoryCache;
+    if isempty(MemoryCache)
+        MemoryCache = containers.Map();
+    end
+
+    MemoryKey = [Name '_' Key];
+    if ~isempty(Settings.CacheDir)
+        FNCache = fullfile(Settings.CacheDir, [MemoryKey '.mat']);
+    else
+        FNCache = '';
+    end
+
+    if exist('Value', 'var') % Store
+        if (MemoryCache.Count >= MAXMEMORYENTRIES)
+            MemoryCache = containers.Map();
+        end
+        MemoryCache(MemoryKey) = Value;
+        if ~isempty(FNCache)
+            if ~exist(Settings.CacheDir, 'dir')
+                mkdir(Settings.CacheDir);
+            end
+            % Write then rename so that concurrent runs never read a partial
+            % file
+            FNTemp = [tempname(Settings.CacheDir) '.mat'];
+            save(FNTemp, 'Value');
+            movefile(FNTemp, FNCache, 'f');
+        end
+        Hit = 1;
+        return;
+    end
+
+    Hit = 1;
+    if isKey(MemoryCache, MemoryKey)
+        Value = MemoryCache(MemoryKey);
+    else
+        Value = [];
+        Hit = 0;
+        if ~isempty(FNCache) & (exist(FNCache, 'file') == 2)
+            Loaded = load(FNCache);
+            if isfield(Loaded, 'Value')
+                Value = Loaded.Value;
+                if (MemoryCache.Count >= MAXMEMORYENTRIES)
+                    MemoryCache = containers.Map();
+                end
+                MemoryCache(MemoryKey) = Value;
+                Hit = 1;
+            end
+        end
+    end
+end
@@ -0,0 +1,490 @@
+%###############################################################################
+% TestRequests
+%
+% Test several lists of points, each for its own parameter, with one pass over
+% the bootstrap draws for each test in Settings.Tests.
+% Each element of the structure array Requests has fields
+%   Param:  the parameter to test (or 'MS' for the misspecification test)
+%   Points: the points to test it at
+%   Levels: the levels for CV and Reject (can be empty)
+% and is returned with fields TS, PValue, CV, Reject and BSUsed added, which
+% are as described in TestListOfPoints.
+% LPIterations are summed over all of the requests.
+%
+% For each draw of the data, the bootstrap problem is solved at every point of
+% every request that still needs it while the draw is loaded. So the data
+% is only sent to AMPL B times for each test (rather than B times for each
+% request and test), and the problem only changes once for each test.
+% The draws for SS and CNS are different (SS subsamples and CNS resamples),
+% so these are still done in separate passes.
+%
+% Within a request, the results are the same as testing each request on its
+% own with TestListOfPoints, including with Settings.SequentialBootstrap
+% (each request stops at its own Levels).
+%###############################################################################
+function [Requests LPIterations] = TestRequests(ampl, Settings, Data, Requests)
+%###############################################################################
+    TestUniverse = {'CNS', 'SS'};
+    if ~all(ismember(Settings.Tests, TestUniverse))
+        error('Invalid list of tests.')
+    end
+
+    Settings.InitialSeed = round(Settings.InitialSeed);
+    if (Settings.InitialSeed <= 0)
+        error('InitialSeed is not a positive integer.')
+    end
+    Settings.B = round(Settings.B);
+    if (Settings.B <= 0)
+        error('Number of bootstrap replications is not a positive integer.')
+    end
+
+    if ~isnumeric(Settings.SSExp) | (Settings.SSExp <= 0) | (Settings.SSExp > 1)
+        error('SSExp must be a number between 0 and 1.')
+    end
+
+    % Sample test statistics, and the points that need to be bootstrapped
+    % (the items) in the order of the requests.
+    % If TS was basically 0, then no point in doing the test
+    % since you know you're not going to reject.
+    % Indicate this by setting BSStat = +Inf, so critical values
+    % will also be +Inf. Then skip testing these points.
+    Items = struct('Request', {}, 'Point', {}, 'TS', {}, 'KMax', {});
+    for r = 1:1:length(Requests)
+        if isempty(Requests(r).Points)
+            warning('Points is empty for %s.', Requests(r).Param);
+        end
+        Settings.ActiveParam = Requests(r).Param;
+        TS = ComputeTestStatistics(ampl, Requests(r).Points, Settings);
+        Requests(r).TS = TS(:)';
+
+        % Levels at which decisions are needed if stopping early
+        DecisionLevels = [];
+        if Settings.SequentialBootstrap
+            DecisionLevels = Requests(r).Levels;
+        end
+        Requests(r).DecisionLevels = DecisionLevels;
+        KMax = floor((DecisionLevels(:)' + Settings.RejectTol)*Settings.B);
+
+        for j = find(Requests(r).TS > Settings.SkipTestingTol)
+            Items(end + 1) = struct('Request', r,...
+                                    'Point', Requests(r).Points(j),...
+                                    'TS', Requests(r).TS(j),...
+                                    'KMax', KMax);
+        end
+    end
+
+    BSStat = zeros(Settings.B, length(Items), length(Settings.Tests));
+    BSUsed = zeros(length(Items), length(Settings.Tests));
+    LPIterations = zeros(1, 2);
+    if ~isempty(Items)
+        % Save sample quantities that are used in the resampling procedures.
+        % Note that the AMPL Q variable itself gets overwritten with bootstrap
+        % draws which is why the need for Q_Sample.
+        ampl.eval('let {y in YHAT} Q_Sample[y] := Q[y];');
+
+        for Type = {'SS', 'CNS'}
+            if ~ismember(Type{1}, Settings.Tests)
+                continue;
+            end
+            t = Index(Type{1}, Settings.Tests);
+            [BSStat(:,:,t) BSUsed(:,t) Iterations] = ...
+                SolveBootstrapProblems(ampl, Requests, Items, Type{1},...
+                    Settings, Data);
+            LPIterations = LPIterations + Iterations;
+        end
+
+        % Restore the original data to AMPL
+        UpdateAMPLData(ampl, Settings, Data);
+    end
+
+    % Route the results back to each request
+    ItemRequest = [Items.Request];
+    for r = 1:1:length(Requests)
+        Points = Requests(r).Points;
+        IdxContinue = find(Requests(r).TS > Settings.SkipTestingTol);
+        IdxPass = find(Requests(r).TS <= Settings.SkipTestingTol);
+
+        BSStatR = zeros(Settings.B, length(Points), length(Settings.Tests));
+        BSStatR(:,IdxPass,:) = +Inf;
+        BSStatR(:,IdxContinue,:) = BSStat(:,ItemRequest == r,:);
+        BSUsedR = zeros(length(Points), length(Settings.Tests));
+        BSUsedR(IdxContinue,:) = BSUsed(ItemRequest == r,:);
+
+        if ~isempty(Settings.SaveBootstrapDir)
+            Settings.ActiveParam = Requests(r).Param;
+            SaveBootstrapStatistics(Settings, Data, Points,...
+                Requests(r).TS, BSStatR, BSUsedR, Requests(r).DecisionLevels);
+        end
+
+        % Replications that were never solved because the decision was
+        % already known count as not exceeding the test statistic (see
+        % TestListOfPoints).
+        BSStatR(isnan(BSStatR)) = -Inf;
+
+        [Requests(r).PValue Requests(r).CV Requests(r).Reject] = ...
+            ComputeInference(Requests(r).TS, BSStatR, Requests(r).Levels,...
+                Settings);
+        Requests(r).BSUsed = BSUsedR;
+    end
+    Requests = rmfield(Requests, 'DecisionLevels');
+end
+
+%###############################################################################
+% ComputeInference
+%
+% p-values for each point and test, and if Levels is not empty then also
+% critical values and rejections at each level.
+%###############################################################################
+function [PValue CV Reject] = ComputeInference(TS, BSStat, Levels, Settings)
+    NumPoints = length(TS);
+    NumTests = length(Settings.Tests);
+
+    % Compute p-values, i.e. one minus the quantile of the largest CV for which
+    % one would still get a rejection
+    PValue = -1*ones(NumPoints, NumTests);
+    for t = 1:1:NumTests
+        for j = 1:1:NumPoints
+            PValue(j,t) = 1 - mean(TS(j) > ...
+                BSStat(:,j,t) + Settings.RejectTol);
+        end
+    end
+
+    % If Levels was passed, then return also matrices of critical values
+    % and rejection at the specified levels
+    CV = [];
+    Reject = [];
+    if ~isempty(Levels)
+        % Compute critical values (quantiles)
+        %   note that Matlab's built-in does interpolation
+        %   which is why I am writing my own code for this
+        CV = zeros(length(Levels), NumPoints, NumTests);
+        for t = 1:1:NumTests
+            for p = 1:1:NumPoints
+                CV(:,p,t) = ...
+                    ComputeQuantile(BSStat(:,p,t), 1 - Levels);
+            end
+        end
+
+        % Determine rejection
+        Reject = zeros(size(CV));
+        for t = 1:1:NumTests
+            for j = 1:1:NumPoints
+                for a = 1:1:length(Levels)
+                    Reject(a,j,t) = (TS(j) > ...
+                        CV(a,j,t) + Settings.RejectTol);
+                    RejectCheck = ...
+                        (PValue(j,t) <= Levels(a) + Settings.RejectTol);
+
+                    if RejectCheck ~= Reject(a,j,t)
+                        error('Something is wrong with CV or PValues.');
+                    end
+                end
+                assert(issorted(Reject(:,j,t)));
+            end
+        end
+    end
+end
+
+%###############################################################################
+% SolveBootstrapProblems
+%
+% Solve bootstrap problem for test "Type" at every item, where an item is a
+% point of one of the requests (see TestRequests).
+% Return:
+%   A vector of B bootstrap statistics for each item
+%   The number of these that were actually solved for each item
+%
+% If the request for an item has DecisionLevels, then stop solving for the
+% item once its rejection decision at every one of these levels is known.
+% TestRequests rejects at level a if the fraction of replications with
+% TS <= BSStat + RejectTol is at most a + RejectTol, i.e. if the number k of
+% such replications is at most K = floor((a + RejectTol)*B) (Items.KMax).
+% After n replications the decision is fixed if either
+%   k > K                   (can no longer reject), or
+%   k + (B - n) <= K        (rejects even if all the rest exceed TS).
+% This is exact curtailment, so the decisions are the same as with all B
+% replications. Unsolved replications are returned as NaN.
+%
+% Consecutive solves only differ in Q (a new draw), Fix (a new point) or
+% ActiveParam (a new request). AMPL passes the basis from the last solve to
+% the solver (option send_statuses is on by default), so the items are visited
+% in alternating order for each draw. The first solve for a draw is then at
+% the same item as the last solve for the previous draw, and only Q changes in
+% between. The iterations are returned as [Iterations Solves]; there is no
+% cold solve to compare them with, so they do not measure what the order saves.
+% The retries in OptimizeWithHigherTolerance are counted but not reordered.
+%
+% The statistics for an item are cached once all B replications are solved
+% (see ResultCache), and reused by any other test of the same parameter and
+% point with the same data and settings.
+%###############################################################################
+function [BSStat BSUsed LPIterations] = SolveBootstrapProblems(ampl,...
+    Requests, Items, Type, Settings, Data)
+    AcceptedTypes = {'SS', 'CNS'};
+    assert(ismember(Type, AcceptedTypes));
+
+    Settings.ActiveParam = Requests(Items(1).Request).Param;
+    if strcmp(Type, 'SS')
+        ChangeOptimizationProblem(ampl, Settings, 'Criterion');
+        ResampleSize = round(Settings.N^Settings.SSExp);
+        WithReplacement = 0;
+        CriterionName = 'minCriterion';
+        IDStrStub = 'SolveBootstrapProblems (SS)';
+        FlagCNS = 0;
+    else % CNS
+        ChangeOptimizationProblem(ampl, Settings, 'CNS');
+        ResampleSize = Settings.N;
+        WithReplacement = 1;
+        CriterionName = 'minCriterion_CNS';
+        IDStrStub = 'SolveBootstrapProblems (CNS)';
+        FlagCNS = 1;
+    end
+
+    B = Settings.B;
+    BSStat = nan(B, length(Items));
+    BSUsed = zeros(length(Items), 1);
+    Active = true(1, length(Items));
+    NumExceed = zeros(1, length(Items));
+    LPIterations = zeros(1, 2);
+
+    Keys = cell(1, length(Items));
+    for r = unique([Items.Request])
+        Settings.ActiveParam = Requests(r).Param;
+        BaseKey = BootstrapKey(Type, Settings, Data);
+        for t = find([Items.Request] == r)
+            Keys{t} = ComputeHash(BaseKey, Items(t).Point);
+            [Cached CacheHit] = ResultCache(Settings, 'BSStat', Keys{t});
+            if CacheHit
+                BSStat(:,t) = Cached;
+                BSUsed(t) = B;
+                Active(t) = false;
+            end
+        end
+    end
+    FromCache = ~Active;
+
+    aActiveParam = ampl.getParameter('ActiveParam');
+    aFix = ampl.getParameter('Fix');
+    CriterionHat = ampl.getParameter('CriterionHat');
+    CurrentRequest = 0;
+
+    for b = 1:1:B
+        if ~any(Active)
+            break;
+        end
+
+        % Draw a bootstrap sample with replacement and apply to AMPL
+        % Only the tensor of counts is needed if it is there
+        DataBS = ResampleData(Data, ResampleSize,...
+            WithReplacement, b + Settings.InitialSeed,...
+            isfield(Data, 'Cells'));
+        UpdateAMPLData(ampl, Settings, DataBS);
+
+        Order = find(Active);
+        if (mod(b, 2) == 0)
+            Order = fliplr(Order);
+        end
+
+        for t = Order
+            if (Items(t).Request ~= CurrentRequest)
+                CurrentRequest = Items(t).Request;
+                aActiveParam.setValues(Requests(CurrentRequest).Param);
+            end
+            aFix.setValues(Items(t).Point);
+
+            if FlagCNS
+                CriterionHat.setValues(Items(t).TS);
+            end
+
+            if Settings.NoisyOptimization
+                eval('ampl.solve');
+            else
+                evalc('ampl.solve');
+            end
+            SolveResult = ampl.getValue('solve_result');
+            Iterations = GetSolveIterations(ampl);
+
+            % Identifier for printing output
+            IDStr = [IDStrStub ' '];
+            if isfield(Settings, 'MCPoints')
+                IDStr = [IDStr 'm = ' int2str(Settings.CurrentSim) ', '];
+            end
+            IDStr = [IDStr 'b = ' int2str(b), ' '...
+                     Requests(CurrentRequest).Param ...
+                     ' t = ' num2str(Items(t).Point)];
+
+            % If return code is not solved (or ``solved?'')
+            % then keep increasing the tolerance
+            % until we get one or we exceed some maximum tolerance.
+            if (isempty(strfind(SolveResult, 'solved')))
+                [BSStat(b,t) SolveResult RetryIterations] = ...
+                    OptimizeWithHigherTolerance(...
+                        ampl, CriterionName, IDStr, Settings);
+                Iterations = Iterations + RetryIterations;
+                % Restore original tolerance
+                SetTolerance(ampl, Settings.FeasTolDefault);
+            else
+                BSStat(b,t) = SafelyGetObjective(ampl, CriterionName);
+            end
+
+            ErrorCheckOptimization(ampl, IDStr, 1);
+
+            LPIterations = LPIterations + [Iterations 1];
+            BSUsed(t) = b;
+            NumExceed(t) = NumExceed(t) ...
+                + ~(Items(t).TS > BSStat(b,t) + Settings.RejectTol);
+        end
+
+        for t = find(Active)
+            if isempty(Items(t).KMax)
+                continue;
+            end
+            Decided = all(   (NumExceed(t) > Items(t).KMax) ...
+                          | (NumExceed(t) + (B - b) <= Items(t).KMax));
+            Active(t) = ~Decided;
+        end
+    end
+
+    for t = find(~FromCache & (BSUsed(:)' == B))
+        ResultCache(Settings, 'BSStat', Keys{t}, BSStat(:,t));
+    end
+end
+
+%###############################################################################
+% BootstrapKey
+%
+% Hash of everything that the bootstrap statistics for test Type depend on,
+% other than the point being tested.
+%###############################################################################
+function Key = BootstrapKey(Type, Settings, Data)
+    % Settings that do not affect the bootstrap statistics
+    PROCEDUREFIELDS = {'Parameters', 'ParametersToTest', 'PointsToTest',...
+        'BuildConfidenceRegions', 'RunMisspecificationTest',...
+        'TestAListOfPoints', 'LevelsCR', 'LevelsTestList', 'Tests',...
+        'SequentialBootstrap', 'CalculateMaxImpliedChange',...
+        'ComputeCFHNBounds', 'BracketTol', 'SkipTestingTol', 'RejectTol',...
+        'PriorCR', 'PriorCRWidth', 'ActiveParam',...
+        'ActiveLevel', 'ActiveTest', 'SavedTS'};
+    Key = ComputeHash(Type, char(Settings.ActiveParam),...
+        HashSettings(Settings, PROCEDUREFIELDS), Data.Y);
+end
+
+%###############################################################################
+% SaveBootstrapStatistics
+%
+% Write the B bootstrap statistics for each point and test to a file
+% <Key>.bin in Settings.SaveBootstrapDir as little-endian doubles, where Key
+% is a hash of the point, the test and everything the statistics depend on.
+% Unsolved replications (from the sequential bootstrap) are NaN and points
+% that were not tested since TS <= SkipTestingTol are all +Inf.
+% Each file gets a line in BootstrapIndex.tsv with what is needed to redo the
+% inference (see ./post/RederiveInference.py). A point that is tested again
+% with the same settings writes the same file and another line.
+%###############################################################################
+function SaveBootstrapStatistics(Settings, Data, Points, TS, BSStat, BSUsed,...
+    DecisionLevels)
+    Dir = Settings.SaveBootstrapDir;
+    if ~exist(Dir, 'dir')
+        mkdir(Dir);
+    end
+    IndexFile = fullfile(Dir, 'BootstrapIndex.tsv');
+    FlagHeader = ~exist(IndexFile, 'file');
+    fidIndex = fopen(IndexFile, 'a');
+    if FlagHeader
+        fprintf(fidIndex, '%s\n', strjoin({'File', 'Test', 'Parameter',...
+            'Point', 'TS', 'B', 'BSUsed', 'DecisionLevels', 'RejectTol',...
+            'SkipTestingTol', 'InitialSeed', 'N', 'SSExp', 'Time'}, '\t'));
+    end
+    IndexFmt = [strjoin({'%s', '%s', '%s', '%.17g', '%.17g', '%d', '%d',...
+        '%s', '%.17g', '%.17g', '%d', '%d', '%.17g', '%s'}, '\t') '\n'];
+
+    for t = 1:1:length(Settings.Tests)
+        Key = BootstrapKey(Settings.Tests{t}, Settings, Data);
+        for j = 1:1:length(Points)
+            FN = [ComputeHash(Key, Points(j)) '.bin'];
+
+            % Write then rename so that a file is never partly written
+            TempFN = [tempname(Dir) '.bin'];
+            fid = fopen(TempFN, 'w', 'ieee-le');
+            fwrite(fid, BSStat(:,j,t), 'double');
+            fclose(fid);
+            movefile(TempFN, fullfile(Dir, FN));
+
+            fprintf(fidIndex, IndexFmt,...
+                FN, Settings.Tests{t}, char(Settings.ActiveParam),...
+                Points(j), TS(j), Settings.B, BSUsed(j,t),...
+                num2str(DecisionLevels(:)'), Settings.RejectTol,...
+                Settings.SkipTestingTol, Settings.InitialSeed, Settings.N,...
+                Settings.SSExp, datestr(now, 'yyyy-mm-dd HH:MM:SS'));
+        end
+    end
+    fclose(fidIndex);
+end
+
+%*******************************************************************************
+% OptimizeWithHigherTolerance
+%
+% This is a routine called when the previous optimization failed.
+% It adjusts the solve tolerance from its default level up to
+% a maximum of Settings.FeasTolMax in multiplicative steps of
+% factor Settings.FeasTolStepFactor.
+%
+% If Settings.FeasTolMax has been hit and there's still no good solve
+% then throw an error and stop the program.
+%*******************************************************************************
+function [Solution SolveResult Iterations] =...
+    OptimizeWithHigherTolerance(ampl, Criterion, IDStr, Settings)
+
+    ToleranceCurrent = Settings.FeasTolDefault;
+    Iterations = 0;
+    SolveResult = 'infeasible';
+    while (isempty(strfind(SolveResult, 'solved')))
+
+        if (ToleranceCurrent > Settings.FeasTolMax)
+            InfoStr = [IDStr '\n'...
+                'Quitting in OptimizeWithHigherTolerance:\n' ...
+                '\t solve_result = %s\n' ...
+                '\t solve_result_num = %d.'
+            ];
+            disp(sprintf(InfoStr, SolveResult, SolveResultNum));
+            display(...
+                [Criterion ': '...
+                 'Problem still not solved and tolerance has' ...
+                 ' gone above the maximum allowed.']);
+            display('Continuing for now...')
+            break;
+        end
+
+        ToleranceCurrent = ...
+            ToleranceCurrent*Settings.FeasTolStepFactor;
+        SetTolerance(ampl, ToleranceCurrent);
+        if Settings.NoisyOptimization
+            eval('ampl.solve');
+        else
+            evalc('ampl.solve');
+        end
+        SolveResult = ampl.getValue('solve_result');
+        SolveResultNum = ampl.getValue('solve_result_num');
+        Iterations = Iterations + GetSolveIterations(ampl);
+    end
+    Solution = ampl.getValue(Criterion);
+    % Restore original tolerance
+    SetTolerance(ampl, Settings.FeasTolDefault);
+end
+
+%*******************************************************************************
+% GetSolveIterations
+%
+% Number of simplex and barrier iterations in the last solve, as reported by
+% the solver in solve_message, e.g.
+%   CPLEX 12.8.0.0: optimal solution; objective 0.0123
+%   45 dual simplex iterations (0 in phase I)
+% Returns 0 if the solver did not report any.
+%*******************************************************************************
+function Iterations = GetSolveIterations(ampl)
+    Message = char(ampl.getValue('solve_message'));
+    Tokens = regexp(Message,...
+        '(\d+)\s+(?:dual\s+|primal\s+)?(?:simplex|barrier)\s+iterations',...
+        'tokens');
+    Iterations = sum(cellfun(@(c) str2double(c{1}), Tokens));
+end
@@ -4,20 +4,30 @@
 % Determine probabilities of Y sequences and send to AMPL
 %###############################################################################
 function [] = UpdateAMPLData(ampl, Settings, Data)
-    N = size(Data.Y, 1);
-    ampl.getParameter('N').setValues(N);
-
     aYHAT = ampl.getSet('YHAT');
     YHat = cell2mat(cell(aYHAT.get().toArray()));
 
-    YInt = WideToBinary(Data.Y);
-    PMF = tabulate(YInt);
-    PMF = PMF(:,1:2);
+    if isfield(Data, 'Cells')
+        % Marginalize the tensor of counts over covariate cells.
+        % This scales with the number of histories, not with N.
+        N = Data.Cells.N;
+        ampl.getParameter('N').setValues(N);
+
+        PMFAll = CellTensorPMF(Data.Cells, 'Y');
+        PMF = [YHat(:,1) PMFAll(YHat(:,1))];
+    else
+        N = size(Data.Y, 1);
+        ampl.getParameter('N').setValues(N);
+
+        YInt = WideToBinary(Data.Y);
+        PMF = tabulate(YInt);
+        PMF = PMF(:,1:2);
 
-    [C IP ID] = intersect(YHat(:,1), PMF(:,1), 'stable');
-    PMF = PMF(ID,1:2);
-    assert(length(PMF(:,1)) == length(YHat));
-    PMF(:,2) = PMF(:,2)/N;
+        [C IP ID] = intersect(YHat(:,1), PMF(:,1), 'stable');
+        PMF = PMF(ID,1:2);
+        assert(length(PMF(:,1)) == length(YHat));
+        PMF(:,2) = PMF(:,2)/N;
+    end
 
     vQ = ampl.getParameter('Q');
     Idx = [PMF(:,1)];
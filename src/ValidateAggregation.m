@@ -0,0 +1,98 @@
+%###############################################################################
+% ValidateAggregation
+%
+% Check that aggregating latent types (Settings.AggregateLatentTypes) does not
+% change the bounds for the assumptions and parameters in Settings.
+%
+% Runs DPO for the bounds only, once without and once with aggregation (with
+% AggregateLatentTypes = 2, which skips the check below), and compares them.
+% Nothing is reused from the cache on disk (the keys in memory differ by
+% AggregateLatentTypes), so both are solved.
+% If no bound differs by more than Tol (default is Settings.FeasTolDefault, or
+% 1e-6 if that is not set), then this is recorded in the cache for the
+% AggregationKey, and DPO allows AggregateLatentTypes = 1 from then on for any
+% specification with the same key (on disk if Settings.CacheDir is set,
+% otherwise for this MATLAB session). Otherwise a warning is given.
+% The aggregated problems are smaller, so this also shows how much time the
+% aggregation saves.
+%
+% Input:
+%   Settings
+%       settings for DPO; the procedures other than the bounds are turned off
+%   Data
+%       optional data to use instead of loading Settings.DataPath
+%
+% Output:
+%   MaxDiff
+%       largest absolute difference between the bounds
+%   Bounds
+%       the bounds without (Bounds(:,:,1)) and with (Bounds(:,:,2))
+%       aggregation
+%   Aggregation
+%       the latent types that were merged (see ExpandAggregatedSolution)
+%###############################################################################
+function [MaxDiff Bounds Aggregation] = ...
+    ValidateAggregation(Settings, Data, Tol)
+    if ~exist('Data', 'var')
+        Data = [];
+    end
+    if ~exist('Tol', 'var')
+        if isfield(Settings, 'FeasTolDefault')
+            Tol = Settings.FeasTolDefault;
+        else
+            Tol = 1e-6;
+        end
+    end
+
+    Settings.BuildConfidenceRegions = 0;
+    Settings.RunMisspecificationTest = 0;
+    Settings.TestAListOfPoints = 0;
+    Settings.CalculateMaxImpliedChange = 0;
+    if isfield(Settings, 'CacheDir')
+        CacheDir = Settings.CacheDir;
+    else
+        CacheDir = '';
+    end
+    Settings.CacheDir = '';
+    Settings.SaveBootstrapDir = '';
+
+    Time = zeros(1, 2);
+    for a = 0:1:1
+        Settings.AggregateLatentTypes = 2*a;
+        Tic = tic;
+        [Results SettingsDPO DataDPO Session] = DPO(Settings, Data);
+        Time(a+1) = toc(Tic);
+        Bounds(:,:,a+1) = Results.Bounds;
+        Aggregation = Session.Sets.Aggregation;
+        Session.ampl.close();
+    end
+
+    % Equal infinite bounds (an empty identified set) are not a difference
+    Diff = abs(Bounds(:,:,1) - Bounds(:,:,2));
+    Diff(Bounds(:,:,1) == Bounds(:,:,2)) = 0;
+    MaxDiff = max(Diff(:));
+
+    if (SettingsDPO.Noise >= 1)
+        DisplayTable = table(transpose(cellstr(SettingsDPO.Parameters)),...
+                             Bounds(:,1,1), Bounds(:,1,2),...
+                             Bounds(:,2,1), Bounds(:,2,2));
+        DisplayTable.Properties.VariableNames = ...
+            {'Parameter', 'LB', 'LBAggregated', 'UB', 'UBAggregated'};
+        disp(repmat('=', 1, SettingsDPO.DisplaySepLen));
+        disp(sprintf(['Aggregation merged %d latent types into %d. '...
+                      'Time was %5.3f seconds (vs. %5.3f without).'],...
+                     length(Aggregation.UHat), length(Aggregation.Rep),...
+                     Time(2), Time(1)));
+        disp(DisplayTable);
+        disp(repmat('=', 1, SettingsDPO.DisplaySepLen));
+    end
+
+    if (MaxDiff <= Tol)
+        SettingsDPO.CacheDir = CacheDir;
+        ResultCache(SettingsDPO, 'AggregationValidated',...
+            AggregationKey(SettingsDPO, DataDPO), MaxDiff);
+    else
+        warning(['Bounds with aggregated latent types differ from the '...
+                 'full ones by up to %g.'], MaxDiff);
+    end
+end
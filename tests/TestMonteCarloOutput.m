@@ -0,0 +1,46 @@
+%*******************************************************************************
+% TestMonteCarloOutput
+%
+% Checks the layout of the point-by-point output of MonteCarlo for a study
+% with two tests (like SimNumber 2 in RunMonteCarlo), with every point tested
+% and with a point dropped in sequential mode. No AMPL is needed.
+% Run from this directory with
+%   addpath('../src'); TestMonteCarloOutput
+%*******************************************************************************
+function TestMonteCarloOutput()
+    PFmt = '%8.5f';
+    NumPoints = 3;
+    PFmtPtsVec = [repmat([' ' PFmt], 1, NumPoints) '\n'];
+
+    % PValue is NumPoints x NumTests, and is written one line per test
+    PValue = [.1 .2; .3 .4; .5 .6];
+    Active = true(1, NumPoints);
+    Lines = PrintLines(PFmtPtsVec, ExpandToAllPoints(PValue, Active));
+    assert(isequal(Lines, PrintLines(PFmtPtsVec, PValue(:))),...
+        'With every point tested the output should be as before.');
+    assert(length(Lines) == 2, 'Expected one line per test.');
+    assert(isequal(str2num(Lines{2}), [.2 .4 .6]));
+
+    % The second point has been dropped
+    Active = [true false true];
+    Lines = PrintLines(PFmtPtsVec, ExpandToAllPoints(PValue([1 3],:), Active));
+    assert(length(Lines) == 2, 'Expected one line per test.');
+    assert(isequaln(str2num(Lines{1}), [.1 NaN .5]));
+    assert(isequaln(str2num(Lines{2}), [.2 NaN .6]));
+
+    % CV(a,:,j) is a row and TS is a column, one value per point
+    Lines = PrintLines(PFmtPtsVec, ExpandToAllPoints([.7 .8], Active));
+    assert(isequaln(str2num(Lines{1}), [.7 NaN .8]));
+    Lines = PrintLines(PFmtPtsVec, ExpandToAllPoints([.7; .8], Active));
+    assert(isequaln(str2num(Lines{1}), [.7 NaN .8]));
+
+    % A single point tested with two tests
+    Lines = PrintLines(' %8.5f\n', ExpandToAllPoints([.1 .2], true));
+    assert(length(Lines) == 2, 'Expected one line per test.');
+
+    disp('TestMonteCarloOutput passed.');
+end
+
+function Lines = PrintLines(Fmt, v)
+    Lines = strsplit(strtrim(sprintf(Fmt, v)), '\n');
+end
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+#coding=utf-8
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'post'))
+from MergeMCShards import mergeDirectory, ShardError
+
+################################################################################
+# A study with M = 4, two points and two tests (like SimNumber 2 in
+# RunMonteCarlo.m), run as two shards
+################################################################################
+def writeFile(fn, lines):
+    with open(fn, 'w') as f:
+        f.write(''.join(l + '\n' for l in lines))
+
+def pvalue(m, t):
+    return ' %8.5f %8.5f' % (m/10.0 + t/100.0, m/10.0 + t/100.0 + .001)
+
+def writeShard(dirname, k, reps, partial=None):
+    d = os.path.join(dirname, 'shard%d' % k)
+    os.makedirs(d)
+    writeFile(os.path.join(d, 'Shard.out'),
+              ['%d %d 4' % (min(reps), max(reps))])
+    writeFile(os.path.join(d, 'Replications.out'), ['%d' % m for m in reps])
+    written = reps + ([partial] if partial else [])
+    writeFile(os.path.join(d, 'PValue.out'),
+              [pvalue(m, t) for m in written for t in (1, 2)])
+    for test in ('CNS', 'SS'):
+        writeFile(os.path.join(d, 'Reject_A5_%s.out' % test),
+                  [' %d %d' % (m % 2, 1) for m in written])
+    writeFile(os.path.join(d, 'EstimatedLB.out'),
+              ['  PSD_G0'] + [' %8.5f' % m for m in written])
+    writeFile(os.path.join(d, 'TestPoints.out'), ['0.1 0.2'])
+    return d
+
+def readMerged(dirname, fn):
+    with open(os.path.join(dirname, fn), 'r') as f:
+        return f.read().splitlines()
+
+def test_pvalues_have_one_row_per_test(tmp_path):
+    dirname = str(tmp_path)
+    shards = [writeShard(dirname, 2, [3, 4]),
+              writeShard(dirname, 1, [1, 2], partial=3)]
+    mergeDirectory(dirname, sorted(shards), False)
+
+    assert readMerged(dirname, 'PValue.out') \
+        == [pvalue(m, t) for m in (1, 2, 3, 4) for t in (1, 2)]
+    assert readMerged(dirname, 'EstimatedLB.out') \
+        == ['  PSD_G0'] + [' %8.5f' % m for m in (1, 2, 3, 4)]
+    assert readMerged(dirname, 'RejProb_A5_SS.out')[-1] \
+        == '  0.50000  1.00000'
+
+def test_pvalues_with_missing_rows(tmp_path):
+    dirname = str(tmp_path)
+    shards = [writeShard(dirname, 1, [1, 2]), writeShard(dirname, 2, [3, 4])]
+    fn = os.path.join(shards[0], 'PValue.out')
+    writeFile(fn, readMerged(shards[0], 'PValue.out')[:3])
+    with pytest.raises(ShardError):
+        mergeDirectory(dirname, shards, True)
+
+def test_not_a_shard(tmp_path):
+    dirname = str(tmp_path)
+    shards = [writeShard(dirname, 1, [1, 2]), writeShard(dirname, 2, [3, 4])]
+    os.remove(os.path.join(shards[1], 'Shard.out'))
+    with pytest.raises(ShardError):
+        mergeDirectory(dirname, shards, True)
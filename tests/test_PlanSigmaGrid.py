@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+#coding=utf-8
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'post'))
+from PlanSigmaGrid import scoreIntervals
+
+NAN = float('nan')
+
+def columns(boundslb, cilb):
+    sigmas = [0, .1, .2]
+    return {'bounds ATE LB': dict(zip(sigmas, boundslb)),
+            'bounds ATE UB': dict(zip(sigmas, [.5, .5, .5])),
+            'CI ATE LB': dict(zip(sigmas, cilb)),
+            'CI ATE UB': dict(zip(sigmas, [NAN, NAN, NAN]))}
+
+def test_pinned_bounds_without_cis_are_skipped():
+    # BuildResultsTable.py writes NaN confidence intervals if none were run
+    intervals = scoreIntervals(columns([.1, .1, .05], [NAN, NAN, NAN]), None)
+    assert [(i[0], i[1]) for i in intervals] == [(.1, .2)]
+
+def test_pinned_bounds_with_same_cis_are_skipped():
+    intervals = scoreIntervals(columns([.1, .1, .05], [0, 0, -.1]), None)
+    assert [(i[0], i[1]) for i in intervals] == [(.1, .2)]
+
+def test_pinned_bounds_with_moving_cis_are_last():
+    intervals = scoreIntervals(columns([.1, .1, .09], [0, -.2, -.21]), None)
+    assert [(i[0], i[1], i[4]) for i in intervals] \
+        == [(.1, .2, False), (0, .1, True)]
+
+def test_crossing_is_first():
+    intervals = scoreIntervals(columns([.1, .1, .05], [.05, -.05, -.1]), 0)
+    assert [(i[0], i[1], i[3]) for i in intervals] \
+        == [(0, .1, ['CI ATE LB']), (.1, .2, [])]